@@ -0,0 +1,314 @@
+"""
+showdown_bot の複数バトル版。
+
+1つの接続を保ったまま、最大 concurrent 個のバトルを並行して合計 battles 回
+連続で戦う。受信したフレームは ">ルーム名" の接頭辞でルームごとの状態に振り分け、
+正規表現での走査はしない。ログは各バトルの結果のみ (verbose で全メッセージ)。
+"""
+import asyncio
+import json
+import random
+
+import websockets
+
+DEFAULT_URI = "ws://127.0.0.1:8000/showdown/websocket"
+
+TARGETED_MOVES = {"normal", "adjacentFoe", "adjacentAllyOrSelf", "adjacentAlly", "adjacentFoeOrAlly"}
+
+
+def to_id(name):
+    return "".join(c for c in name.lower() if c.isalnum())
+
+
+def select_random_move(valid_moves, select_type="random"):
+    """
+    select_type: "random" or "max_damage"
+    """
+    if select_type == "random":
+        return random.choice(valid_moves)
+    elif select_type == "max_damage":
+        return max(valid_moves, key=lambda x: x.get("basePower", 0))
+    else:
+        raise ValueError(f"Invalid select_type: {select_type}")
+
+
+def move_choice(move):
+    if move.get("target", "") in TARGETED_MOVES:
+        return f"/choose move {move['id']} 1"
+    return f"/choose move {move['id']}"
+
+
+def available_switches(request):
+    # "active": false かつ "condition" が fnt でなければ出せる (1-indexed)
+    return [
+        i + 1
+        for i, poke in enumerate(request["side"]["pokemon"])
+        if not poke.get("active", False) and not poke["condition"].endswith("fnt")
+    ]
+
+
+def choose_action(request, select_type="max_damage"):
+    """
+    request に対するコマンドを返す。選べる行動がなければ None。
+    """
+    if "active" in request:
+        moves = request["active"][0]["moves"]
+        valid_moves = [move for move in moves if not move.get("disabled", False)]
+        if select_type == "max_damage":
+            if valid_moves:
+                return move_choice(select_random_move(valid_moves, select_type="max_damage"))
+            return None
+        # random
+        trapped = request["active"][0].get("trapped", False)
+        choices = [move_choice(move) for move in valid_moves]
+        if not trapped and "side" in request:
+            choices += [f"/choose switch {i}" for i in available_switches(request)]
+        return random.choice(choices) if choices else None
+    elif "forceSwitch" in request:
+        # 交代要求: 交代可能な最初のポケモンを選ぶ
+        switches = available_switches(request)
+        return f"/choose switch {switches[0]}" if switches else None
+    return None
+
+
+class _Room:
+    """
+    バトルルームごとの状態
+    """
+
+    __slots__ = ("battle_tag", "turn_count", "last_rqid", "default_rqid")
+
+    def __init__(self, battle_tag):
+        self.battle_tag = battle_tag
+        self.turn_count = 0
+        self.last_rqid = None
+        self.default_rqid = None
+
+
+class ShowdownBotRunner:
+    """
+    1つの接続で opponent と battles 回戦う。battles が None なら接続が切れるまで戦い続ける。
+
+    Example:
+        >>> runner = ShowdownBotRunner("inf581_bot_1", "INF581_BOT_1", "inf581_bot_2", True,
+        ...                            "gen9randombattle", battles=100, concurrent=10)
+        >>> results = await runner.run()
+    """
+
+    def __init__(
+        self,
+        username,
+        password,
+        opponent,
+        is_challenger,
+        battle_format,
+        select_type="max_damage",
+        *,
+        battles=1,
+        concurrent=1,
+        uri=DEFAULT_URI,
+        verbose=False,
+    ):
+        self.username = username
+        self.password = password
+        self.opponent = opponent
+        self.is_challenger = is_challenger
+        self.battle_format = battle_format
+        self.select_type = select_type
+        self.battles = float("inf") if battles is None else battles
+        self.concurrent = concurrent
+        self.uri = uri
+        self.verbose = verbose
+
+        self.userid = to_id(username)
+        self.opponent_id = to_id(opponent)
+        self.logged_in = False
+        self.websocket = None
+
+        # 進行中のバトルと、終わって退出したルーム
+        self.rooms = {}
+        self.finished_rooms = set()
+        self.started = 0
+        self.finished = 0
+        self.results = {"win": 0, "lose": 0, "tie": 0}
+
+        # チャレンジは同時に1つだけ: 送信済み / 受信済み / 承諾済みでバトル開始待ち
+        self.challenge_pending = False
+        self.challenge_received = False
+        self.accepting = False
+
+    async def send(self, message):
+        if self.verbose:
+            print(f"[{self.username}] 送信: {message}")
+        await self.websocket.send(message)
+
+    async def run(self):
+        """
+        全バトルが終わるまで戦い、勝敗の集計を返す。
+        """
+        async with websockets.connect(self.uri) as websocket:
+            self.websocket = websocket
+            await self.send(f"|/trn {self.username},{self.password}")
+            async for frame in websocket:
+                if self.verbose:
+                    print(f"[{self.username}] 受信: {frame}")
+                if frame.startswith(">"):
+                    room, _, body = frame[1:].partition("\n")
+                    if room.startswith("battle-"):
+                        await self._battle_frame(room, body)
+                else:
+                    for line in frame.split("\n"):
+                        if line.startswith("|"):
+                            await self._global_line(line)
+                if self.finished >= self.battles:
+                    break
+        print(f"[{self.username}] {self.finished}戦終了: {self.results}")
+        return self.results
+
+    async def _global_line(self, line):
+        _, kind, *rest = line.split("|", 2)
+        rest = rest[0] if rest else ""
+
+        if kind == "updateuser":
+            # ログイン完了判定
+            if not self.logged_in and to_id(rest.split("|", 1)[0]) == self.userid:
+                self.logged_in = True
+                print(f"[{self.username}] ログイン完了")
+                await self._fill()
+
+        elif kind == "pm":
+            # |pm| 送信者| 受信者|/challenge フォーマット
+            parts = rest.split("|", 2)
+            if len(parts) == 3 and parts[2].startswith("/challenge"):
+                if to_id(parts[0]) == self.opponent_id and to_id(parts[1]) == self.userid:
+                    # フォーマットのない /challenge はチャレンジの取り消し
+                    self.challenge_received = bool(
+                        parts[2][len("/challenge"):].split("|", 1)[0].strip()
+                    )
+                    await self._fill()
+
+        elif kind == "updatechallenges":
+            try:
+                challenges = json.loads(rest).get("challengesFrom") or {}
+            except json.JSONDecodeError:
+                return
+            self.challenge_received = self.opponent_id in challenges
+            await self._fill()
+
+        elif kind == "popup":
+            # チャレンジや承諾が断られた
+            print(f"[{self.username}] popup: {rest}")
+            self.challenge_pending = False
+            self.accepting = False
+            asyncio.get_event_loop().call_later(1, lambda: asyncio.ensure_future(self._fill()))
+
+    def _battle_started(self, battle_tag):
+        self.rooms[battle_tag] = _Room(battle_tag)
+        self.started += 1
+        self.challenge_pending = False
+        self.accepting = False
+
+    async def _fill(self):
+        """
+        空いている枠の分だけチャレンジを送る / 承諾する
+        """
+        if not self.logged_in:
+            return
+        if self.is_challenger:
+            if (
+                not self.challenge_pending
+                and len(self.rooms) < self.concurrent
+                and self.started < self.battles
+            ):
+                self.challenge_pending = True
+                await self.send(f"|/challenge {self.opponent}, {self.battle_format}")
+        else:
+            if (
+                self.challenge_received
+                and not self.accepting
+                and len(self.rooms) < self.concurrent
+                and self.started < self.battles
+            ):
+                self.challenge_received = False
+                self.accepting = True
+                await self.send(f"|/accept {self.opponent}")
+
+    async def _battle_frame(self, battle_tag, body):
+        room = self.rooms.get(battle_tag)
+        if room is None:
+            if battle_tag in self.finished_rooms:
+                return
+            self._battle_started(battle_tag)
+            room = self.rooms[battle_tag]
+            await self._fill()
+
+        index = body.find("|request|")
+        if index >= 0:
+            payload = body[index + len("|request|"):].split("\n", 1)[0]
+            if payload:
+                await self._answer(room, json.loads(payload))
+
+        if "|error|[Invalid choice]" in body and room.last_rqid != room.default_rqid:
+            # 選択が受け付けられなかったら一度だけサーバに任せる
+            room.default_rqid = room.last_rqid
+            await self.send(f"{battle_tag}|/choose default")
+
+        if "|win|" in body or "|tie\n" in body or body.endswith("|tie"):
+            await self._battle_ended(room, body)
+
+    async def _answer(self, room, request):
+        if request.get("wait"):
+            return
+        rqid = request.get("rqid")
+        if rqid is not None and rqid == room.last_rqid:
+            return
+        room.last_rqid = rqid
+        choice = choose_action(request, self.select_type)
+        if choice is None:
+            print(f"[{self.username}] {room.battle_tag}: 有効な技も交代先もありません")
+            return
+        room.turn_count += 1
+        await self.send(f"{room.battle_tag}|{choice}")
+
+    async def _battle_ended(self, room, body):
+        if "|win|" in body:
+            winner = body.split("|win|", 1)[1].split("\n", 1)[0]
+            result = "win" if to_id(winner) == self.userid else "lose"
+        else:
+            result = "tie"
+        self.results[result] += 1
+        self.finished += 1
+        del self.rooms[room.battle_tag]
+        self.finished_rooms.add(room.battle_tag)
+        print(
+            f"[{self.username}] バトル終了 {room.battle_tag}: {result} "
+            f"({room.turn_count}手, {self.finished}戦目)"
+        )
+        await self.send(f"{room.battle_tag}|/leave")
+        await self._fill()
+
+
+async def showdown_bot(
+    username,
+    password,
+    opponent,
+    is_challenger,
+    battle_format,
+    select_type="max_damage",
+    battles=1,
+    concurrent=1,
+    uri=DEFAULT_URI,
+    verbose=False,
+):
+    return await ShowdownBotRunner(
+        username,
+        password,
+        opponent,
+        is_challenger,
+        battle_format,
+        select_type,
+        battles=battles,
+        concurrent=concurrent,
+        uri=uri,
+        verbose=verbose,
+    ).run()
@@ -0,0 +1,226 @@
+"""
+Measures how many battles per minute two random players complete against the
+local stand-in showdown server.
+
+    $ python benchmark_battles_per_minute.py --battles 50 --concurrent 10 --pairs 2
+
+--pairs spreads the battles on several pairs of accounts, each with its own
+connections, like the pools of the model managers.
+
+With --server-throttle, the server handles one message per 600ms per user like
+a stock showdown server, and drops messages sent too quickly. --rate limits the
+players' outgoing messages per second to stay under it. --latency delays the
+messages sent by the server.
+
+--turn-time turns the timer of the server on, under which players too slow to
+answer lose. --think makes every decision take that many seconds, like a slow
+model, and --in-flight bounds the decisions computed at the same time.
+
+--record saves the transcripts of the battles played. With --transcripts, a
+single player plays recorded battles again instead, which measures the player
+alone on realistic battles:
+
+    $ python benchmark_battles_per_minute.py --battles 20 --record transcripts.jsonl
+    $ python benchmark_battles_per_minute.py --battles 200 --transcripts transcripts.jsonl
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+
+from collections import Counter
+from functools import partial
+from players.base_classes.player_pool import PlayerPool, split_battles
+from players.random_random_battle import RandomRandomBattlePlayer
+from showdown_mock import MockShowdownServer, REPLAY_USERNAME, load_transcripts, save_transcripts
+
+
+class ThinkingPlayer(RandomRandomBattlePlayer):
+    """
+    Random player taking think seconds per decision.
+    """
+
+    think = 0.0
+
+    async def select_move(self, battle, *, trapped=False):
+        await asyncio.sleep(self.think)
+        return await super().select_move(battle, trapped=trapped)
+
+
+def make_player(think, decisions_in_flight, **kwargs):
+    player = ThinkingPlayer(**kwargs)
+    player.think = think
+    if decisions_in_flight:
+        player.max_decisions_in_flight = decisions_in_flight
+    return player
+
+
+async def run_battles(
+    server,
+    number_of_battles,
+    concurrent_battles,
+    pending_challenges=None,
+    messages_per_second=None,
+    opponent=None,
+    log_messages=False,
+    pairs=1,
+    think=0.0,
+    decisions_in_flight=None,
+    player_factory=None,
+    receiver_factory=None,
+):
+    """
+    Runs number_of_battles battles between pairs of random players, or against
+    opponent if given, and returns the elapsed time, in seconds, with the rate
+    limiter stats of the players, the stalled battles they forfeited and the
+    number of decisions, invalid choices and late decisions.
+
+    Players are created by player_factory, called with the keyword arguments of
+    RandomRandomBattlePlayer, if given, and receivers by receiver_factory if it
+    differs.
+    """
+    if player_factory is None:
+        player_factory = partial(make_player, think, decisions_in_flight)
+    if receiver_factory is None:
+        receiver_factory = player_factory
+    challengers, receivers = [], []
+    for i, target_battles in enumerate(split_battles(number_of_battles, pairs)):
+        suffix = f"_{i}" if pairs > 1 else ""
+        challengers.append(
+            player_factory(
+                authentification_address=f"http://{server.address}/action.php?",
+                max_concurrent_battles=concurrent_battles,
+                log_messages_in_console=log_messages,
+                max_pending_challenges=pending_challenges,
+                messages_per_second=messages_per_second,
+                mode="challenge",
+                password="",
+                server_address=server.address,
+                target_battles=target_battles,
+                to_target=opponent or f"bench_receiver{suffix}",
+                username=f"bench_challenger{suffix}",
+            )
+        )
+        if opponent is None:
+            receivers.append(
+                receiver_factory(
+                    authentification_address=f"http://{server.address}/action.php?",
+                    max_concurrent_battles=concurrent_battles,
+                    log_messages_in_console=log_messages,
+                    messages_per_second=messages_per_second,
+                    mode="wait",
+                    password="",
+                    server_address=server.address,
+                    target_battles=target_battles,
+                    username=f"bench_receiver{suffix}",
+                )
+            )
+    pool = PlayerPool(challengers, receivers)
+    start = time.perf_counter()
+    await pool.run()
+    elapsed = time.perf_counter() - start
+    reaped = sum((player.reaped_battles for player in pool.players), Counter())
+    decisions = sum(player.decisions for player in pool.players)
+    invalid_choices = sum((player.invalid_choices for player in pool.players), Counter())
+    late_decisions = sum(player.late_decisions for player in pool.players)
+    return (
+        elapsed,
+        [player.rate_limiter_stats for player in pool.players],
+        reaped,
+        (decisions, invalid_choices, late_decisions),
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--battles", type=int, default=20)
+    parser.add_argument("--concurrent", type=int, default=5)
+    parser.add_argument(
+        "--pending", type=int, default=None, help="challenges in flight, defaults to one per opponent as on showdown"
+    )
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument(
+        "--pairs", type=int, default=1, help="pairs of accounts the battles are spread on"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=None, help="messages per second sent by each player"
+    )
+    parser.add_argument(
+        "--server-throttle", type=float, default=0.0, help="seconds per message, 0.6 on showdown"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds before server messages are delivered"
+    )
+    parser.add_argument(
+        "--turn-time", type=float, default=None, help="seconds to answer a request, timer off by default"
+    )
+    parser.add_argument("--think", type=float, default=0.0, help="seconds taken by each decision")
+    parser.add_argument(
+        "--in-flight", type=int, default=None, help="decisions computed at the same time by a player"
+    )
+    parser.add_argument("--record", help="file to save the transcripts of the battles in")
+    parser.add_argument("--transcripts", help="file of transcripts to play again")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    transcripts = load_transcripts(args.transcripts) if args.transcripts else None
+    async with MockShowdownServer(
+        port=0,
+        max_turns=args.turns,
+        seed=0,
+        throttle_delay=args.server_throttle,
+        latency=args.latency,
+        transcripts=transcripts,
+        record_transcripts=bool(args.record),
+        turn_time=args.turn_time,
+    ) as server:
+        battles = run_battles(
+            server,
+            args.battles,
+            args.concurrent,
+            args.pending,
+            args.rate,
+            opponent=REPLAY_USERNAME if transcripts else None,
+            pairs=args.pairs,
+            think=args.think,
+            decisions_in_flight=args.in_flight,
+        )
+        if args.verbose:
+            elapsed, rate_limiter_stats, reaped, choices = await battles
+        else:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                elapsed, rate_limiter_stats, reaped, choices = await battles
+
+    print(
+        f"{args.battles} battles ({args.pairs} pairs, {args.concurrent} concurrent, "
+        f"{args.pending or 1} pending challenges, {args.turns} turns max) "
+        f"in {elapsed:.2f}s: {args.battles / elapsed * 60:.1f} battles per minute"
+    )
+    if args.record:
+        save_transcripts(args.record, server.recorded_transcripts)
+        print(f"{len(server.recorded_transcripts)} transcripts saved in {args.record}")
+    decisions, invalid_choices, late_decisions = choices
+    print(
+        f"{sum(invalid_choices.values()) * 1000 / max(decisions, 1):.1f} invalid choices per "
+        f"1000 decisions ({decisions} decisions): {dict(invalid_choices)}"
+    )
+    if args.turn_time:
+        print(
+            f"{late_decisions} decisions started after their deadline, "
+            f"{len(server.timed_out)} battles lost on time"
+        )
+    if reaped:
+        print(f"{sum(reaped.values())} stalled battles forfeited: {dict(reaped)}")
+    if args.server_throttle:
+        print(f"{server.messages_throttled} messages dropped by the server")
+    for stats in rate_limiter_stats:
+        if stats is not None:
+            print(
+                f"{sum(stats['delayed'].values())}/{sum(stats['sent'].values())} messages delayed "
+                f"by the rate limiter ({stats['delay']:.2f}s): {stats['delayed']}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,126 @@
+"""
+Measures the per-turn latency of players running a model, i.e. the time between
+a request of the local stand-in showdown server and the answer it gets, with 1,
+10 and 50 concurrent battles.
+
+    $ python benchmark_inference_latency.py --overhead 0.005
+
+TensorFlow is not needed: the model is a stand-in for a session run of
+PolicyNetwork, spending a fixed overhead without holding the GIL, like the
+session does, then computing a dense layer of the same shape with numpy. Each
+decision predicts once, either:
+
+- inline: in the event loop, one input at a time, as feed does
+- batched: batched by InferenceBatcher in the event loop
+- thread pool: batched by InferenceBatcher in a pool of threads, as feed_async does
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from benchmark_battles_per_minute import run_battles
+from players.base_classes.inference_batcher import InferenceBatcher
+from players.random_random_battle import RandomRandomBattlePlayer
+from showdown_mock import MockShowdownServer
+
+
+class StandInModel:
+    """
+    Stand-in for PolicyNetwork.predict: 75 features, 50 hidden units, 20 outputs.
+    """
+
+    def __init__(self, overhead: float, seed: int = 0) -> None:
+        rng = np.random.RandomState(seed)
+        self.overhead = overhead
+        self.w1 = rng.normal(0, 0.3, (75, 50)).astype(np.float32)
+        self.w2 = rng.normal(0, 0.3, (50, 20)).astype(np.float32)
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        time.sleep(self.overhead)
+        logits = np.tanh(x @ self.w1) @ self.w2
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+class ModelPlayer(RandomRandomBattlePlayer):
+    """
+    Random player predicting with the model before each decision.
+    """
+
+    model = None
+    batcher = None
+
+    async def select_move(self, battle, *, trapped=False):
+        x = np.random.rand(75).astype(np.float32)
+        if self.batcher is None:
+            self.model.predict(x[np.newaxis])[0]
+        else:
+            await self.batcher.predict(x)
+        return await super().select_move(battle, trapped=trapped)
+
+
+def make_player(model, batcher, **kwargs):
+    player = ModelPlayer(**kwargs)
+    player.model = model
+    player.batcher = batcher
+    # As many decisions in flight as battles, like the player of ModelManagerTF
+    player.max_decisions_in_flight = kwargs["max_concurrent_battles"]
+    return player
+
+
+async def measure(mode, concurrent_battles, args):
+    model = StandInModel(args.overhead)
+    batcher = None
+    if mode != "inline":
+        batcher = InferenceBatcher(
+            model.predict,
+            window=args.window,
+            max_batch_size=args.batch,
+            executor=ThreadPoolExecutor(args.threads) if mode == "thread pool" else None,
+            max_running_batches=args.threads,
+        )
+    async with MockShowdownServer(port=0, max_turns=args.turns, seed=0) as server:
+        elapsed, *_ = await run_battles(
+            server,
+            max(args.battles, concurrent_battles),
+            concurrent_battles,
+            player_factory=partial(make_player, model, batcher),
+        )
+        latencies = np.array(server.decision_latencies) * 1000
+    if batcher is not None and batcher.executor is not None:
+        batcher.executor.shutdown()
+    return elapsed, latencies, batcher
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--battles", type=int, default=50, help="battles per measure, at least the concurrency")
+    parser.add_argument("--concurrent", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--overhead", type=float, default=0.005, help="seconds of each session run")
+    parser.add_argument("--window", type=float, default=0.002)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=2)
+    args = parser.parse_args()
+
+    for concurrent_battles in args.concurrent:
+        for mode in ["inline", "batched", "thread pool"]:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                elapsed, latencies, batcher = await measure(mode, concurrent_battles, args)
+            batches = f", {batcher.mean_batch_size:4.1f} per batch" if batcher else ""
+            print(
+                f"{concurrent_battles:3d} concurrent, {mode:>11}: per-turn latency p50 "
+                f"{np.percentile(latencies, 50):7.1f}ms, p99 {np.percentile(latencies, 99):7.1f}ms "
+                f"({len(latencies)} decisions in {elapsed:.1f}s{batches})"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
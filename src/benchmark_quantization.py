@@ -0,0 +1,132 @@
+"""
+Compares the predictions of the NumPy models in float32, float16 and int8 over
+the states of battles played against the local stand-in showdown server.
+
+    $ python benchmark_quantization.py --policy-network models/PolicyNetwork/1700000000.npz
+
+For each model and precision, the report gives the memory taken by the weights,
+the time of a single prediction and of a batch of 32, how often the action of
+highest probability is the one of the float32 model, among all 20 outputs and
+among the legal actions of the state, and the largest difference of
+probability.
+
+Models without an export are given random weights initialized like keras
+does, which says more about speed than about accuracy: the agreement of trained
+weights should be measured on their export.
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmark_battles_per_minute import run_battles
+from players.base_classes.quantized_dense import PRECISIONS
+from players.distillation import RecordingPlayer, features
+from players.numpy_fully_connected_model import NumpyFullyConnectedModel
+from players.numpy_policy_network import NumpyPolicyNetwork
+from showdown_mock import MockShowdownServer
+
+SHAPES = {
+    NumpyPolicyNetwork: {
+        "fc1_kernel": (75, 50),
+        "fc1_bias": (50,),
+        "fc2_kernel": (50, 20),
+        "fc2_bias": (20,),
+        "value_layer_kernel": (50, 1),
+    },
+    NumpyFullyConnectedModel: {
+        "hidden_kernel": (5390, 512),
+        "hidden_bias": (512,),
+        "output_kernel": (512, 20),
+        "output_bias": (20,),
+    },
+}
+
+
+def random_export(model, directory):
+    """
+    Writes random weights for model, glorot uniform kernels and zero biases.
+    """
+    rng = np.random.RandomState(0)
+    weights = {}
+    for name, shape in SHAPES[model].items():
+        if len(shape) == 1:
+            weights[name] = np.zeros(shape, dtype=np.float32)
+        else:
+            limit = np.sqrt(6 / sum(shape))
+            weights[name] = rng.uniform(-limit, limit, shape).astype(np.float32)
+    path = os.path.join(directory, f"{model.MODEL_NAME}.npz")
+    np.savez(path, **weights)
+    return path
+
+
+def time_per_call(function, repeat=200):
+    function()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+async def record(battles, turns):
+    records = []
+
+    def make_player(**kwargs):
+        player = RecordingPlayer(**kwargs)
+        player.records = records
+        return player
+
+    async with MockShowdownServer(port=0, max_turns=turns, seed=0) as server:
+        await run_battles(server, battles, min(battles, 10), player_factory=make_player)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--policy-network", help="export of PolicyNetwork.export_npz")
+    parser.add_argument("--fully-connected", help="export of FullyConnectedRandomModel.export_npz")
+    parser.add_argument("--battles", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        records = asyncio.get_event_loop().run_until_complete(record(args.battles, args.turns))
+    inputs = features(records)
+    legal = inputs["mask"]
+    print(f"{len(records)} states from {args.battles} battles")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for model, path, encoding in [
+            (NumpyPolicyNetwork, args.policy_network, "student"),
+            (NumpyFullyConnectedModel, args.fully_connected, "teacher"),
+        ]:
+            if path is None:
+                path = random_export(model, directory)
+                print(f"{model.MODEL_NAME}: random weights")
+            else:
+                print(f"{model.MODEL_NAME}: {path}")
+            x = inputs[encoding]
+            reference = None
+            for precision in PRECISIONS:
+                network = model(path, precision=precision)
+                y = network.predict(x)
+                if reference is None:
+                    reference = y
+                masked, masked_reference = np.where(legal, y, -1), np.where(legal, reference, -1)
+                single = time_per_call(lambda: network.predict(x[:1]))
+                batch = time_per_call(lambda: network.predict(x[:32]))
+                print(
+                    f"{precision:>9}: {network.nbytes / 2**20:6.2f}MB, "
+                    f"{single:7.1f}us per prediction, {batch:7.1f}us per batch of 32, "
+                    f"agreement {np.mean(y.argmax(1) == reference.argmax(1)):6.1%} "
+                    f"({np.mean(masked.argmax(1) == masked_reference.argmax(1)):6.1%} of legal actions), "
+                    f"max difference {np.abs(y - reference).max():.1e}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Measures how long requests take to be decoded and parsed, over the requests of
+recorded battle transcripts.
+
+    $ python benchmark_battles_per_minute.py --battles 20 --turns 20 --record transcripts.jsonl
+    $ python benchmark_request_parsing.py transcripts.jsonl
+
+Without a transcript file, battles are played against the local stand-in
+showdown server first to record some. Every request is timed with the standard
+json module and with the backend of environment.request, decoding only the
+fields needed to answer (rqid and wait), the legal actions, and fully parsed by
+Battle.parse_request. parse_request is also timed with every request received
+twice, as when rooms are joined again, the copies being recognized by their
+rqid.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import time
+
+from environment.battle import Battle
+from environment.legal_actions import LegalActions
+from environment.request import JSON_BACKEND, Request, loads
+from showdown_mock import MockShowdownServer, load_transcripts
+
+
+def requests_of(transcripts):
+    """
+    Returns the json texts of the requests received in transcripts, battle by
+    battle.
+    """
+    battles = []
+    for transcript in transcripts:
+        battles.append([])
+        for frame in transcript["frames"]:
+            for line in frame.split("\n"):
+                if line.startswith("|request|") and len(line) > len("|request|"):
+                    battles[-1].append(line[len("|request|"):])
+    return battles
+
+
+async def record_transcripts(number_of_battles, max_turns):
+    from benchmark_battles_per_minute import run_battles
+
+    async with MockShowdownServer(
+        port=0, max_turns=max_turns, seed=0, record_transcripts=True
+    ) as server:
+        await run_battles(server, number_of_battles, concurrent_battles=10)
+        return server.recorded_transcripts
+
+
+def time_per_request(function, battles, repeat):
+    """
+    Returns the best time, in microseconds, function takes per request when
+    called with the requests of each battle.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for requests in battles:
+            function(requests)
+        best = min(best, time.perf_counter() - start)
+    return best / sum(map(len, battles)) * 1e6
+
+
+def each(function):
+    def call(requests):
+        for request in requests:
+            function(request)
+
+    return call
+
+
+def parse(decode, copies=1):
+    def call(requests):
+        battle = Battle("battle-gen7randombattle-1", "bench")
+        for request in requests:
+            for _ in range(copies):
+                battle.parse_request(decode(request))
+
+    return call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("transcripts", nargs="?", help="file of recorded transcripts")
+    parser.add_argument("--battles", type=int, default=20, help="battles to record without transcripts")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.transcripts:
+        transcripts = load_transcripts(args.transcripts)
+    else:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            transcripts = asyncio.get_event_loop().run_until_complete(
+                record_transcripts(args.battles, args.turns)
+            )
+    battles = requests_of(transcripts)
+    requests = [request for requests in battles for request in requests]
+    print(
+        f"{len(requests)} requests from {len(battles)} battles, "
+        f"{sum(map(len, requests)) / len(requests):.0f} characters on average"
+    )
+
+    def rqid_and_wait(text):
+        request = Request(text)
+        return request.rqid, request.wait
+
+    timings = [
+        ("json.loads", each(json.loads)),
+        (f"{JSON_BACKEND} loads", each(loads)),
+        ("Request rqid and wait", each(rqid_and_wait)),
+        ("LegalActions(json.loads)", each(lambda text: LegalActions(json.loads(text)))),
+        ("LegalActions(Request)", each(lambda text: LegalActions(Request(text)))),
+    ]
+    for name, function in timings:
+        print(f"{name:>40}: {time_per_request(function, battles, args.repeat):8.1f}us per request")
+
+    # parse_request logs, the logs are discarded
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        parse_timings = [
+            (name, time_per_request(function, battles, args.repeat))
+            for name, function in [
+                ("Battle.parse_request(json.loads)", parse(json.loads)),
+                ("Battle.parse_request(Request)", parse(Request)),
+                ("Battle.parse_request(json.loads) x2", parse(json.loads, copies=2)),
+                ("Battle.parse_request(Request) x2", parse(Request, copies=2)),
+            ]
+        ]
+    for name, timing in parse_timings:
+        print(f"{name:>40}: {timing:8.1f}us per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Distills FullyConnectedRandomModel into a compact PolicyNetwork, and compares
+the teacher and the student.
+
+    $ python distill_fully_connected.py --teacher models/FullyConnected/1700000000.npz
+
+States are recorded from battles of random players against the local stand-in
+showdown server, encoded for both models, and the teacher's predictions of
+80% of them are distilled into the student (see players.distillation), which
+is written to --output, loadable by NumpyPolicyNetwork. The report compares on
+the other 20%:
+
+- agreement: how often the student's most probable legal action is the
+  teacher's
+- decisions per second: encoding a state and predicting it, one state at a time
+- win rate: of each model against random players, and of the student against
+  the teacher, always playing the model
+
+Without --teacher, the teacher is given random weights initialized like keras
+does, in place of an export of FullyConnectedRandomModel.export_npz.
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmark_battles_per_minute import run_battles
+from benchmark_quantization import random_export
+from players.distillation import RecordingPlayer, agreement, distill, features
+from players.numpy_fully_connected_model import NumpyFullyConnectedModel
+from players.numpy_policy_network import NumpyPolicyNetwork
+from players.random_random_battle import RandomRandomBattlePlayer
+from showdown_mock import MockShowdownServer
+
+
+async def record(battles, turns):
+    records = []
+
+    def make_player(**kwargs):
+        player = RecordingPlayer(**kwargs)
+        player.records = records
+        return player
+
+    async with MockShowdownServer(port=0, max_turns=turns, seed=0) as server:
+        await run_battles(server, battles, min(battles, 10), player_factory=make_player)
+    return records
+
+
+async def win_rate(model, opponent, battles, turns):
+    """
+    Returns the share of battles model wins against opponent, a model or None
+    for random players.
+    """
+    challengers = []
+
+    def make_challenger(**kwargs):
+        player = model.get_player(kwargs.pop("username"), kwargs.pop("password"), kwargs.pop("mode"), epsilon=1.0, **kwargs)
+        challengers.append(player)
+        return player
+
+    def make_receiver(**kwargs):
+        if opponent is None:
+            return RandomRandomBattlePlayer(**kwargs)
+        return opponent.get_player(kwargs.pop("username"), kwargs.pop("password"), kwargs.pop("mode"), epsilon=1.0, **kwargs)
+
+    async with MockShowdownServer(port=0, max_turns=turns, seed=1) as server:
+        await run_battles(
+            server, battles, min(battles, 10), player_factory=make_challenger, receiver_factory=make_receiver
+        )
+    wins = [win for player in challengers for win in player.wins.values()]
+    return sum(wins) / len(wins) if wins else 0.0
+
+
+def decisions_per_second(model, states):
+    start = time.perf_counter()
+    for state in states:
+        model.predict(np.asarray(model.format_x(state), dtype=np.float32)[np.newaxis])
+    return len(states) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--teacher", help="export of FullyConnectedRandomModel.export_npz")
+    parser.add_argument("--output", help="npz file of the student, defaults to models/FullyConnectedStudent/<time>.npz")
+    parser.add_argument("--battles", type=int, default=100, help="battles to record states from")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--hidden", type=int, default=50)
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--win-rate-battles", type=int, default=100)
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        records = asyncio.get_event_loop().run_until_complete(record(args.battles, args.turns))
+    inputs = features(records)
+    print(f"{len(records)} states from {args.battles} battles")
+
+    with tempfile.TemporaryDirectory() as directory:
+        teacher = NumpyFullyConnectedModel(args.teacher or random_export(NumpyFullyConnectedModel, directory))
+    teacher_probs = teacher.predict(inputs["teacher"])
+
+    split = int(len(records) * 0.8)
+    weights = distill(
+        teacher_probs[:split],
+        inputs["student"][:split],
+        inputs["mask"][:split],
+        hidden=args.hidden,
+        epochs=args.epochs,
+        temperature=args.temperature,
+    )
+    output = args.output or os.path.join("models", "FullyConnectedStudent", f"{int(time.time())}.npz")
+    if os.path.dirname(output) and not os.path.isdir(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    np.savez(output, **weights)
+    student = NumpyPolicyNetwork(output)
+    print(f"student saved in {output}")
+
+    for name, states, probs in [
+        ("train", slice(None, split), student.predict(inputs["student"][:split])),
+        ("test", slice(split, None), student.predict(inputs["student"][split:])),
+    ]:
+        print(f"{name:>5} agreement: {agreement(probs, teacher_probs[states], inputs['mask'][states]):6.1%}")
+
+    states = [state for state, _ in records[split:]]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        win_rates = [
+            asyncio.get_event_loop().run_until_complete(win_rate(model, opponent, args.win_rate_battles, args.turns))
+            for model, opponent in [(teacher, None), (student, None), (student, teacher)]
+        ]
+    print(
+        f"teacher: {decisions_per_second(teacher, states):8.0f} decisions per second, "
+        f"{teacher.nbytes / 2**20:6.2f}MB, win rate against random {win_rates[0]:6.1%}"
+    )
+    print(
+        f"student: {decisions_per_second(student, states):8.0f} decisions per second, "
+        f"{student.nbytes / 2**20:6.2f}MB, win rate against random {win_rates[1]:6.1%}, "
+        f"against the teacher {win_rates[2]:6.1%}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -15,9 +15,19 @@ TODO:
 - Parse turn id in parse_request
 """
 
+import re
+import time
+
+import numpy as np
+
+from .legal_actions import LegalActions
+from .request import Request
 from .pokemon import empty_pokemon, Pokemon
 from .move import Move
-from typing import List, Optional
+from typing import List, Optional, Union
+
+# |inactive| messages giving the time left to the player
+_TIME_LEFT = re.compile(r"^Time left: (\d+) sec this turn|^You have (\d+) seconds")
 
 
 class Battle:
@@ -25,6 +35,9 @@ class Battle:
     Represents the state of a Pokemon battle for a given player.
     """
 
+    ACTION_SPACE = 20
+    """int: outputs of the models, one per possible answer to a request"""
+
     ACTIONS_TO_IGNORE = [
         "",
         "-ability",
@@ -89,6 +102,9 @@ class Battle:
     ]
     """List of str: contain possible fields statuses"""
 
+    TURN_TIME = 150
+    """int: seconds to answer a request, until the timer of showdown says otherwise"""
+
     WEATHERS = [
         "none",
         "DesolateLand",
@@ -149,6 +165,24 @@ class Battle:
         self.p2_fields = {field: False for field in self.FIELDS}
 
         self._wait = False
+        # Identifier of the last request, to recognize it when it is sent again
+        self._rqid = None
+
+        # Choices accepted in answer to the last request, and whether it still
+        # waits for one of them
+        self.legal_actions = LegalActions()
+        self._awaiting_decision = False
+        # Commands and mask of the model outputs, formatted again when the legal
+        # actions they were formatted from change
+        self._action_commands = None
+        self._action_mask = None
+        self._action_table_key = None
+        self._action_table_checked = False
+
+        # Seconds to answer a request, and time before which the current one has
+        # to be answered
+        self._turn_time = self.TURN_TIME
+        self.decision_deadline = None
 
         # Battle state attributes
         self.available_moves = []
@@ -238,6 +272,9 @@ class Battle:
             elif len(message) > 1 and message[1] == "turn":
                 if len(message) > 2:
                     print(f"[DEBUG] Turn {message[2]} for battle {self.battle_tag}")
+            elif len(message) > 1 and message[1] == "inactive":
+                if len(message) > 2:
+                    self.update_time_left(message[2])
             elif len(message) > 1 and message[1] == "start":
                 print(f"[DEBUG] Battle started: {self.battle_tag}")
             elif len(message) > 1 and message[1] == "move":
@@ -282,30 +319,59 @@ class Battle:
             import traceback
             print(f"[DEBUG] Traceback: {traceback.format_exc()}")
 
-    def parse_request(self, request: dict) -> None:
+    def parse_request(self, request: Union[dict, Request]) -> None:
         """
         Update the object from a request
 
         Args:
-            request (dict): parsed json request object
+            request (dict or Request): parsed json request object, or lazily
+            decoded request
         """
         try:
-            if not request or not isinstance(request, dict):
+            if not request or not isinstance(request, (dict, Request)):
                 print(f"[WARNING] Invalid request format: {request}")
                 return
 
-            print(f"[DEBUG] Parsing request: {request}")
+            # The rqid and wait flag of a Request are read without decoding it
+            rqid = request.get("rqid")
+            print(f"[DEBUG] Parsing request {rqid} for battle {self.battle_tag}")
+            if rqid is not None and rqid == self._rqid:
+                # Sent again, e.g. when the room is joined again: nothing changed
+                # but the server still waits for an answer
+                self._awaiting_decision = bool(self.legal_actions)
+                return
+            self._rqid = rqid
 
-            if "wait" in request and request["wait"]:
-                self._wait = True
-            else:
-                self._wait = False
+            self._wait = bool(request.get("wait"))
+            if self._wait:
+                # Nothing to choose, the battle log tells the rest
+                self.legal_actions = LegalActions()
+                self._action_table_checked = False
+                self._awaiting_decision = False
+                self.decision_deadline = None
+                self.available_moves = []
+                self.available_switches = []
+                self.can_mega_evolve = False
+                self.can_z_move = False
+                self.trapped = False
+                self._turn += 1
+                return
+
+            if isinstance(request, Request):
+                # The whole request is walked below
+                request = request.data
+
+            legal_actions = LegalActions(request)
+            self.legal_actions = legal_actions
+            self._action_table_checked = False
+            self._awaiting_decision = bool(legal_actions)
+            self.decision_deadline = time.time() + self._turn_time if legal_actions else None
 
             self.available_moves = []
             self.available_switches = []
-            self.can_mega_evolve = False
+            self.can_mega_evolve = legal_actions.can_mega_evolve
             self.can_z_move = False
-            self.trapped = False
+            self.trapped = legal_actions.trapped
 
             if "side" in request:
                 side_request = request["side"]
@@ -314,19 +380,23 @@ class Battle:
                         if "ident" in pokemon and "details" in pokemon:
                             pokemon_ident = pokemon["ident"]
                             pokemon_details = pokemon["details"]
-                            if pokemon_ident not in self._player_team:
+                            # Keyed like the pokemons referenced by battle messages
+                            team_key = pokemon_ident.split(": ")[-1].lower()
+                            if team_key not in self._player_team:
                                 new_pokemon = Pokemon(ident=pokemon_ident)
                                 new_pokemon._update_formatted_details(pokemon_details)
-                                self._player_team[pokemon_ident] = new_pokemon
+                                self._player_team[team_key] = new_pokemon
                             else:
-                                self._player_team[pokemon_ident]._update_formatted_details(pokemon_details)
+                                self._player_team[team_key]._update_formatted_details(pokemon_details)
+                            # The ident of the request is the one switches are chosen by
+                            self._player_team[team_key].ident = pokemon_ident
 
+                            self._player_team[team_key].active = pokemon.get("active", False)
                             if pokemon.get("active", False):
-                                self._player_active_pokemon = self._player_team[pokemon_ident]
-                                self._player_team[pokemon_ident].active = True
+                                self._player_active_pokemon = self._player_team[team_key]
                                 print(f"[DEBUG] Set active pokemon: {pokemon_ident}")
-                            elif not self.trapped and pokemon.get("condition", "") != "0 fnt":
-                                self.available_switches.append((len(self.available_switches) + 1, pokemon_ident))
+                            if pokemon_ident in legal_actions.switches:
+                                self.available_switches.append((legal_actions.switches[pokemon_ident], pokemon_ident))
                         else:
                             print(f"[WARNING] Pokemon without ident or details: {pokemon}")
 
@@ -338,14 +408,11 @@ class Battle:
                             if self._player_active_pokemon:
                                 self._player_active_pokemon.update_from_move(move["id"])
                                 print(f"[DEBUG] Added move {move['id']} to {self._player_active_pokemon.ident}")
-                            self.available_moves.append((len(self.available_moves) + 1, move))
+                            if move["id"] in legal_actions.moves:
+                                self.available_moves.append((legal_actions.moves[move["id"]], move))
                         else:
                             print(f"[WARNING] Move without id: {move}")
 
-                if "trapped" in active_request and active_request["trapped"]:
-                    self.trapped = True
-                if "canMegaEvo" in active_request and active_request["canMegaEvo"]:
-                    self.can_mega_evolve = True
                 if "canZMove" in active_request:
                     self.can_z_move = active_request["canZMove"]
 
@@ -404,6 +471,9 @@ class Battle:
         """
         Pokemon: the active pokemon, or None
         """
+        # The last request knows best, even when the battle log was received first
+        if self._player_active_pokemon is not None:
+            return self._player_active_pokemon
         for pokemon in self._player_team.values():
             if pokemon.active:
                 return pokemon
@@ -469,18 +539,18 @@ class Battle:
         ]
 
         if not active:
-            active = empty_pokemon
+            active = empty_pokemon.dic_state
         else:
             active = active.dic_state
         if not opponent_active:
-            opponent_active = empty_pokemon
+            opponent_active = empty_pokemon.dic_state
         else:
             opponent_active = opponent_active.dic_state
 
         while len(back) < 5:
-            back.append(empty_pokemon)
+            back.append(empty_pokemon.dic_state)
         while len(opponent_back) < 5:
-            opponent_back.append(empty_pokemon)
+            opponent_back.append(empty_pokemon.dic_state)
 
         return {
             "active": active,
@@ -494,6 +564,13 @@ class Battle:
             else self.p1_fields,
         }
 
+    @property
+    def finished(self) -> bool:
+        """
+        bool: indicates if the battle is over
+        """
+        return self._finished
+
     @property
     def is_ready(self) -> bool:
         """
@@ -503,20 +580,9 @@ class Battle:
             bool: True if the battle is ready, False otherwise
         """
         try:
-            if not self._player_role:
-                print(f"[DEBUG] Battle {self.battle_tag} not ready: player role not set")
-                return False
-
-            if not self._player_active_pokemon:
-                print(f"[DEBUG] Battle {self.battle_tag} not ready: no active pokemon")
-                return False
-
-            if not self.available_moves and not self.available_switches:
-                print(f"[DEBUG] Battle {self.battle_tag} not ready: no available moves or switches")
-                return False
-
-            if self._wait:
-                print(f"[DEBUG] Battle {self.battle_tag} not ready: waiting for opponent")
+            reason = self.not_ready_reason
+            if reason:
+                print(f"[DEBUG] Battle {self.battle_tag} not ready: {reason}")
                 return False
 
             print(f"[DEBUG] Battle {self.battle_tag} is ready")
@@ -529,6 +595,133 @@ class Battle:
             print(f"[DEBUG] Traceback: {traceback.format_exc()}")
             return False
 
+    @property
+    def not_ready_reason(self) -> str:
+        """
+        str: why the player cannot choose a move yet, or None if the battle is ready
+        """
+        if not self._player_role:
+            return "player role not set"
+        if not self._player_active_pokemon:
+            return "no active pokemon"
+        if self._wait:
+            return "waiting for opponent"
+        if not self.legal_actions:
+            return "no available moves or switches"
+        if not self._awaiting_decision:
+            return "decision already sent"
+        return None
+
+    def action_mask(self, *, trapped: bool = False) -> np.ndarray:
+        """
+        Returns which of the ACTION_SPACE outputs of the models are legal answers
+        to the last request. The first 5 are switches to the pokemons of
+        player_back, the next 15 the 4 moves of active_moves then struggle or
+        recharge, each plain, as a z-move and with a mega evolution.
+
+        Args:
+            trapped (bool, defaults to False): whether switches are forbidden
+
+        Returns:
+            mask (np.ndarray): boolean vector of size ACTION_SPACE, not to be
+            modified
+        """
+        self._check_action_table()
+        if trapped and self._action_mask[:5].any():
+            mask = self._action_mask.copy()
+            mask[:5] = False
+            return mask
+        return self._action_mask
+
+    def action_command(self, action: int) -> Optional[str]:
+        """
+        Returns the command of a model output, or None if it is not a legal
+        answer to the last request. Outputs are ordered as in action_mask.
+
+        Args:
+            action (int): index of the output
+        """
+        if not 0 <= action < self.ACTION_SPACE:
+            return None
+        return self.action_commands[action]
+
+    @property
+    def action_commands(self) -> tuple:
+        """
+        Tuple of str: command of each model output, None for those that are not
+        legal answers to the last request. Outputs are ordered as in action_mask.
+
+        The table is checked on first use after a request, once the messages of
+        the turn are parsed, and only formatted again when the legal actions of
+        the request, the back pokemons or the active moves changed since the
+        previous one: most turns keep the same.
+        """
+        self._check_action_table()
+        return self._action_commands
+
+    def _check_action_table(self) -> None:
+        if self._action_table_checked:
+            return
+        back, moves = self.player_back_idents[:5], self.active_moves[:4]
+        key = (self.legal_actions.signature, tuple(back), tuple(moves))
+        if key != self._action_table_key:
+            commands = tuple(self._action_command(i, back, moves) for i in range(self.ACTION_SPACE))
+            mask = np.array([command is not None for command in commands])
+            mask.setflags(write=False)
+            self._action_commands, self._action_mask, self._action_table_key = commands, mask, key
+        self._action_table_checked = True
+
+    def _action_command(self, action: int, back: List[str], moves: List[str]) -> Optional[str]:
+        if action < 5:
+            return self.legal_actions.switch_command(back[action]) if action < len(back) else None
+        move, option = divmod(action - 5, 3)
+        if move == 4:
+            if option:
+                return None
+            return self.legal_actions.move_command("struggle") or self.legal_actions.move_command("recharge")
+        if move >= len(moves):
+            return None
+        move_id = moves[move].lower().replace(" ", "")
+        return self.legal_actions.move_command(move_id, z_move=option == 1, mega=option == 2)
+
+    def decision_sent(self) -> None:
+        """
+        Records that the last request was answered, so that it is not answered
+        twice
+        """
+        self._awaiting_decision = False
+
+    def decision_refused(self) -> None:
+        """
+        Records that the answer to the last request was refused, so that it is
+        answered again
+        """
+        self._awaiting_decision = bool(self.legal_actions)
+
+    def update_time_left(self, message: str) -> None:
+        """
+        Updates the decision deadline from an |inactive| message of the timer.
+
+        Args:
+            message (str): text of the |inactive| message
+        """
+        match = _TIME_LEFT.match(message)
+        if match is None:
+            return
+        self._turn_time = int(match.group(1) or match.group(2))
+        if self._awaiting_decision:
+            self.decision_deadline = time.time() + self._turn_time
+
+    @property
+    def slack(self) -> float:
+        """
+        float: seconds left to answer the current request, infinite if none is
+        awaited. Decisions can use it to decide how long to think
+        """
+        if not self._awaiting_decision or self.decision_deadline is None:
+            return float("inf")
+        return self.decision_deadline - time.time()
+
     @property
     def opponent_active_pokemon(self) -> Pokemon:
         """
@@ -561,6 +754,17 @@ class Battle:
             if not pokemon.active
         ]
 
+    @property
+    def player_back_idents(self) -> List[str]:
+        """
+        List of str: the player's back pokemons' idents, in the order of player_back
+        """
+        return [
+            pokemon.ident
+            for pokemon in self._player_team.values()
+            if not pokemon.active
+        ]
+
     @property
     def turn_sent(self) -> int:
         """
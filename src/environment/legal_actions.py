@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+LegalActions class. Lists the choices showdown accepts in answer to a request.
+
+Choices built from the battle log can be refused by the server, for instance
+when a move is disabled, the active pokemon is trapped or a switch is forced,
+each refusal costing a round-trip. The request holds everything needed to only
+send valid choices, so players should pick their commands from here.
+"""
+
+from typing import List, Optional
+
+
+class LegalActions:
+    """
+    Choices accepted by the server in answer to a request.
+    """
+
+    def __init__(self, request: dict = None) -> None:
+        """
+        Args:
+            request (dict, defaults to None): parsed json request object. If None,
+            no choice is legal
+        """
+        request = request or {}
+
+        self.wait = bool(request.get("wait"))
+        """bool: whether the request only asks to wait for the opponent"""
+
+        self.force_switch = any(request.get("forceSwitch") or [])
+        """bool: whether the active pokemon has to be replaced"""
+
+        active = {}
+        if not self.wait and not self.force_switch and request.get("active"):
+            active = request["active"][0]
+
+        self.trapped = bool(active.get("trapped"))
+        """bool: whether the active pokemon cannot switch out"""
+
+        self.can_mega_evolve = bool(active.get("canMegaEvo"))
+        """bool: whether the active pokemon can mega evolve this turn"""
+
+        self.moves = {}
+        """dict: request slot of the usable moves, by move id"""
+
+        self.z_moves = set()
+        """set: ids of the moves that can be used as z-moves"""
+
+        z_moves = active.get("canZMove") or []
+        for slot, move in enumerate(active.get("moves", []), 1):
+            if "id" not in move or move.get("disabled") or move.get("pp", 1) <= 0:
+                continue
+            self.moves[move["id"]] = slot
+            if slot <= len(z_moves) and z_moves[slot - 1]:
+                self.z_moves.add(move["id"])
+
+        self.switches = {}
+        """dict: request slot of the pokemons that can be switched in, by ident"""
+
+        if not self.wait and (self.force_switch or (active and not self.trapped)):
+            for slot, pokemon in enumerate(request.get("side", {}).get("pokemon", []), 1):
+                if not pokemon.get("active") and not pokemon.get("condition", "").endswith(" fnt"):
+                    self.switches[pokemon["ident"]] = slot
+
+    @property
+    def signature(self) -> tuple:
+        """
+        tuple: hashable summary of the legal actions, equal for two requests
+        accepting the same choices
+        """
+        return (
+            tuple(self.moves.items()),
+            tuple(sorted(self.z_moves)),
+            self.can_mega_evolve,
+            tuple(self.switches.items()),
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self.moves or self.switches)
+
+    def move_command(self, move_id: str, *, mega: bool = False, z_move: bool = False) -> Optional[str]:
+        """
+        Returns the command using a move, or None if it is not legal.
+
+        Args:
+            move_id (str): id of the move, as given in the request
+
+            mega (bool, defaults to False): whether to mega evolve
+
+            z_move (bool, defaults to False): whether to use the move as a z-move
+        """
+        if move_id not in self.moves:
+            return None
+        if mega and not self.can_mega_evolve:
+            return None
+        if z_move and move_id not in self.z_moves:
+            return None
+        command = f"/choose move {self.moves[move_id]}"
+        if mega:
+            command += " mega"
+        if z_move:
+            command += " zmove"
+        return command
+
+    def switch_command(self, ident: str) -> Optional[str]:
+        """
+        Returns the command switching ident in, or None if it is not legal.
+
+        Args:
+            ident (str): pokemon ident, as given in the request
+        """
+        if ident not in self.switches:
+            return None
+        return f"/choose switch {self.switches[ident]}"
+
+    def commands(self, *, switches: bool = True, options: bool = False) -> List[str]:
+        """
+        Lists legal commands: moves, then switches.
+
+        Args:
+            switches (bool, defaults to True): whether to include switches
+
+            options (bool, defaults to False): whether to include mega evolutions
+            and z-moves
+        """
+        commands = [self.move_command(move_id) for move_id in self.moves]
+        if options:
+            if self.can_mega_evolve:
+                commands += [self.move_command(move_id, mega=True) for move_id in self.moves]
+            commands += [self.move_command(move_id, z_move=True) for move_id in self.z_moves]
+        if switches:
+            commands += [self.switch_command(ident) for ident in self.switches]
+        return commands
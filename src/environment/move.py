@@ -12,10 +12,10 @@ TODO:
 - Hidden power type
 - ZMove effects
 """
-from .utils import CATEGORIES, MOVES, TARGETS, TYPES, SECONDARIES
+from .utils import CATEGORIES, MOVES, TARGETS, TYPES, SECONDARIES, FlattenedState
 
 
-empty_move = {
+empty_move = FlattenedState({
     "accuracy": 0,
     "auto_boosts": {
         "atk": (0, 0),
@@ -71,13 +71,16 @@ empty_move = {
     },
     "z_power": 0,
     "z_effect": False,
-}
+})
 """This dictionnary is used inplace of unknown moves"""
 
 class Move:
     """
     Represents a move.
     """
+
+    _dic_state = None
+
     def __init__(self, move: str) -> None:
         """
         Initialize a Move object.
@@ -153,6 +156,7 @@ class Move:
             }
 
         move_data = MOVES[move]
+        self.id = move
         self.name = move_data["name"]
         self.type = move_data["type"].lower()
         self.target = move_data["target"]
@@ -241,7 +245,13 @@ class Move:
         """
         dict: dictionnary describing the object's state
         """
-        return {
+        # Moves do not change once created
+        if self._dic_state is None:
+            self._dic_state = self._build_dic_state()
+        return self._dic_state
+
+    def _build_dic_state(self) -> FlattenedState:
+        return FlattenedState({
             "accuracy": self.accuracy,
             "auto_boosts": self.auto_boosts,
             "base_power": self.base_power,
@@ -250,15 +260,17 @@ class Move:
                 category: category == self.category for category in CATEGORIES
             },
             "exists": 1,
+            "id": self.id,
             "max_pp": self.max_pp,
             "priority": self.priority,
             "target": {target: target == self.target for target in TARGETS},
             "type": {type_: type_ == self.type for type_ in TYPES},
+            "types": [self.type],
             "secondaries": self.secondaries,
             "z_boost": self.z_boost,
             "z_power": self.z_power,
             "z_effect": self.z_effect,
-        }
+        })
 
 
 class ZMoveException(Exception):
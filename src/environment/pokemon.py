@@ -1,5 +1,5 @@
 from .move import empty_move, Move, ZMoveException
-from .utils import MOVES, POKEDEX, TYPES, SEXES
+from .utils import MOVES, POKEDEX, TYPES, SEXES, FlattenedState, to_id
 
 
 # 空のポケモン状態を表すクラス
@@ -36,9 +36,14 @@ class EmptyPokemon:
         self.type = {t: False for t in TYPES}
         self.yawned = False
 
+    _dic_state = None
+
     @property
     def dic_state(self):
-        return self.__dict__
+        # The empty pokemon never changes
+        if self._dic_state is None:
+            type(self)._dic_state = FlattenedState(self.__dict__)
+        return self._dic_state
 
 empty_pokemon = EmptyPokemon()
 
@@ -172,7 +177,8 @@ class Pokemon:
             form = form.lower()
         self.ability = POKEDEX[form]["abilities"]
         self.base_stats = POKEDEX[form]["baseStats"]
-        self.types = [t.lower() for t in POKEDEX[form]["types"]]
+        # Ordered like TYPES, so that the first one is the first flagged in dic_state
+        self.types = sorted((t.lower() for t in POKEDEX[form]["types"]), key=TYPES.index)
 
     def set_status(self, status: str, cure: bool = False) -> None:
         if cure:
@@ -262,7 +268,13 @@ class Pokemon:
         moves = [move.dic_state for move in self.moves.values()]
         while len(moves) < 4:
             moves.append(empty_move)
+
+        # Until revealed, the ability is one of those of the species, by slot
+        ability = self.ability
+        if isinstance(ability, dict):
+            ability = next(iter(ability.values())) if len(ability) == 1 else None
         return {
+            "ability": to_id(ability) if ability else "",
             "active": self.active,
             "attracted": self.attracted,
             "base_stats": self.base_stats,
@@ -271,6 +283,7 @@ class Pokemon:
             "exists": True,
             "focused": self.focused,
             "infested": self.infested,
+            "item": self.item or "",
             "level": self.level,
             "leech_seeding": self.leech_seeding,
             "max_hp": self.max_hp,
@@ -279,10 +292,12 @@ class Pokemon:
             "perish_count": self.perish_count,
             "primal": self.primal,
             "sex": {s: self.sex == s for s in SEXES},
+            "species": self.species,
             "stats": self.stats,
             "status": self.status,
             "substitute": self.substitute,
             "taunted": self.taunted,
             "type": type_,
+            "types": [self.type_changed] if self.type_changed else list(self.types),
             "yawned": self.yawned,
         }
@@ -14,7 +14,7 @@ from .battle import Battle
 class SyncShowdownClient:
     def choose_action_from_request(self, request_str, select_type="random"):
         """
-        battle_DQN.pyのロジックを参考に、request文字列から適切なコマンドを返す
+        showdown_bot_runner.pyのロジックを参考に、request文字列から適切なコマンドを返す
         select_type: "random" or "max_damage"
         """
         try:
@@ -292,14 +292,14 @@ class PokemonBattleEnv(gym.Env):
     def _make_valid_actions(self, battle):
         # 有効な技・交代先をコマンドリスト化
         actions = []
-        # 技
-        for i, move in enumerate(getattr(battle, "available_moves", [])[:self.max_moves]):
-            actions.append(f"{battle.battle_tag}|/choose move {i+1}\n")
+        # 技 (リクエスト上の番号で指定する)
+        for slot, move in getattr(battle, "available_moves", [])[:self.max_moves]:
+            actions.append(f"{battle.battle_tag}|/choose move {slot}\n")
         # 交代
-        for i, sw in enumerate(getattr(battle, "available_switches", [])[:self.max_switches]):
-            actions.append(f"{battle.battle_tag}|/choose switch {i+1}\n")
+        for slot, ident in getattr(battle, "available_switches", [])[:self.max_switches]:
+            actions.append(f"{battle.battle_tag}|/choose switch {slot}\n")
         if not actions:
-            actions.append(f"{battle.battle_tag}|/choose move 1\n")  # fallback
+            actions.append(f"{battle.battle_tag}|/choose default\n")  # fallback
         return actions
 
     def _encode_state(self, battle):
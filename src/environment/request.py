@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Request class. Lazily decodes the json requests sent by showdown.
+
+A request holds the whole side of the player, and is sent again every turn and
+on every /join. Most of the time not all of it is needed: a duplicate request
+only needs its rqid, a wait request nothing else. Request keeps the raw text,
+reads these flags from it, and only decodes it when another field is accessed,
+with orjson or ujson when one of them is installed and the standard json module
+otherwise.
+"""
+
+import json
+import re
+
+from typing import Any, List
+
+try:
+    import orjson
+
+    loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import ujson
+
+        loads = ujson.loads
+        JSON_BACKEND = "ujson"
+    except ImportError:
+        loads = json.loads
+        JSON_BACKEND = "json"
+
+# Keys that only appear at the top level of a request, whose presence can be
+# checked without decoding it. "active" is also a key of the side pokemons.
+_TOP_LEVEL_KEYS = {"side", "forceSwitch", "wait", "rqid", "teamPreview", "noCancel"}
+_RQID = re.compile(r'"rqid"\s*:\s*(\d+)')
+_WAIT = re.compile(r'"wait"\s*:\s*true')
+
+
+class Request:
+    """
+    Request of showdown, decoded on the first access to a field that needs it.
+
+    Request can be used like the dict json.loads would return, and be given
+    wherever a parsed request is expected:
+
+    Example:
+        >>> request = Request(message.split("|request|")[1])
+        >>> request.rqid, request.wait  # no decoding
+        >>> request.get("active")  # decodes the request
+    """
+
+    __slots__ = ("text", "_data")
+
+    def __init__(self, text: str) -> None:
+        """
+        Args:
+            text (str): json text of the request
+        """
+        self.text = text
+        self._data = None
+
+    def _decode(self) -> dict:
+        if self._data is None:
+            self._data = loads(self.text)
+            if not isinstance(self._data, dict):
+                raise ValueError(f"Request is not a json object: {self.text[:100]}")
+        return self._data
+
+    def _absent(self, key: str) -> bool:
+        """
+        Whether key is known not to be in the request without decoding it.
+        """
+        return self._data is None and f'"{key}"' not in self.text
+
+    def __contains__(self, key: str) -> bool:
+        if self._absent(key):
+            return False
+        if self._data is None and key in _TOP_LEVEL_KEYS:
+            return True
+        return key in self._decode()
+
+    def __getitem__(self, key: str) -> Any:
+        if self._data is None and key in ("rqid", "wait") and key in self:
+            return getattr(self, key)
+        return self._decode()[key]
+
+    def __bool__(self) -> bool:
+        return bool(self.text)
+
+    def __repr__(self) -> str:
+        return f"Request(rqid={self.rqid}, wait={self.wait})"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if self._absent(key):
+            return default
+        if self._data is None and key in ("rqid", "wait"):
+            return getattr(self, key)
+        return self._decode().get(key, default)
+
+    @property
+    def active(self) -> dict:
+        """
+        dict: request of the active pokemon, empty if there is none
+        """
+        active = self.get("active")
+        return active[0] if active else {}
+
+    @property
+    def data(self) -> dict:
+        """
+        dict: the whole decoded request
+        """
+        return self._decode()
+
+    @property
+    def moves(self) -> List[dict]:
+        """
+        List of dict: the moves of the active pokemon
+        """
+        return self.active.get("moves", [])
+
+    @property
+    def rqid(self) -> int:
+        """
+        int: request identifier, read without decoding the request. None if absent
+        """
+        # The rqid comes last
+        match = _RQID.match(self.text, max(self.text.rfind('"rqid"'), 0))
+        return int(match.group(1)) if match else None
+
+    @property
+    def side_pokemon(self) -> List[dict]:
+        """
+        List of dict: the pokemons of the player, in request order
+        """
+        return self.get("side", {}).get("pokemon", [])
+
+    @property
+    def wait(self) -> bool:
+        """
+        bool: whether the request only asks to wait, read without decoding the
+        request
+        """
+        # The wait flag comes first
+        return _WAIT.match(self.text, max(self.text.find('"wait"'), 0)) is not None
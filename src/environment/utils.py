@@ -10,7 +10,8 @@ advanced topics in artifical intelligence course at Ecole Polytechnique.
 import json
 import numpy as np
 
-from typing import Generator
+from operator import itemgetter
+from typing import Generator, List, Tuple
 PATH = "/home/denso/reinforcement-learning-pokemon-bot/"
 
 CATEGORIES = ["Physical", "Special", "Status"]
@@ -593,6 +594,17 @@ with open(PATH + "data/new_pokemon.json") as f:
     new_pokemon = json.load(f)
     POKEDEX.update(new_pokemon)
 
+def to_id(name: str) -> str:
+    """
+    Returns the showdown identifier of a name: lowercase alphanumeric characters.
+
+    Examples:
+        >>> to_id("INF581 Bot_1")
+        'inf581bot1'
+    """
+    return "".join(c for c in name.lower() if c.isalnum())
+
+
 def _data_yielder(data) -> Generator:
     """
     Generator yielding data in a deterministric way from an arbitrary nested data 
@@ -630,6 +642,10 @@ def _data_yielder(data) -> Generator:
         for el in data:
             for foo in _data_yielder(el):
                 yield foo
+    elif isinstance(data, str):
+        # Names of species, moves, items and abilities are left to the models
+        # embedding them
+        pass
     else:
         raise ValueError(
             f"Type {type(data)} (with value {data}) is not compatible with function data_flattener"
@@ -654,3 +670,329 @@ def data_flattener(data) -> list:
 
     """
     return [el for el in _data_yielder(data)]
+
+
+class FlattenedState(dict):
+    """
+    dict describing a state that is never modified once built, like the state of
+    a move or of the empty pokemon padding teams. sparse_flattener and
+    FlattenPlan flatten it once, and reuse the result wherever it appears.
+    """
+
+    __slots__ = ("_sparse", "_values")
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._sparse = None
+        self._values = None
+
+    def __deepcopy__(self, memo: dict) -> "FlattenedState":
+        # Never modified, copies of the states holding it can share it
+        return self
+
+
+def _sparse_walk(data, position: int, indices: List[int], values: List[float]) -> int:
+    """
+    Appends the non-zero values of data, as ordered by _data_yielder, with their
+    positions, and returns the position following its last value.
+    """
+    if type(data) is FlattenedState:
+        if data._sparse is None:
+            state_indices, state_values = [], []
+            size = _sparse_walk_elements([data[key] for key in sorted(data.keys())], 0, state_indices, state_values)
+            data._sparse = (state_indices, state_values, size)
+        state_indices, state_values, size = data._sparse
+        indices.extend([position + i for i in state_indices])
+        values.extend(state_values)
+        return position + size
+    if isinstance(data, dict):
+        return _sparse_walk_elements([data[key] for key in sorted(data.keys())], position, indices, values)
+    if isinstance(data, (list, tuple)):
+        return _sparse_walk_elements(data, position, indices, values)
+    if data is None:
+        return position + 1
+    if isinstance(data, str):
+        return position
+    if isinstance(data, (int, float)):
+        if data:
+            indices.append(position)
+            values.append(data)
+        return position + 1
+    raise ValueError(
+        f"Type {type(data)} (with value {data}) is not compatible with function sparse_flattener"
+    )
+
+
+def _sparse_walk_elements(elements, position: int, indices: List[int], values: List[float]) -> int:
+    # Most elements are scalars, handled here rather than by a call each
+    for el in elements:
+        el_type = type(el)
+        if el_type is bool or el_type is int or el_type is float:
+            if el:
+                indices.append(position)
+                values.append(el)
+            position += 1
+        elif el is None:
+            position += 1
+        else:
+            position = _sparse_walk(el, position, indices, values)
+    return position
+
+
+def sparse_flattener(data) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Returns the values of data_flattener that are not zero, with their
+    positions, without building the list of all of them.
+
+    Args:
+        data (arbitrary): The data source.
+
+    Returns:
+        indices (np.ndarray), values (np.ndarray), size (int): the positions of
+        the non-zero values, the values as float32, and the length of the
+        list data_flattener would return.
+
+    Examples:
+        >>> data = {'a' : [1, 0, 3], 'b' : None, 'd' : True}
+        >>> sparse_flattener(data)
+        (array([0, 2, 4], dtype=int32), array([1., 3., 1.], dtype=float32), 5)
+
+    """
+    indices, values = [], []
+    size = _sparse_walk(data, 0, indices, values)
+    return np.array(indices, dtype=np.int32), np.array(values, dtype=np.float32), size
+
+
+def batch_flattener(data: list) -> np.ndarray:
+    """
+    Returns the flattened lists of several data sources stacked into a float32
+    array, scattering their non-zero values at once.
+
+    Args:
+        data (list): The data sources, flattening to lists of the same length.
+
+    Returns:
+        np.ndarray: Array of shape (len(data), length of the flattened lists).
+
+    Examples:
+        >>> batch_flattener([{'a' : [1, 0], 'b' : 4}, {'a' : [0, 2], 'b' : None}])
+        array([[1., 0., 4.],
+               [0., 2., 0.]], dtype=float32)
+
+    """
+    indices, values, counts, sizes = [], [], [], set()
+    for el in data:
+        start = len(indices)
+        sizes.add(_sparse_walk(el, 0, indices, values))
+        counts.append(len(indices) - start)
+    if len(sizes) > 1:
+        raise ValueError(f"Data sources flatten to different lengths {sorted(sizes)}, they cannot be stacked")
+    x = np.zeros((len(data), sizes.pop() if sizes else 0), dtype=np.float32)
+    x[np.repeat(np.arange(len(data)), counts), indices] = values
+    return x
+
+
+class FlattenPlan:
+    """
+    data_flattener compiled for the dic_states of a model, filling a float32
+    array.
+
+    data_flattener sorts the keys of every dict and checks the type of every
+    value, for states that always have the same structure. A FlattenPlan
+    records, the first time it meets each place of a state, its sorted keys and
+    which of its values are numbers, read at once with an itemgetter, or the
+    length of its list. Following states are extracted with these plans.
+    FlattenedState values, most of a state, are converted to float32 once and
+    copied as is.
+
+    States must keep the structure of the first one: a dict whose keys differ
+    from those compiled for its place, a list of another length, a container
+    found where a number was or a FlattenedState whose length differs from the
+    values of its place are rejected with a ValueError. Names, and containers
+    of names only, are skipped like data_flattener does. None as well as NaN
+    give 0.
+
+    Example:
+        >>> plan = FlattenPlan()
+        >>> plan({'a' : [1, 2, 3], 'b' : 4, 'd' : False})
+        array([1., 2., 3., 4., 0.], dtype=float32)
+    """
+
+    def __init__(self) -> None:
+        self._root = _PlanNode("state")
+
+    def __call__(self, data, out: np.ndarray = None) -> np.ndarray:
+        """
+        Args:
+            data (arbitrary): The data source.
+
+            out (np.ndarray, defaults to None): float32 array to write the values
+            to, e.g. a row of a batch. If None, a new one is returned
+
+        Returns:
+            np.ndarray: The flattened values, out if given.
+        """
+        # Numbers, and the arrays of FlattenedState values with the number of
+        # numbers preceding them
+        values, chunks = [], []
+        self._root.extract(data, values, chunks)
+        try:
+            numbers = np.array(values, dtype=np.float32)
+        except (TypeError, ValueError):
+            raise ValueError("A container was found where the plan expected a number: the schema drifted")
+        numbers[np.isnan(numbers)] = 0
+
+        pieces, start = [], 0
+        for end, chunk in chunks:
+            pieces.append(numbers[start:end])
+            pieces.append(chunk)
+            start = end
+        pieces.append(numbers[start:])
+        if out is None:
+            return np.concatenate(pieces)
+        return np.concatenate(pieces, out=out)
+
+
+def _is_names(data) -> bool:
+    """
+    Returns whether data is a name, or a non-empty container of names only,
+    which data_flattener gives no value for.
+    """
+    if isinstance(data, str):
+        return True
+    if isinstance(data, dict):
+        return len(data) > 0 and all(_is_names(el) for el in data.values())
+    if isinstance(data, (list, tuple)):
+        return len(data) > 0 and all(_is_names(el) for el in data)
+    return False
+
+
+class _PlanNode:
+    """
+    Place of a state, with the plan of the dict or list found there and the
+    number of values it flattens to.
+    """
+
+    __slots__ = ("path", "size", "_names", "_dict", "_length", "_elements")
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.size = None
+        self._names = False
+        self._dict = None
+        self._length = None
+        self._elements = None
+
+    def _check_size(self, size: int) -> None:
+        if self.size is None:
+            self.size = size
+        elif size != self.size:
+            raise ValueError(
+                f"{size} values at {self.path} instead of the {self.size} of the plan: the schema drifted"
+            )
+
+    def _compile(self, data) -> None:
+        if _is_names(data):
+            self._names = True
+            return
+        self._check_size(len(data_flattener(data)))
+        if type(data) is dict:
+            self._dict = _DictPlan(data, self.path)
+        else:
+            self._length = len(data)
+            self._elements = _PlanNode(self.path + "[]")
+
+    def _drift(self, data) -> ValueError:
+        return ValueError(
+            f"Type {type(data)} (with value {data}) at {self.path} does not match the plan: the schema drifted"
+        )
+
+    def extract(self, data, values: list, chunks: list) -> None:
+        data_type = type(data)
+        if data_type is FlattenedState:
+            if data._values is None:
+                data._values = np.array(data_flattener(data), dtype=np.float32)
+            self._check_size(len(data._values))
+            chunks.append((len(values), data._values))
+            return
+        if self._names:
+            if not _is_names(data):
+                raise self._drift(data)
+            return
+        if data_type is dict:
+            if self._dict is None:
+                if self._length is not None:
+                    raise self._drift(data)
+                self._compile(data)
+                if self._names:
+                    return
+            self._dict.extract(data, values, chunks)
+        elif data_type is list or data_type is tuple:
+            if self._length is None:
+                if self._dict is not None:
+                    raise self._drift(data)
+                self._compile(data)
+                if self._names:
+                    return
+            if len(data) != self._length:
+                raise ValueError(
+                    f"{len(data)} elements at {self.path} instead of the {self._length} of the plan: "
+                    "the schema drifted"
+                )
+            for el in data:
+                if type(el) is bool or type(el) is int or type(el) is float or el is None:
+                    values.append(el)
+                else:
+                    self._elements.extract(el, values, chunks)
+        elif data is None or isinstance(data, (int, float)):
+            if self._dict is not None or self._length is not None:
+                raise self._drift(data)
+            values.append(data)
+        elif isinstance(data, str):
+            if self.size is not None:
+                raise self._drift(data)
+            self._names = True
+        else:
+            raise ValueError(
+                f"Type {data_type} (with value {data}) at {self.path} is not compatible with FlattenPlan"
+            )
+
+
+class _DictPlan:
+    """
+    Sorted keys of a dict, the consecutive ones holding numbers being read by a
+    single itemgetter.
+    """
+
+    __slots__ = ("keys", "path", "_steps")
+
+    def __init__(self, data: dict, path: str) -> None:
+        self.keys = frozenset(data)
+        self.path = path
+        self._steps = []
+        numbers = []
+        for key in sorted(data.keys()):
+            value = data[key]
+            if value is None or type(value) in (bool, int, float):
+                numbers.append(key)
+                continue
+            if numbers:
+                self._steps.append((itemgetter(*numbers), len(numbers) == 1))
+                numbers = []
+            self._steps.append((key, _PlanNode(f"{path}.{key}")))
+        if numbers:
+            self._steps.append((itemgetter(*numbers), len(numbers) == 1))
+
+    def extract(self, data: dict, values: list, chunks: list) -> None:
+        if data.keys() != self.keys:
+            raise ValueError(
+                f"Keys {sorted(data.keys())} at {self.path} differ from those of the plan "
+                f"{sorted(self.keys)}: the schema drifted"
+            )
+        for step, child in self._steps:
+            if child is True:
+                values.append(step(data))
+            elif child is False:
+                values.extend(step(data))
+            else:
+                child.extract(data[step], values, chunks)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Model manager running the frozen inference graph of a TF1 model.
+
+ModelManagerTF.load restores a training checkpoint into the whole training
+graph: losses, both train steps and the slots of their Adam optimizers are
+restored and kept in memory by every test or actor process, which only ever
+runs the actions. ModelManagerTF.export_frozen writes the graph going from the
+observations to the actions (and optionally the value) alone, with its
+variables turned into constants. A FrozenModelManager imports it into its own
+graph, in a session with a single thread per run: nothing is restored, and
+concurrent predictions run in the threads of feed_async instead.
+"""
+
+from players.base_classes.model_manager_tf import ModelManagerTF, tf
+
+from typing import Sequence, Tuple
+
+import numpy as np
+
+
+def load_frozen_graph(path: str, input_name: str, output_names: Sequence[str]) -> Tuple:
+    """
+    Imports a graph written by ModelManagerTF.export_frozen into a new session.
+
+    Args:
+        path (str): path of the pb file
+
+        input_name (str): name of the placeholder of the observations
+
+        output_names (list of str): names of the ops to read predictions from
+
+    Returns:
+        sess (tf.Session), observations (tf.Tensor), outputs (dict of tf.Tensor by
+        name)
+    """
+    graph_def = tf.GraphDef()
+    with tf.gfile.GFile(path, "rb") as f:
+        graph_def.ParseFromString(f.read())
+
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name="")
+    config = tf.ConfigProto(intra_op_parallelism_threads=1, inter_op_parallelism_threads=1)
+    sess = tf.Session(graph=graph, config=config)
+
+    observations = graph.get_tensor_by_name(input_name + ":0")
+    outputs = {}
+    for name in output_names:
+        try:
+            outputs[name] = graph.get_tensor_by_name(name + ":0")
+        except KeyError:
+            # Only exported with value=True
+            continue
+    return sess, observations, outputs
+
+
+class FrozenModelManager(ModelManagerTF):
+
+    def __init__(self, path: str = None) -> None:
+        """
+        Args:
+            path (str, defaults to None): pb file written by export_frozen. If
+            None, the last one exported in the models directory is loaded.
+        """
+        self.sess = None
+        self.load(path)
+
+    def load(self, name=None) -> None:
+        """
+        Loads a frozen graph, in place of the current one.
+
+        Args:
+            name (str, defaults to None): path of the pb file, or name of an export
+            of the models directory. If None, the last export is loaded.
+        """
+        path = self.exported_file(name, ".pb")
+        sess, self.tf_obs, self._outputs = load_frozen_graph(path, self.INFERENCE_INPUT, self.INFERENCE_OUTPUTS)
+        if self.INFERENCE_OUTPUTS[0] not in self._outputs:
+            sess.close()
+            raise ValueError(f"{path} is not a frozen {self.MODEL_NAME}, {self.INFERENCE_OUTPUTS[0]} is missing")
+        if self.sess is not None:
+            self.sess.close()
+        self.sess = sess
+
+    def predict(self, observation):
+        return self.sess.run(self._outputs[self.INFERENCE_OUTPUTS[0]], feed_dict={self.tf_obs: observation})
+
+    def predict_value(self, observation):
+        if len(self.INFERENCE_OUTPUTS) < 2 or self.INFERENCE_OUTPUTS[1] not in self._outputs:
+            raise ValueError("The value was not exported, export the model with value=True.")
+        return self.sess.run(
+            self._outputs[self.INFERENCE_OUTPUTS[1]], feed_dict={self.tf_obs: observation[np.newaxis, :]}
+        )
+
+    def train(self, observations, actions, wins) -> None:
+        raise NotImplementedError(
+            f"{type(self).__name__} cannot be trained, train a {self.MODEL_NAME} model and export it."
+        )
+
+    def save(self, name=None) -> None:
+        raise NotImplementedError(f"{type(self).__name__} cannot be saved, export a {self.MODEL_NAME} model.")
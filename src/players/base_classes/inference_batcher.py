@@ -0,0 +1,150 @@
+"""
+Micro-batching of model predictions.
+
+Every decision of every concurrent battle asks its model manager for a single
+prediction, and a session run costs about the same for one input as for a few
+dozens. InferenceBatcher gathers the inputs arriving within a short window, or
+until a batch is full, runs the model once on the stacked batch and hands each
+awaiting decision its row of the result.
+
+Given an executor, batches run in its threads. Session runs release the GIL, so
+the event loop keeps reading and sending the messages of the other battles
+meanwhile instead of freezing for the whole inference. When as many batches as
+threads are running, inputs keep gathering until one of them is done rather
+than queueing small batches behind them.
+"""
+
+import asyncio
+import numpy as np
+
+from concurrent.futures import Executor
+from typing import Callable, List, Tuple
+
+
+class InferenceBatcher:
+    """
+    Batches the single inputs given to predict.
+
+    Example:
+        >>> batcher = InferenceBatcher(model.predict, window=0.002, max_batch_size=32)
+        >>> y = await batcher.predict(x)  # x has no batch dimension, nor has y
+    """
+
+    def __init__(
+        self,
+        predict: Callable[[np.ndarray], np.ndarray],
+        *,
+        window: float = 0.002,
+        max_batch_size: int = 32,
+        executor: Executor = None,
+        max_running_batches: int = 1,
+    ) -> None:
+        """
+        Args:
+            predict (callable): predicts a batch of inputs stacked along their
+            first dimension
+
+            window (float, defaults to 0.002): seconds inputs are gathered for after
+            the first one of a batch arrived. 0 runs the inputs given during the
+            same event loop iteration together
+
+            max_batch_size (int, defaults to 32): inputs after which a batch is run
+            without waiting for the end of the window
+
+            executor (Executor, defaults to None): executor running predict. If
+            None, predict runs in the event loop
+
+            max_running_batches (int, defaults to 1): batches run by executor at the
+            same time, usually its number of threads
+        """
+        self._predict = predict
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.executor = executor
+        self.max_running_batches = max_running_batches
+        self._running_batches = 0
+
+        # Inputs waiting for the next batch, with the futures of their results,
+        # and the call running it at the end of the window
+        self._pending: List[Tuple[np.ndarray, asyncio.Future]] = []
+        self._flush_handle = None
+
+        self.batches = 0
+        self.predictions = 0
+
+    async def predict(self, x: np.ndarray) -> np.ndarray:
+        """
+        Returns the prediction of a single input, computed with those of the other
+        inputs given during the window.
+
+        Args:
+            x (np.ndarray): model input, without batch dimension
+
+        Returns:
+            y (np.ndarray): model output, without batch dimension
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.append((x, future))
+        if len(self._pending) >= self.max_batch_size:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self) -> None:
+        """
+        Runs the pending inputs as one batch.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self.executor is not None and self._running_batches >= self.max_running_batches:
+            # Run when a batch is done
+            return
+        pending, self._pending = self._pending, []
+        # Decisions given up on meanwhile do not need a prediction
+        pending = [(x, future) for x, future in pending if not future.cancelled()]
+        if not pending:
+            return
+        batch = np.stack([x for x, _ in pending])
+        self.batches += 1
+        self.predictions += len(pending)
+        if self.executor is None:
+            try:
+                predictions = self._predict(batch)
+            except Exception as e:
+                return self._resolve(pending, error=e)
+            return self._resolve(pending, predictions)
+        self._running_batches += 1
+        running = asyncio.get_event_loop().run_in_executor(self.executor, self._predict, batch)
+
+        def done(running: asyncio.Future) -> None:
+            self._running_batches -= 1
+            if running.cancelled():
+                self._resolve(pending, error=asyncio.CancelledError())
+            elif running.exception() is not None:
+                self._resolve(pending, error=running.exception())
+            else:
+                self._resolve(pending, running.result())
+            if self._pending:
+                self.flush()
+
+        running.add_done_callback(done)
+
+    @staticmethod
+    def _resolve(pending, predictions=None, *, error: Exception = None) -> None:
+        for i, (_, future) in enumerate(pending):
+            if future.cancelled():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(predictions[i])
+
+    @property
+    def mean_batch_size(self) -> float:
+        """
+        float: inputs per batch run so far, 0 if none was
+        """
+        return self.predictions / self.batches if self.batches else 0.0
@@ -10,10 +10,12 @@ advanced topics in artifical intelligence course at Ecole Polytechnique.
 from environment.battle import Battle
 from environment.utils import CONFIG
 from players.base_classes.player import Player
+from players.base_classes.player_pool import PlayerPool
+from players.base_classes.prediction_cache import PredictionCache, invalidates_predictions
 from players.random_random_battle import RandomRandomBattlePlayer
 
 from abc import ABC, abstractmethod
-from random import choices
+from functools import partial
 from typing import Tuple
 
 from keras.models import load_model
@@ -28,6 +30,18 @@ class ModelManager(ABC):
 
     MODEL_NAME = None
 
+    CACHE_SIZE = 4096
+    """int: predictions kept by feed for the states seen again. 0 disables it"""
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        # Predictions of the previous weights are stale once these are done.
+        # Inherited methods are wrapped too, those already wrapped are skipped
+        for name in ("load", "train"):
+            method = getattr(cls, name, None)
+            if method is not None and not getattr(method, "_invalidates_predictions", False):
+                setattr(cls, name, invalidates_predictions(method))
+
     def __init__(self) -> None:
         """
         This method should be rewritten when inherited.
@@ -47,9 +61,23 @@ class ModelManager(ABC):
             moves_predictions (np.array(5,3)), switch_predictions(np.array(5))
         """
         x = self.format_x(x)
-        preds = self.model.predict(np.array([x]))[0]
+        key = self.prediction_cache.key(x)
+        preds = self.prediction_cache.get(key)
+        if preds is None:
+            preds = self.model.predict(np.array([x]))[0]
+            self.prediction_cache.put(key, preds)
         return preds[:15].reshape((5, 3)), preds[-5:]
 
+    @property
+    def prediction_cache(self) -> PredictionCache:
+        """
+        PredictionCache: predictions of feed, emptied when the model is loaded or
+        trained
+        """
+        if getattr(self, "_prediction_cache", None) is None:
+            self._prediction_cache = PredictionCache(self.CACHE_SIZE)
+        return self._prediction_cache
+
     @abstractmethod
     def format_x(self, state: dict):
         """
@@ -64,8 +92,21 @@ class ModelManager(ABC):
         """
         pass
 
+    def format_batch(self, states: list) -> np.ndarray:
+        """
+        Formats battle states into a batch of model inputs, like format_x.
+        You can rewrite this method when a model formats batches faster.
+
+        Args:
+            states (list of dict): battle states, e.g. those of an episode
+
+        Returns:
+            x (np.ndarray): float32 model inputs, of shape (len(states), features)
+        """
+        return np.array([self.format_x(state) for state in states], dtype=np.float32)
+
     async def initial_training(
-        self, number_of_battles=100, concurrent_battles=10, log_messages=False
+        self, number_of_battles=100, concurrent_battles=10, log_messages=False, number_of_pairs=None
     ) -> None:
         """
         Initiate model with training data gathered from random battles.
@@ -74,54 +115,35 @@ class ModelManager(ABC):
             number_of_battles (int, defaults to 100): number of battles to run
 
             concurrent_battles (int, defaults to 10): number of battles to be run 
-            concurrently
+            concurrently by each player
 
             log_messages (bool, defaults to False): wheter to log battles messages
-        """
-        players = [
-            RandomRandomBattlePlayer(
-                authentification_address=CONFIG["authentification_address"],
-                max_concurrent_battles=concurrent_battles,
-                log_messages_in_console=log_messages,
-                mode="challenge",
-                password=CONFIG["users"][0]["password"],
-                server_address=CONFIG["server_address"],
-                target_battles=number_of_battles,
-                to_target=CONFIG["users"][1]["username"],
-                username=CONFIG["users"][0]["username"],
-            ),
-            RandomRandomBattlePlayer(
-                authentification_address=CONFIG["authentification_address"],
-                log_messages_in_console=log_messages,
-                max_concurrent_battles=concurrent_battles,
-                mode="wait",
-                password=CONFIG["users"][1]["password"],
-                server_address=CONFIG["server_address"],
-                target_battles=number_of_battles,
-                username=CONFIG["users"][1]["username"],
-            ),
-        ]
-        to_await = []
-        for player in players:
-            to_await.append(asyncio.ensure_future(player.listen()))
-            to_await.append(asyncio.ensure_future(player.run()))
 
-        for el in to_await:
-            await el
+            number_of_pairs (int, defaults to None): number of account pairs of
+            config.json to spread the battles on. If None, all of them are used
+        """
+        random_player = partial(
+            RandomRandomBattlePlayer,
+            authentification_address=CONFIG["authentification_address"],
+            max_concurrent_battles=concurrent_battles,
+            log_messages_in_console=log_messages,
+            server_address=CONFIG["server_address"],
+        )
+        pool = PlayerPool.from_config(
+            number_of_battles,
+            challenger_factory=random_player,
+            receiver_factory=random_player,
+            number_of_pairs=number_of_pairs,
+        )
+        await pool.run()
 
         print("Initial battles finished.")
 
-        player_0_winning_moves = players[0].winning_moves_data
-        player_1_winning_moves = players[1].winning_moves_data
+        winning_moves = pool.winning_moves_data
+        x = winning_moves.pop("observation")
+        y = winning_moves.pop("action")
 
-        x = player_0_winning_moves.pop("observation") + player_1_winning_moves.pop(
-            "observation"
-        )
-        y = player_0_winning_moves.pop("action") + player_1_winning_moves.pop(
-            "action"
-        )
-
-        del players
+        del pool
 
         self.train(x, y)
 
@@ -149,7 +171,11 @@ class ModelManager(ABC):
             else:
                 self.model = load_model(os.path.join(PATH + "models", self.MODEL_NAME, name))
         else:
-            models = os.listdir(os.path.join(PATH + "models", self.MODEL_NAME))
+            # Skipping the weights exported for NumPy
+            models = [
+                model for model in os.listdir(os.path.join(PATH + "models", self.MODEL_NAME))
+                if not model.endswith(".npz")
+            ]
             if models:
                 self.load(sorted(models)[-1])
             else:
@@ -169,6 +195,8 @@ class ModelManager(ABC):
         server_address: str,
         target_battles: int = 5,
         to_target: str = None,
+        max_pending_challenges: int = None,
+        messages_per_second: float = None,
     ) -> Player:
         """
         Creates an MLRandomBattlePlayer with specified parameters.
@@ -186,6 +214,8 @@ class ModelManager(ABC):
             server_address=server_address,
             target_battles=target_battles,
             to_target=to_target,
+            max_pending_challenges=max_pending_challenges,
+            messages_per_second=messages_per_second,
         )
 
     def train(self, x, y: int) -> None:
@@ -197,9 +227,11 @@ class ModelManager(ABC):
 
             y: move choices, as integers
         """
-        x = np.array([self.format_x(el) for el in x])
-        y_t = np.zeros(shape=(len(y), 20))
-        for i, val in enumerate(y):
+        # Decisions left to random_move have no action to learn
+        kept = [(el, val) for el, val in zip(x, y) if val is not None]
+        x = self.format_batch([el for el, _ in kept])
+        y_t = np.zeros(shape=(len(kept), 20))
+        for i, (_, val) in enumerate(kept):
             y_t[i, val] = 1
         self.model.fit(x, y_t, epochs=3, batch_size=64) # validation_split=.1
         if not os.path.isdir(os.path.join("models", self.MODEL_NAME)):
@@ -211,7 +243,8 @@ class ModelManager(ABC):
         number_of_battles=3,
         concurrent_battles=1,
         log_messages=False,
-        opponent = "random"
+        opponent = "random",
+        number_of_pairs=None,
     ):
         """
         Tests the model against opponent
@@ -220,54 +253,47 @@ class ModelManager(ABC):
             number_of_battles (int, defaults to 100): number of battles to run
 
             concurrent_battles (int, defaults to 10): number of battles to be run 
-            concurrently
+            concurrently by each player
 
             log_messages (bool, defaults to True): wheter to log battles messages
 
             opponent (str, defaults to random): opposing agent
+
+            number_of_pairs (int, defaults to None): number of account pairs of
+            config.json to spread the battles on. If None, all of them are used
         """
         print(f"[DEBUG] Starting test with parameters: number_of_battles={number_of_battles}, concurrent_battles={concurrent_battles}, opponent={opponent}")
-        players = [
-            self.get_player(
+        receiver_factory = None
+        if opponent == "random":
+            receiver_factory = partial(
+                RandomRandomBattlePlayer,
+                authentification_address=CONFIG["authentification_address"],
+                log_messages_in_console=log_messages,
+                max_concurrent_battles=concurrent_battles,
+                server_address=CONFIG["server_address"],
+            )
+        pool = PlayerPool.from_config(
+            number_of_battles,
+            challenger_factory=partial(
+                self.get_player,
                 authentification_address=CONFIG["authentification_address"],
                 epsilon=0.95,
                 max_concurrent_battles=concurrent_battles,
                 log_messages_in_console=log_messages,
-                mode="challenge",
-                password=CONFIG["users"][0]["password"],
                 server_address=CONFIG["server_address"],
-                target_battles=number_of_battles,
-                to_target=CONFIG["users"][1]["username"],
-                username=CONFIG["users"][0]["username"],
-            )]
-
-        if opponent == "random":
-            players.append(
-                RandomRandomBattlePlayer(
-                    authentification_address=CONFIG["authentification_address"],
-                    log_messages_in_console=log_messages,
-                    max_concurrent_battles=concurrent_battles,
-                    mode="wait",
-                    password=CONFIG["users"][1]["password"],
-                    server_address=CONFIG["server_address"],
-                    target_battles=number_of_battles,
-                    username=CONFIG["users"][1]["username"],
-                ))
+            ),
+            receiver_factory=receiver_factory,
+            number_of_pairs=number_of_pairs,
+        )
 
         print("[DEBUG] Starting players...")
-        to_await = []
-        for player in players:
-            to_await.append(asyncio.ensure_future(player.listen()))
-            to_await.append(asyncio.ensure_future(player.run()))
-
         print("[DEBUG] Waiting for battles to complete...")
-        for el in to_await:
-            await el
+        await pool.run()
 
-        winning_rate = players[0].winning_rate
+        winning_rate = pool.winning_rate
         print(f"[DEBUG] Test completed. Winning rate: {winning_rate}")
 
-        del players
+        del pool
 
         return winning_rate
     
@@ -277,6 +303,7 @@ class ModelManager(ABC):
         number_of_battles=100,
         concurrent_battles=10,
         log_messages=True,
+        number_of_pairs=None,
     ):
         """
         Trains the model with data gathered from self vs. self battles.
@@ -285,61 +312,42 @@ class ModelManager(ABC):
             number_of_battles (int, defaults to 100): number of battles to run
 
             concurrent_battles (int, defaults to 10): number of battles to be run 
-            concurrently
+            concurrently by each player
 
             log_messages (bool, defaults to True): wheter to log battles messages
+
+            number_of_pairs (int, defaults to None): number of account pairs of
+            config.json to spread the battles on. If None, all of them are used
         """
+        ml_player = partial(
+            self.get_player,
+            authentification_address=CONFIG["authentification_address"],
+            epsilon=0.95,
+            max_concurrent_battles=concurrent_battles,
+            log_messages_in_console=log_messages,
+            server_address=CONFIG["server_address"],
+        )
         for i in range(iterations):
-            players = [
-                self.get_player(
-                    authentification_address=CONFIG["authentification_address"],
-                    epsilon=0.95,
-                    max_concurrent_battles=concurrent_battles,
-                    log_messages_in_console=log_messages,
-                    mode="challenge",
-                    password=CONFIG["users"][0]["password"],
-                    server_address=CONFIG["server_address"],
-                    target_battles=number_of_battles,
-                    to_target=CONFIG["users"][1]["username"],
-                    username=CONFIG["users"][0]["username"],
-                ),
-                self.get_player(
-                    authentification_address=CONFIG["authentification_address"],
-                    epsilon=0.95,
-                    log_messages_in_console=log_messages,
-                    max_concurrent_battles=concurrent_battles,
-                    mode="wait",
-                    password=CONFIG["users"][1]["password"],
-                    server_address=CONFIG["server_address"],
-                    target_battles=number_of_battles,
-                    username=CONFIG["users"][1]["username"],
-                ),
-            ]
-            to_await = []
-            for player in players:
-                to_await.append(asyncio.ensure_future(player.listen()))
-                to_await.append(asyncio.ensure_future(player.run()))
-
-            for el in to_await:
-                await el
+            pool = PlayerPool.from_config(
+                number_of_battles,
+                challenger_factory=ml_player,
+                receiver_factory=ml_player,
+                number_of_pairs=number_of_pairs,
+            )
+            await pool.run()
 
             print(f"Round {i + 1} out of {iterations} of self training finished.")
-            perf = await self.test()
+            perf = await self.test(number_of_pairs=number_of_pairs)
             print(f"Performance: {perf}")
 
-            x = (
-                players[0].winning_moves_data["observation"]
-                + players[1].winning_moves_data["observation"]
-            )
-            y = (
-                players[0].winning_moves_data["action"]
-                + players[1].winning_moves_data["action"]
-            )
+            winning_moves = pool.winning_moves_data
+            x = winning_moves["observation"]
+            y = winning_moves["action"]
 
-            b = list(players[0].observations.keys())[0]
-            print(players[0].observations[b][26])
+            b = list(pool.observations.keys())[0]
+            print(pool.observations[b][26])
 
-            del players
+            del pool
 
             self.train(x, y)
 
@@ -360,6 +368,8 @@ class _MLRandomBattlePlayer(Player):
         server_address: str,
         target_battles: int = 5,
         to_target: str = None,
+        max_pending_challenges: int = None,
+        messages_per_second: float = None,
     ) -> None:
         super(_MLRandomBattlePlayer, self).__init__(
             authentification_address=authentification_address,
@@ -373,14 +383,13 @@ class _MLRandomBattlePlayer(Player):
             target_battles=target_battles,
             to_target=to_target,
             username=username,
+            max_pending_challenges=max_pending_challenges,
+            messages_per_second=messages_per_second,
         )
         self.epsilon = epsilon
         self.model_manager = model_manager
 
     async def select_move(self, battle: Battle, *, trapped: bool = False):
-        # The state will be stored, but not directly used.
-        state = battle.dic_state
-
         # Our base ml model generates an array of size 20
 
         # The 15 first values correspond to move probabilities
@@ -397,106 +406,25 @@ class _MLRandomBattlePlayer(Player):
         # The third value refers to using the move and mega-evolving
 
         if np.random.rand() < self.epsilon:
-            moves_probs, switch_probs = self.model_manager.feed(state)
+            moves_probs, switch_probs = self.model_manager.feed(battle.dic_state)
         else:
             moves_probs, switch_probs = np.random.rand(5, 3), np.random.rand(5)
 
-        commands = []  # Will contain the equivalent commands
-
-        # Pokemon species as key, order id as value
-        available_switches = {
-            battle._player_team[el[1][4:]].species: el[0]
-            for el in battle.available_switches
-        }
-
-        # Move name as key, order id as value
-        available_moves = {
-            el[1]["id"].lower().replace(" ", ""): el[0] for el in battle.available_moves if "id" in el[1]
-        }
-
-        # Move names
-        available_z_moves = []
-
-        # TODO : check
-        if battle.can_z_move:
-            for move, can_z in zip(battle.active_moves, battle.can_z_move):
-                if can_z:
-                    available_z_moves.append(move)
-
-        # Setting pokemon switches information
-        for i, pokemon in enumerate(battle.player_back):
-            if pokemon not in available_switches:
-                commands.append("")
-                switch_probs[i] = 0
-            else:
-                commands.append(f"/switch {available_switches[pokemon]}")
-
-        if trapped:
-            switch_probs[:] = 0
-
-        # TODO : check
-        for i in range(len(battle.player_back), 5):
-            commands.append("")
-            switch_probs[i] = 0
-
-        # Setting attacks information
-        for j, move in enumerate(battle.active_moves):
-            move_id = move.lower().replace(" ", "")
-            if move_id not in available_moves:
-                commands.append("")
-                commands.append("")
-                commands.append("")
-                moves_probs[j, :] = 0
-            else:
-                if move_id not in available_z_moves:
-                    moves_probs[j, 1] = 0
-                if not battle.can_mega_evolve:
-                    moves_probs[j, 2] = 0
-                # 正しいフォーマットでコマンド生成（ターゲット指定なし）
-                commands.append(f"/choose move {move_id}")
-                commands.append(f"/choose move {move_id} zmove")
-                commands.append(f"/choose move {move_id} mega")
-
-        for i in range(len(battle.active_moves), 4):
-            moves_probs[i, :] = 0
-            commands.append("")
-            commands.append("")
-            commands.append("")
-
-        if "struggle" in available_moves:
-            commands.append(f"/choose move struggle")
-        elif "recharge" in available_moves:
-            commands.append(f"/choose move recharge")
-        else:
-            moves_probs[4, 0] = 0
-        commands.append("")
-        commands.append("")
-        moves_probs[4, 1:] = 0
-
-        probs = []
-        for i, p in enumerate(switch_probs):
-            probs.append(p)
-
-        for i, prob in enumerate(moves_probs):
-            p, z, m = prob
-            probs.append(p)
-            probs.append(z)
-            probs.append(m)
-
-        probs = np.array(probs)
-        if sum(probs):
-            probs /= sum(probs)
-            choice = choices([i for i, val in enumerate(probs)], probs)[0]
-            # battle.record_move(state, choice)
-            try:
-                if commands[choice] == "":
-                    raise ValueError("wtf message")
-                await self.send_room_message(
-                    message=commands[choice],
-                    room=battle.battle_tag,
-                )
-                return choice
-            except (ValueError, IndexError) as e:
-                await self.random_move(battle, trapped=trapped)
-        else:
+        # Switches first, then moves, as ordered by Battle.action_mask
+        probs = np.concatenate((np.ravel(switch_probs), np.ravel(moves_probs)))
+        probs = np.where(battle.action_mask(trapped=trapped), probs, 0)
+        cumulative = np.cumsum(probs)
+        command = None
+        # NaN predictions are not a distribution either
+        if cumulative[-1] > 0:
+            choice = int(np.searchsorted(cumulative, np.random.rand() * cumulative[-1], side="right"))
+            command = battle.action_command(choice)
+        if command is None:
+            # Not a choice of the model: recorded as None, which training skips
             await self.random_move(battle, trapped=trapped)
+            return None
+        await self.send_room_message(
+            message=command,
+            room=battle.battle_tag,
+        )
+        return choice
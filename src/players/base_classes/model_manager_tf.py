@@ -9,14 +9,22 @@ advanced topics in artifical intelligence course at Ecole Polytechnique.
 
 from environment.battle import Battle
 from environment.utils import CONFIG
+from players.base_classes.inference_batcher import InferenceBatcher
 from players.base_classes.player import Player
+from players.base_classes.player_pool import PlayerPool
+from players.base_classes.prediction_cache import PredictionCache, invalidates_predictions
 from players.random_random_battle import RandomRandomBattlePlayer
 
 from abc import ABC, abstractmethod
-from random import choices
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Tuple
 
-import tensorflow as tf
+try:
+    import tensorflow as tf
+except ImportError:
+    # Models running exported weights, like NumpyPolicyNetwork, do without it
+    tf = None
 
 import asyncio
 import numpy as np
@@ -32,6 +40,33 @@ class ModelManagerTF(ABC):
 
     MODEL_NAME = None
 
+    BATCH_WINDOW = 0.002
+    """float: seconds feed_async requests are gathered for before being run together"""
+
+    MAX_BATCH_SIZE = 32
+    """int: feed_async requests after which a batch is run without waiting"""
+
+    INFERENCE_THREADS = 2
+    """int: threads running the batches of feed_async, off the event loop. 0 runs them in it"""
+
+    INFERENCE_INPUT = None
+    """str: name of the placeholder of the observations, for export_frozen"""
+
+    INFERENCE_OUTPUTS = ()
+    """Tuple of str: names of the ops predictions are read from, actions first, for export_frozen"""
+
+    CACHE_SIZE = 4096
+    """int: predictions kept by feed and feed_async for the states seen again. 0 disables it"""
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        # Predictions of the previous weights are stale once these are done.
+        # Inherited methods are wrapped too, those already wrapped are skipped
+        for name in ("load", "train"):
+            method = getattr(cls, name, None)
+            if method is not None and not getattr(method, "_invalidates_predictions", False):
+                setattr(cls, name, invalidates_predictions(method))
+
     def __init__(self) -> None:
         """
         This method should be rewritten when inherited.
@@ -52,9 +87,76 @@ class ModelManagerTF(ABC):
             moves_predictions (np.array(5,3)), switch_predictions(np.array(5))
         """
         x = self.format_x(x)
-        preds = self.predict(np.array([x]))[0]
+        key = self.prediction_cache.key(x)
+        preds = self.prediction_cache.get(key)
+        if preds is None:
+            preds = self.predict(np.array([x]))[0]
+            self.prediction_cache.put(key, preds)
+        return preds[:15].reshape((5, 3)), preds[-5:]
+
+    async def feed_async(self, x: dict) -> Tuple[np.array, np.array]:
+        """
+        Return move probabilities from battle state, like feed, predicted in one
+        batch with the other requests of concurrent battles.
+
+        Args:
+            x (dict): battle state to be transformed
+
+        Returns:
+            moves_predictions (np.array(5,3)), switch_predictions(np.array(5))
+        """
+        x = self.format_x(x)
+        key = self.prediction_cache.key(x)
+        preds = self.prediction_cache.get(key)
+        if preds is None:
+            preds = await self.batcher.predict(x)
+            self.prediction_cache.put(key, preds)
         return preds[:15].reshape((5, 3)), preds[-5:]
 
+    @property
+    def batcher(self) -> InferenceBatcher:
+        """
+        InferenceBatcher: batches the predictions of feed_async, created on first
+        use since subclasses do not call __init__
+        """
+        if getattr(self, "_batcher", None) is None:
+            self._batcher = InferenceBatcher(
+                self.predict,
+                window=self.BATCH_WINDOW,
+                max_batch_size=self.MAX_BATCH_SIZE,
+                executor=ThreadPoolExecutor(
+                    max_workers=self.INFERENCE_THREADS, thread_name_prefix=f"{self.MODEL_NAME}-inference"
+                ) if self.INFERENCE_THREADS else None,
+                max_running_batches=max(self.INFERENCE_THREADS, 1),
+            )
+        return self._batcher
+
+    @property
+    def prediction_cache(self) -> PredictionCache:
+        """
+        PredictionCache: predictions of feed and feed_async, emptied when the
+        weights are loaded or trained
+        """
+        if getattr(self, "_prediction_cache", None) is None:
+            self._prediction_cache = PredictionCache(self.CACHE_SIZE)
+        return self._prediction_cache
+
+    def set_batching(self, window: float = None, max_batch_size: int = None) -> None:
+        """
+        Configures the batching of feed_async.
+
+        Args:
+            window (float, defaults to None): seconds requests are gathered for. If
+            None, it is left unchanged
+
+            max_batch_size (int, defaults to None): requests after which a batch is
+            run. If None, it is left unchanged
+        """
+        if window is not None:
+            self.batcher.window = window
+        if max_batch_size is not None:
+            self.batcher.max_batch_size = max_batch_size
+
     @abstractmethod
     def format_x(self, state: dict):
         """
@@ -69,8 +171,21 @@ class ModelManagerTF(ABC):
         """
         pass
 
+    def format_batch(self, states: list) -> np.ndarray:
+        """
+        Formats battle states into a batch of model inputs, like format_x.
+        You can rewrite this method when a model formats batches faster.
+
+        Args:
+            states (list of dict): battle states, e.g. those of an episode
+
+        Returns:
+            x (np.ndarray): float32 model inputs, of shape (len(states), features)
+        """
+        return np.array([self.format_x(state) for state in states], dtype=np.float32)
+
     async def initial_training(
-        self, number_of_battles=100, concurrent_battles=10, log_messages=False
+        self, number_of_battles=100, concurrent_battles=10, log_messages=False, number_of_pairs=None
     ) -> None:
         """
         Initiate model with training data gathered from random battles.
@@ -79,57 +194,48 @@ class ModelManagerTF(ABC):
             number_of_battles (int, defaults to 100): number of battles to run
 
             concurrent_battles (int, defaults to 10): number of battles to be run 
-            concurrently
+            concurrently by each player
 
             log_messages (bool, defaults to False): wheter to log battles messages
+
+            number_of_pairs (int, defaults to None): number of account pairs of
+            config.json to spread the battles on. If None, all of them are used
         """
-        players = [
-            RandomRandomBattlePlayer(
-                authentification_address=CONFIG["authentification_address"],
-                max_concurrent_battles=concurrent_battles,
-                log_messages_in_console=log_messages,
-                mode="challenge",
-                password=CONFIG["users"][0]["password"],
-                server_address=CONFIG["server_address"],
-                target_battles=number_of_battles,
-                to_target=CONFIG["users"][1]["username"],
-                username=CONFIG["users"][0]["username"],
-            ),
-            RandomRandomBattlePlayer(
-                authentification_address=CONFIG["authentification_address"],
-                log_messages_in_console=log_messages,
-                max_concurrent_battles=concurrent_battles,
-                mode="wait",
-                password=CONFIG["users"][1]["password"],
-                server_address=CONFIG["server_address"],
-                target_battles=number_of_battles,
-                username=CONFIG["users"][1]["username"],
-            ),
-        ]
-        to_await = []
-        for player in players:
-            to_await.append(asyncio.ensure_future(player.listen()))
-            to_await.append(asyncio.ensure_future(player.run()))
-
-        for el in to_await:
-            await el
+        random_player = partial(
+            RandomRandomBattlePlayer,
+            authentification_address=CONFIG["authentification_address"],
+            max_concurrent_battles=concurrent_battles,
+            log_messages_in_console=log_messages,
+            server_address=CONFIG["server_address"],
+        )
+        pool = PlayerPool.from_config(
+            number_of_battles,
+            challenger_factory=random_player,
+            receiver_factory=random_player,
+            number_of_pairs=number_of_pairs,
+        )
+        await pool.run()
 
         print("Initial battles finished.")
-        
-        for player in players:
-            self.train(
-                player.observations,
-                player.actions,
-                player.wins
-            )
 
-        del players
+        self.train(
+            pool.observations,
+            pool.actions,
+            pool.wins
+        )
+
+        del pool
 
     def close(self) -> None:
         """
-        Closes TF session
+        Closes TF session, and the threads running its predictions
         """
-        self.sess.close()
+        if getattr(self, "_batcher", None) is not None:
+            if self._batcher.executor is not None:
+                self._batcher.executor.shutdown()
+            self._batcher = None
+        if self.sess is not None:
+            self.sess.close()
 
     def load(self, name=None) -> None:
         """
@@ -175,6 +281,8 @@ class ModelManagerTF(ABC):
         server_address: str,
         target_battles: int = 5,
         to_target: str = None,
+        max_pending_challenges: int = None,
+        messages_per_second: float = None,
     ) -> Player:
         """
         Creates an MLRandomBattlePlayer with specified parameters.
@@ -192,6 +300,8 @@ class ModelManagerTF(ABC):
             server_address=server_address,
             target_battles=target_battles,
             to_target=to_target,
+            max_pending_challenges=max_pending_challenges,
+            messages_per_second=messages_per_second,
         )
 
     def save(self, name=None) -> None:
@@ -204,6 +314,84 @@ class ModelManagerTF(ABC):
             os.makedirs(os.path.join("models", self.MODEL_NAME))
         tf.train.Saver().save(self.sess, os.path.join("models", self.MODEL_NAME, name))
 
+    def export_frozen(self, name=None, value: bool = False) -> str:
+        """
+        Exports the graph of the model for inference only: variables are frozen
+        into constants, and everything the actions (and the value, if asked) do
+        not depend on, like losses, optimizers and their slots, is pruned. The
+        export is loaded by a FrozenModelManager, and checked to predict like the
+        session.
+
+        Args:
+            name (str, defaults to None): name of the export in the models
+            directory. If None, the current timestamp is used.
+
+            value (bool, defaults to False): whether to keep the outputs after the
+            actions, like the value of the state
+
+        Returns:
+            path (str): path of the pb file
+        """
+        if self.INFERENCE_INPUT is None or not self.INFERENCE_OUTPUTS:
+            raise ValueError(f"{type(self).__name__} does not name the tensors of its inference graph.")
+        if name is None:
+            name = str(int(time.time()))
+        directory = os.path.join("models", self.MODEL_NAME)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        outputs = list(self.INFERENCE_OUTPUTS if value else self.INFERENCE_OUTPUTS[:1])
+        graph_def = tf.graph_util.convert_variables_to_constants(
+            self.sess, self.sess.graph.as_graph_def(), outputs
+        )
+        graph_def = tf.graph_util.remove_training_nodes(graph_def, protected_nodes=outputs)
+        tf.io.write_graph(graph_def, directory, name + ".pb", as_text=False)
+        path = os.path.join(directory, name + ".pb")
+
+        # Imported here, it builds on this module
+        from players.base_classes.frozen_model_manager import load_frozen_graph
+
+        observations = self.sess.graph.get_tensor_by_name(self.INFERENCE_INPUT + ":0")
+        x = np.random.RandomState(0).uniform(0, 1, (64, observations.shape[1])).astype(np.float32)
+        frozen_sess, frozen_observations, frozen_outputs = load_frozen_graph(path, self.INFERENCE_INPUT, outputs)
+        try:
+            for output in outputs:
+                np.testing.assert_allclose(
+                    frozen_sess.run(frozen_outputs[output], feed_dict={frozen_observations: x}),
+                    self.sess.run(self.sess.graph.get_tensor_by_name(output + ":0"), feed_dict={observations: x}),
+                    rtol=1e-5,
+                    atol=1e-6,
+                )
+        finally:
+            frozen_sess.close()
+        return path
+
+    def exported_file(self, name=None, extension: str = ".npz") -> str:
+        """
+        Returns the path of an export of the model.
+
+        Args:
+            name (str, defaults to None): path of the export, or name of an export
+            of the models directory. If None, the last export is returned.
+
+            extension (str, defaults to ".npz"): extension of the exports
+
+        Returns:
+            path (str): path of the export
+        """
+        directory = os.path.join("models", self.MODEL_NAME)
+        if name is None:
+            exports = sorted(
+                (os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(extension)),
+                key=os.path.getmtime,
+            ) if os.path.isdir(directory) else []
+            if not exports:
+                raise ValueError("No exported models to load were found.")
+            return exports[-1]
+        if os.path.isfile(name):
+            return name
+        return os.path.join(directory, name if name.endswith(extension) else name + extension)
+
     @abstractmethod
     def predict(self, x):
         """
@@ -235,7 +423,8 @@ class ModelManagerTF(ABC):
         number_of_battles=50,
         concurrent_battles=5,
         log_messages=False,
-        opponent = "random"
+        opponent = "random",
+        number_of_pairs=None,
     ):
         """
         Tests the model against a random player.
@@ -244,36 +433,29 @@ class ModelManagerTF(ABC):
             number_of_battles (int, defaults to 50): number of battles to run
 
             concurrent_battles (int, defaults to 5): number of battles to be run 
-            concurrently
+            concurrently by each player
 
             log_messages (bool, defaults to False): wheter to log battles messages
+
+            number_of_pairs (int, defaults to None): number of account pairs of
+            config.json to spread the battles on. If None, all of them are used
         """
         try:
-            players = [
-                self.get_player(
-                    authentification_address=CONFIG["authentification_address"],
-                    epsilon=0.95,
-                    log_messages_in_console=log_messages,
-                    max_concurrent_battles=concurrent_battles,
-                    mode="challenge",
-                    password=CONFIG["users"][0]["password"],
-                    server_address=CONFIG["server_address"],
-                    target_battles=number_of_battles,
-                    to_target=CONFIG["users"][1]["username"],
-                    username=CONFIG["users"][0]["username"],
-                ),
-                self.get_player(
-                    authentification_address=CONFIG["authentification_address"],
-                    epsilon=0.95,
-                    log_messages_in_console=log_messages,
-                    max_concurrent_battles=concurrent_battles,
-                    mode="wait",
-                    password=CONFIG["users"][1]["password"],
-                    server_address=CONFIG["server_address"],
-                    target_battles=number_of_battles,
-                    username=CONFIG["users"][1]["username"],
-                )
-            ]
+            ml_player = partial(
+                self.get_player,
+                authentification_address=CONFIG["authentification_address"],
+                epsilon=0.95,
+                log_messages_in_console=log_messages,
+                max_concurrent_battles=concurrent_battles,
+                server_address=CONFIG["server_address"],
+            )
+            pool = PlayerPool.from_config(
+                number_of_battles,
+                challenger_factory=ml_player,
+                receiver_factory=ml_player,
+                number_of_pairs=number_of_pairs,
+            )
+            players = pool.players
 
             to_await = []
             for player in players:
@@ -300,7 +482,7 @@ class ModelManagerTF(ABC):
 
             # 勝率の計算
             try:
-                winning_rate = players[0].winning_rate
+                winning_rate = pool.winning_rate
                 if winning_rate is None:
                     print("[WARNING] No battles completed, returning 0.0")
                     winning_rate = 0.0
@@ -315,7 +497,7 @@ class ModelManagerTF(ABC):
                 except Exception as e:
                     print(f"[ERROR] Error while closing player: {e}")
             
-            del players
+            del players, pool
 
             return winning_rate
             
@@ -330,7 +512,8 @@ class ModelManagerTF(ABC):
         concurrent_battles=10,
         testing_step=1,
         log_messages=True,
-        display=True
+        display=True,
+        number_of_pairs=None,
     ):
         """
         Trains the model with data gathered from self vs. self battles.
@@ -339,69 +522,52 @@ class ModelManagerTF(ABC):
             number_of_battles (int, defaults to 100): number of battles to run
 
             concurrent_battles (int, defaults to 10): number of battles to be run 
-            concurrently
+            concurrently by each player
 
             log_messages (bool, defaults to True): wheter to log battles messages
+
+            number_of_pairs (int, defaults to None): number of account pairs of
+            config.json to spread the battles on. If None, all of them are used
         """
+        ml_player = partial(
+            self.get_player,
+            authentification_address=CONFIG["authentification_address"],
+            epsilon=0.95,
+            log_messages_in_console=log_messages,
+            max_concurrent_battles=concurrent_battles,
+            server_address=CONFIG["server_address"],
+        )
         perf_record = []
         print(f"\n{'='*10} STARTING LOOP {'='*10}\n")
         print(f"{'-'*10} Testing {'-'*10}")
-        perf = await self.test(number_of_battles=20)
+        perf = await self.test(number_of_battles=20, number_of_pairs=number_of_pairs)
         perf_record.append(perf)
         print(f"\n{'*'*15} Performance: {perf*100:2.1f}% {'*'*15}\n")
         for i in range(iterations):
             print(f"\n{'='*10} STARTING ITERATION {i+1} {'='*10}\n")
-            players = [
-                self.get_player(
-                    authentification_address=CONFIG["authentification_address"],
-                    epsilon=0.95,
-                    max_concurrent_battles=concurrent_battles,
-                    log_messages_in_console=log_messages,
-                    mode="challenge",
-                    password=CONFIG["users"][0]["password"],
-                    server_address=CONFIG["server_address"],
-                    target_battles=number_of_battles,
-                    to_target=CONFIG["users"][1]["username"],
-                    username=CONFIG["users"][0]["username"],
-                ),
-                self.get_player(
-                    authentification_address=CONFIG["authentification_address"],
-                    epsilon=0.95,
-                    log_messages_in_console=log_messages,
-                    max_concurrent_battles=concurrent_battles,
-                    mode="wait",
-                    password=CONFIG["users"][1]["password"],
-                    server_address=CONFIG["server_address"],
-                    target_battles=number_of_battles,
-                    username=CONFIG["users"][1]["username"],
-                ),
-            ]
-
-            to_await = []
-            for player in players:
-                to_await.append(asyncio.ensure_future(player.listen()))
-                print("player.listen()終了")
-                to_await.append(asyncio.ensure_future(player.run()))
-                print("player.run()終了")
+            pool = PlayerPool.from_config(
+                number_of_battles,
+                challenger_factory=ml_player,
+                receiver_factory=ml_player,
+                number_of_pairs=number_of_pairs,
+            )
 
             print(f"{'-'*10} Fighting {'-'*10}")
-            for el in to_await:
-                await el
+            await pool.run()
 
             print(f"{'-'*10} Training {'-'*10}")
-            for player in players:
-                self.train(
-                    player.observations,
-                    player.actions,
-                    player.wins
-                )
+            self.train(
+                pool.observations,
+                pool.actions,
+                pool.wins
+            )
             if (i+1)%testing_step == 0:
                 print(f"{'-'*10} Testing {'-'*10}")
-                perf = await self.test(number_of_battles=20)
+                perf = await self.test(number_of_battles=20, number_of_pairs=number_of_pairs)
                 perf_record.append(perf)
                 print(f"\n{'*'*15} Performance: {perf*100:2.1f}% {'*'*15}\n")
             
-            del players
+            del pool
         
         if display:
             window = 5
@@ -419,6 +585,10 @@ class ModelManagerTF(ABC):
 
 
 class _MLRandomBattlePlayer(Player):
+
+    MAX_DECISIONS_IN_FLIGHT = ModelManagerTF.MAX_BATCH_SIZE
+    """int: decisions computed at the same time, which bounds the batches of feed_async"""
+
     def __init__(
         self,
         username: str,
@@ -434,6 +604,8 @@ class _MLRandomBattlePlayer(Player):
         server_address: str,
         target_battles: int = 5,
         to_target: str = None,
+        max_pending_challenges: int = None,
+        messages_per_second: float = None,
     ) -> None:
         super().__init__(
             username=username,
@@ -447,15 +619,14 @@ class _MLRandomBattlePlayer(Player):
             format="gen9randombattle",
             max_concurrent_battles=max_concurrent_battles,
             target_battles=target_battles,
-            to_target=to_target
+            to_target=to_target,
+            max_pending_challenges=max_pending_challenges,
+            messages_per_second=messages_per_second,
         )
         self._epsilon = epsilon
         self._model_manager = model_manager
 
     async def select_move(self, battle: Battle, *, trapped: bool = False):
-        # The state will be stored, but not directly used.
-        state = battle.dic_state
-
         # Our base ml model generates an array of size 20
 
         # The 15 first values correspond to move probabilities
@@ -472,108 +643,25 @@ class _MLRandomBattlePlayer(Player):
         # The third value refers to using the move and mega-evolving
 
         if np.random.rand() < self._epsilon:
-            moves_probs, switch_probs = self._model_manager.feed(state)
+            moves_probs, switch_probs = await self._model_manager.feed_async(battle.dic_state)
         else:
             moves_probs, switch_probs = np.random.rand(5, 3), np.random.rand(5)
 
-        commands = []  # Will contain the equivalent commands
-
-        # Pokemon species as key, order id as value
-        available_switches = {}
-        for el in battle.available_switches:
-            key = el[1]
-            if key in battle._player_team:
-                available_switches[battle._player_team[key].species] = el[0]
-            else:
-                print(f"[ERROR] Key not found in _player_team: {key}")
-
-        # Move name as key, order id as value
-        available_moves = {
-            el[1]["id"].lower().replace(" ", ""): el[0] for el in battle.available_moves if "id" in el[1]
-        }
-
-        # Move names
-        available_z_moves = []
-
-        # TODO : check
-        if battle.can_z_move:
-            for move, can_z in zip(battle.active_moves, battle.can_z_move):
-                if can_z:
-                    available_z_moves.append(move)
-
-        # Setting pokemon switches information
-        for i, pokemon in enumerate(battle.player_back):
-            if pokemon.lower() not in available_switches:
-                commands.append("")
-                switch_probs[i] = 0
-            else:
-                commands.append(f"/switch {available_switches[pokemon.lower()]}")
-
-        if trapped:
-            switch_probs[:] = 0
-
-        # TODO : check
-        for i in range(len(battle.player_back), 5):
-            commands.append("")
-            switch_probs[i] = 0
-
-        # Setting attacks information
-        for j, move in enumerate(battle.active_moves):
-            move_id = move.lower().replace(" ", "")
-            if move_id not in available_moves:
-                commands.append("")
-                commands.append("")
-                commands.append("")
-                moves_probs[j, :] = 0
-            else:
-                if move_id not in available_z_moves:
-                    moves_probs[j, 1] = 0
-                if not battle.can_mega_evolve:
-                    moves_probs[j, 2] = 0
-                # 正しいフォーマットでコマンド生成（ターゲット指定なし）
-                commands.append(f"/choose move {move_id}")
-                commands.append(f"/choose move {move_id} zmove")
-                commands.append(f"/choose move {move_id} mega")
-
-        for i in range(len(battle.active_moves), 4):
-            moves_probs[i, :] = 0
-            commands.append("")
-            commands.append("")
-            commands.append("")
-
-        if "struggle" in available_moves:
-            commands.append(f"/choose move struggle")
-        elif "recharge" in available_moves:
-            commands.append(f"/choose move recharge")
-        else:
-            moves_probs[4, 0] = 0
-        commands.append("")
-        commands.append("")
-        moves_probs[4, 1:] = 0
-
-        probs = []
-        for i, p in enumerate(switch_probs):
-            probs.append(p)
-
-        for i, prob in enumerate(moves_probs):
-            p, z, m = prob
-            probs.append(p)
-            probs.append(z)
-            probs.append(m)
-
-        probs = np.array(probs)
-        if sum(probs):
-            probs /= sum(probs)
-            choice = choices([i for i, val in enumerate(probs)], probs)[0]
-            try:
-                if commands[choice] == "":
-                    raise ValueError("wtf message")
-                await self.send_room_message(
-                    message=commands[choice],
-                    room=battle.battle_tag,
-                )
-                return choice
-            except (ValueError, IndexError) as e:
-                return await self.random_move(battle, trapped=trapped)
-        else:
-            return await self.random_move(battle, trapped=trapped)
+        # Switches first, then moves, as ordered by Battle.action_mask
+        probs = np.concatenate((np.ravel(switch_probs), np.ravel(moves_probs)))
+        probs = np.where(battle.action_mask(trapped=trapped), probs, 0)
+        cumulative = np.cumsum(probs)
+        command = None
+        # NaN predictions are not a distribution either
+        if cumulative[-1] > 0:
+            choice = int(np.searchsorted(cumulative, np.random.rand() * cumulative[-1], side="right"))
+            command = battle.action_command(choice)
+        if command is None:
+            # Not a choice of the model: recorded as None, which training skips
+            await self.random_move(battle, trapped=trapped)
+            return None
+        await self.send_room_message(
+            message=command,
+            room=battle.battle_tag,
+        )
+        return choice
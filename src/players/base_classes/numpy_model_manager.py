@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Model manager running the exported weights of a model with NumPy.
+
+Models are trained with TensorFlow or keras, then their weights can be exported
+to an npz file of the models directory. A NumpyModelManager loads such an
+export and predicts with NumPy only, optionally in reduced precision, so that
+players can be run without importing TensorFlow nor keras. It cannot be
+trained: training stays with the model it was exported from.
+"""
+
+from players.base_classes.model_manager_tf import ModelManagerTF
+from players.base_classes.quantized_dense import PRECISIONS, QuantizedDense
+
+from abc import abstractmethod
+
+import numpy as np
+
+
+class NumpyModelManager(ModelManagerTF):
+
+    WEIGHTS = None
+    """List of str: arrays an export must contain"""
+
+    BATCH_WINDOW = 0.0
+    """float: predictions take microseconds, only those asked together are batched"""
+
+    INFERENCE_THREADS = 0
+    """int: predictions run in the event loop, a thread would cost more than them"""
+
+    def __init__(self, path: str = None, precision: str = "float32") -> None:
+        """
+        Args:
+            path (str, defaults to None): npz file written by the export of the
+            model. If None, the last one exported in the models directory is loaded.
+
+            precision (str, defaults to "float32"): precision the weights are kept
+            in, one of quantized_dense.PRECISIONS. Reduced precisions take less
+            memory at the cost of slightly different predictions
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision}, expected one of {PRECISIONS}")
+        self.sess = None
+        self.precision = precision
+        self.load(path)
+
+    @abstractmethod
+    def build(self, weights: dict) -> None:
+        """
+        Builds the layers of the model from the exported weights.
+        You should rewrite this method when inherited.
+
+        Args:
+            weights (dict): float32 arrays of the export, by name
+        """
+        pass
+
+    def load(self, name=None) -> None:
+        """
+        Loads exported weights.
+
+        Args:
+            name (str, defaults to None): path of the npz file, or name of an export
+            of the models directory. If None, the last export is loaded.
+        """
+        name = self.exported_file(name, ".npz")
+        with np.load(name) as export:
+            missing = [w for w in self.WEIGHTS if w not in export]
+            if missing:
+                raise ValueError(f"{name} is not an exported {self.MODEL_NAME}, missing {missing}")
+            weights = {w: export[w].astype(np.float32) for w in self.WEIGHTS}
+        self.build(weights)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        int: memory taken by the weights of the model
+        """
+        return sum(layer.nbytes for layer in vars(self).values() if isinstance(layer, QuantizedDense))
+
+    def train(self, observations, actions, wins) -> None:
+        raise NotImplementedError(
+            f"{type(self).__name__} cannot be trained, train a {self.MODEL_NAME} model and export it."
+        )
+
+    def save(self, name=None) -> None:
+        raise NotImplementedError(f"{type(self).__name__} cannot be saved, export a {self.MODEL_NAME} model.")
@@ -1,17 +1,40 @@
 import asyncio
-import json
+import heapq
+import itertools
 import numpy as np
+import time
+import websockets
 
 from abc import ABC, abstractmethod
-from random import choices
+from collections import Counter
+from random import choice
 from threading import Thread
-from typing import List
+from typing import List, Union
 
 from environment.battle import Battle
+from environment.request import Request
+from environment.utils import to_id
 from players.base_classes.player_network import PlayerNetwork
+from players.base_classes.rate_limiter import SHOWDOWN_BURST
 
 
 class Player(PlayerNetwork, ABC):
+
+    CHALLENGE_TIMEOUT = 10
+    """int: seconds after which an unanswered challenge is considered lost"""
+
+    CHALLENGE_RETRY_DELAY = 5
+    """int: seconds before challenging again an opponent who refused a challenge"""
+
+    BATTLE_INACTIVITY_TIMEOUT = 60
+    """int: seconds without battle messages after which the decision is requested again"""
+
+    BATTLE_FORFEIT_TIMEOUT = 30
+    """int: seconds without battle messages after the new request before forfeiting"""
+
+    MAX_DECISIONS_IN_FLIGHT = 4
+    """int: decisions computed at the same time, the others wait by deadline order"""
+
     def __init__(
         self,
         username: str,
@@ -25,8 +48,11 @@ class Player(PlayerNetwork, ABC):
         max_concurrent_battles: int,
         server_address: str,
         target_battles: int,
-        to_target: str,
+        to_target: Union[str, List[str]],
         to_challenge: str = None,
+        max_pending_challenges: int = None,
+        messages_per_second: float = None,
+        message_burst: int = SHOWDOWN_BURST,
     ) -> None:
         super(Player, self).__init__(
             authentification_address=authentification_address,
@@ -36,18 +62,56 @@ class Player(PlayerNetwork, ABC):
             server_address=server_address,
             username=username,
             to_challenge=to_challenge,
-            format=format
+            format=format,
+            messages_per_second=messages_per_second,
+            message_burst=message_burst,
         )
         self.max_concurrent_battles = max_concurrent_battles
         self.mode = mode
         self.target_battles = target_battles
         self.to_target = to_target
 
+        # Opponents to challenge, challenges sent but not answered yet, at most
+        # one per opponent as showdown refuses the others, and when opponents
+        # last refused a challenge
+        if isinstance(to_target, str):
+            self._targets = [to_target]
+        else:
+            self._targets = list(to_target or [])
+        if max_pending_challenges is None:
+            max_pending_challenges = min(max_concurrent_battles, len(self._targets))
+        self.max_pending_challenges = max_pending_challenges
+        self._pending_challenges = []
+        self._refused_challenges = {}
+        self.challenge_stats = {"sent": 0, "accepted": 0, "refused": 0, "expired": 0}
+
         self.current_battles = 0
         self.total_battles = 0
 
         self.battles = {}
 
+        # Last message received in each battle, and battles forfeited because of
+        # inactivity, by cause
+        self._battle_activity = {}
+        self.reaped_battles = Counter()
+
+        # Decisions taken, and [Invalid choice] errors received, by error
+        self.decisions = 0
+        self.invalid_choices = Counter()
+
+        # Pending decisions, as a heap of (deadline, order, battle, trapped),
+        # the entry of each battle, decisions being computed, and decisions
+        # started after their deadline
+        self.max_decisions_in_flight = self.MAX_DECISIONS_IN_FLIGHT
+        self._decision_queue = []
+        self._scheduled_decisions = {}
+        self._decision_order = itertools.count()
+        self.decisions_in_flight = 0
+        self.late_decisions = 0
+
+        # Notified whenever a battle ends or a challenge is answered
+        self._slot_free = asyncio.Condition()
+
         self._observations = {}
         self._actions = {}
         self._wins = {}
@@ -189,13 +253,26 @@ class Player(PlayerNetwork, ABC):
             if len(battle_info) > 2:
                 if battle_info[2] not in self.battles:
                     print(f"[DEBUG] Creating new battle {battle_info[2]} for {self.username}")
-                    self.battles[battle_info[2]] = Battle(battle_info[2], self.username)
+                    self.battles[battle_info[2]] = Battle(split_message[0], self.username)
                     self.current_battles += 1
+                    asyncio.ensure_future(self._watch_battle(self.battles[battle_info[2]]))
                     if "2" in self.username.lower():
                         print(f"Battle %3d / %3d started" % (len(self.battles), self.target_battles))
                 if battle_info[2] in self.battles:
                     current_battle = self.battles[battle_info[2]]
+                    # Requests and errors are sent again on demand, only the
+                    # battle log shows progress
+                    if f"|{split_message[1]}|" not in self.UNLOGGED_MESSAGES:
+                        self._battle_activity[current_battle.battle_tag] = time.time()
                     print(f"[DEBUG] Using existing battle {battle_info[2]} for {self.username}")
+                # The opponent joining the battle answers our challenge to them
+                if (
+                    split_message[1] == "player"
+                    and len(split_message) > 3
+                    and split_message[3]
+                    and to_id(split_message[3]) != to_id(self.username)
+                ):
+                    await self._challenge_answered(split_message[3], accepted=True)
             else:
                 # battle_infoの要素数が足りない場合は何もしない
                 print(f"[DEBUG] Invalid battle_info format: {battle_info}")
@@ -207,19 +284,22 @@ class Player(PlayerNetwork, ABC):
                 if len(split_message) > 2 and split_message[1] == "request":
                     if split_message[2] and current_battle is not None:
                         try:
-                            current_battle.parse_request(json.loads(split_message[2]))
+                            current_battle.parse_request(Request(split_message[2]))
                             print(f"[DEBUG] Parsed request for battle {current_battle.battle_tag}")  # デバッグログを追加
-                        except json.JSONDecodeError as e:
+                        except ValueError as e:
                             print(f"[ERROR] Failed to parse request: {e}")
                         except Exception as e:
                             print(f"[ERROR] Error in parse_request: {e}")
                     if current_battle is not None and current_battle.is_ready:
                         print(f"[DEBUG] Battle {current_battle.battle_tag} is ready, selecting move")  # デバッグログを追加
-                        await self.select_save_move(current_battle)
+                        self.schedule_decision(current_battle)
                 elif len(split_message) > 2 and split_message[1] == "callback" and split_message[2] == "trapped" and current_battle is not None:
-                    await self.select_save_move(current_battle, trapped=True)
+                    current_battle.decision_refused()
+                    self.schedule_decision(current_battle, trapped=True)
                 elif len(split_message) > 2 and split_message[1] == "error" and current_battle is not None:
                     print(f"[DEBUG] Received error message: {'|'.join(split_message)}")  # デバッグログを追加
+                    if split_message[2].startswith("[Invalid choice]"):
+                        self.invalid_choices[split_message[2][len("[Invalid choice] "):].split(":")[0]] += 1
                     if split_message[2].startswith("[Invalid choice] There's nothing to choose"):
                         pass
                     elif split_message[2].startswith("[Invalid choice] Can't do anything"):
@@ -228,9 +308,12 @@ class Player(PlayerNetwork, ABC):
                         pass
                     elif split_message[2].startswith("[Invalid choice] Can't switch"):
                         current_battle.trapped = True
-                        await self.select_save_move(current_battle)
+                        current_battle.legal_actions.switches = {}
+                        current_battle.decision_refused()
+                        self.schedule_decision(current_battle, trapped=True)
                     elif split_message[2].startswith("[Invalid choice]"):
-                        await self.select_save_move(current_battle)
+                        current_battle.decision_refused()
+                        self.schedule_decision(current_battle)
                 # Update player id and turn count
                 elif (
                     len(split_message) > 3 and
@@ -246,7 +329,7 @@ class Player(PlayerNetwork, ABC):
                         current_battle.player_is_p1()
 
                     if current_battle.is_ready:
-                        await self.select_save_move(current_battle)
+                        self.schedule_decision(current_battle)
                 elif (
                     len(split_message) > 3 and
                     split_message[1] == "player"
@@ -279,7 +362,8 @@ class Player(PlayerNetwork, ABC):
 
 
                 elif len(split_message) > 2 and split_message[1] == "win" and current_battle is not None:
-                    if len(split_message) > 2:
+                    # Reaped battles were already counted when they were forfeited
+                    if not current_battle.finished:
                         current_battle.won_by(split_message[2])
                         self._wins[current_battle.battle_num] = int(self.username.lower() == split_message[2])
                         self.current_battles -= 1
@@ -287,10 +371,25 @@ class Player(PlayerNetwork, ABC):
                         print(f"[DEBUG] {self.username} battle ended: total_battles={self.total_battles}, current_battles={self.current_battles}")
 
                         await self.leave_battle(current_battle)
+                        await self._free_slot()
+                elif len(split_message) > 2 and split_message[1] == "noinit" and current_battle is not None:
+                    # The battle room we tried to rejoin was closed while we were away
+                    print(f"[WARNING] Battle {current_battle.battle_tag} lost: {'|'.join(split_message[2:])}")
+                    if not current_battle.finished:
+                        current_battle.won_by(None)
+                        self.current_battles -= 1
+                        self.total_battles += 1
+                        await self._free_slot()
+                elif len(split_message) > 2 and split_message[1] == "inactive" and current_battle is not None:
+                    # The timer moves the deadline of the pending decision
+                    current_battle.update_time_left(split_message[2])
+                    entry = self._scheduled_decisions.get(current_battle.battle_tag)
+                    if entry is not None:
+                        self.schedule_decision(current_battle, trapped=entry[3])
                 elif len(split_message) > 2 and split_message[1] == "turn" and current_battle is not None:
                     print(f"[DEBUG] Turn {split_message[2]} for battle {current_battle.battle_tag}")  # デバッグログを追加
                     if current_battle.is_ready:
-                        await self.select_save_move(current_battle)
+                        self.schedule_decision(current_battle)
                 else:
                     if current_battle is not None:
                         # parse_messageに渡す前に最低限の長さチェック
@@ -312,6 +411,8 @@ class Player(PlayerNetwork, ABC):
             self._observations[battle.battle_num] = []
             self._actions[battle.battle_num] = []
         self._observations[battle.battle_num].append(battle.dic_state)
+        self.decisions += 1
+        battle.decision_sent()
         print(f"[DEBUG] Calling select_move for {self.username}")
         print(f"[DEBUG] select_move method: {self.select_move.__qualname__}")
         action = await self.select_move(battle, trapped=trapped)
@@ -323,116 +424,269 @@ class Player(PlayerNetwork, ABC):
             print(f"[DEBUG WARN] Action is None for {self.username}, this should not happen")
         self._actions[battle.battle_num].append(action)
 
+    def schedule_decision(self, battle: Battle, *, trapped: bool = False) -> None:
+        """
+        Queues the decision of battle, to be taken by earliest deadline first
+        once fewer than max_decisions_in_flight decisions are being computed.
+
+        Args:
+            battle (Battle): battle waiting for a decision
+
+            trapped (bool, defaults to False): whether the active pokemon is
+            known to be unable to switch out
+        """
+        deadline = battle.decision_deadline
+        if deadline is None:
+            deadline = time.time() + battle.TURN_TIME
+        entry = (deadline, next(self._decision_order), battle, trapped)
+        self._scheduled_decisions[battle.battle_tag] = entry
+        heapq.heappush(self._decision_queue, entry)
+        self._dispatch_decisions()
+
+    def _dispatch_decisions(self) -> None:
+        """
+        Starts the most urgent pending decisions while there is room for them.
+        """
+        while self._decision_queue and self.decisions_in_flight < self.max_decisions_in_flight:
+            entry = heapq.heappop(self._decision_queue)
+            _, _, battle, trapped = entry
+            # Entries replaced by a later scheduling of the same battle are skipped
+            if self._scheduled_decisions.get(battle.battle_tag) is not entry:
+                continue
+            del self._scheduled_decisions[battle.battle_tag]
+            if battle.finished:
+                continue
+            self.decisions_in_flight += 1
+            asyncio.ensure_future(self._take_decision(battle, trapped=trapped))
+
+    async def _take_decision(self, battle: Battle, *, trapped: bool) -> None:
+        try:
+            if not battle.is_ready:
+                return
+            if battle.slack < 0:
+                self.late_decisions += 1
+                print(f"[WARNING] Decision for {battle.battle_tag} started {-battle.slack:.1f}s late")
+            await self.select_save_move(battle, trapped=trapped)
+        except Exception as e:
+            import traceback
+            print(f"[ERROR] Error while deciding in {battle.battle_tag} for {self.username}: {e}")
+            print(f"[DEBUG] Traceback: {traceback.format_exc()}")
+        finally:
+            self.decisions_in_flight -= 1
+            self._dispatch_decisions()
+
+    async def _free_slot(self) -> None:
+        async with self._slot_free:
+            self._slot_free.notify_all()
+
+    async def _send_challenge(self) -> None:
+        """
+        Challenges the first available target.
+        """
+        opponent = self._available_targets[0]
+        self._pending_challenges.append((to_id(opponent), time.time()))
+        self.challenge_stats["sent"] += 1
+        print(f"[INFO] Sending challenge to {opponent} ({len(self._pending_challenges)} pending)")
+        await self.challenge(opponent, self.format)
+
+    async def _challenge_answered(self, opponent: str = None, *, accepted: bool) -> None:
+        """
+        Resolves the oldest pending challenge sent to opponent, or the oldest
+        pending challenge if opponent is None.
+        """
+        for i, (pending_opponent, _) in enumerate(self._pending_challenges):
+            if opponent is None or pending_opponent == to_id(opponent):
+                del self._pending_challenges[i]
+                self.challenge_stats["accepted" if accepted else "refused"] += 1
+                if not accepted:
+                    self._refused_challenges[pending_opponent] = time.time()
+                await self._free_slot()
+                return
+
+    async def _challenge_refused(self, message: str) -> None:
+        for opponent, _ in self._pending_challenges:
+            if opponent in to_id(message):
+                return await self._challenge_answered(opponent, accepted=False)
+        await self._challenge_answered(accepted=False)
+
+    async def _connection_lost(self) -> None:
+        # The server cancels challenges of disconnected users
+        for opponent, _ in self._pending_challenges:
+            print(f"[WARNING] Challenge to {opponent} lost with the connection")
+        self.challenge_stats["expired"] += len(self._pending_challenges)
+        self._pending_challenges = []
+        await self._free_slot()
+
+    async def _watch_battle(self, battle: Battle) -> None:
+        """
+        Reaps the battle if it stalls on our side: after BATTLE_INACTIVITY_TIMEOUT
+        seconds without messages, the room is left and joined again, upon which
+        the server sends the request again if it still waits for our decision.
+        The battle is forfeited if the player still owes a decision
+        BATTLE_FORFEIT_TIMEOUT more seconds later. Battles waiting for the
+        opponent are left to the timer of the server.
+        """
+        self._battle_activity[battle.battle_tag] = time.time()
+        rerequested_at = None
+        while not battle.finished and not self.should_die:
+            last_activity = self._battle_activity[battle.battle_tag]
+            if rerequested_at is not None and last_activity > rerequested_at:
+                rerequested_at = None
+            if rerequested_at is None:
+                deadline = last_activity + self.BATTLE_INACTIVITY_TIMEOUT
+            else:
+                deadline = rerequested_at + self.BATTLE_FORFEIT_TIMEOUT
+            if time.time() < deadline:
+                await asyncio.sleep(deadline - time.time())
+                continue
+
+            try:
+                if rerequested_at is None:
+                    print(f"[WARNING] No message in {battle.battle_tag} for {self.BATTLE_INACTIVITY_TIMEOUT}s, requesting the decision again")
+                    rerequested_at = time.time()
+                    # Showdown ignores joining a room already joined
+                    await self.send_message("/leave", room=battle.battle_tag)
+                    await self.send_message(f"/join {battle.battle_tag}")
+                elif battle._awaiting_decision:
+                    await self._reap_battle(battle)
+                else:
+                    print(f"[INFO] {battle.battle_tag} is waiting for the opponent")
+                    rerequested_at = None
+                    self._battle_activity[battle.battle_tag] = time.time()
+            except websockets.exceptions.ConnectionClosed:
+                # Battles are rejoined with the connection
+                rerequested_at = None
+                self._battle_activity[battle.battle_tag] = time.time()
+        self._battle_activity.pop(battle.battle_tag, None)
+
+    async def _reap_battle(self, battle: Battle) -> None:
+        """
+        Forfeits a stalled battle and frees its slot.
+        """
+        cause = battle.not_ready_reason or "no answer to the decision"
+        print(f"[WARNING] Forfeiting stalled battle {battle.battle_tag}: {cause}")
+        self.reaped_battles[cause] += 1
+        battle.won_by(None)
+        self._wins[battle.battle_num] = 0
+        self.current_battles -= 1
+        self.total_battles += 1
+        await self.send_message("/forfeit", room=battle.battle_tag)
+        await self.leave_battle(battle)
+        await self._free_slot()
+
+    async def _expire_challenges(self) -> None:
+        """
+        Cancels the challenges unanswered after CHALLENGE_TIMEOUT seconds, so
+        that their opponents can be challenged again.
+        """
+        now = time.time()
+        for challenge in list(self._pending_challenges):
+            if now - challenge[1] > self.CHALLENGE_TIMEOUT:
+                print(f"[WARNING] Challenge to {challenge[0]} unanswered after {self.CHALLENGE_TIMEOUT}s")
+                self._pending_challenges.remove(challenge)
+                self.challenge_stats["expired"] += 1
+                await self.send_message(f"/cancelchallenge {challenge[0]}")
+
+    @property
+    def _available_targets(self) -> List[str]:
+        """
+        Targets without a pending challenge, that did not refuse one in the last
+        CHALLENGE_RETRY_DELAY seconds.
+        """
+        pending = {opponent for opponent, _ in self._pending_challenges}
+        now = time.time()
+        return [
+            target
+            for target in self._targets
+            if to_id(target) not in pending
+            and now - self._refused_challenges.get(to_id(target), 0) >= self.CHALLENGE_RETRY_DELAY
+        ]
+
+    @property
+    def _can_challenge(self) -> bool:
+        """
+        Whether a new challenge can be sent to an available target without
+        exceeding the number of concurrent battles, pending challenges or
+        targeted battles.
+        """
+        in_flight = self.current_battles + len(self._pending_challenges)
+        return (
+            len(self._pending_challenges) < self.max_pending_challenges
+            and in_flight < self.max_concurrent_battles
+            and self.total_battles + in_flight < self.target_battles
+            and bool(self._available_targets)
+        )
+
     async def random_move(self, battle: Battle, *, trapped: bool = False) -> str:
+        """
+        Sends a command picked uniformly among the legal actions of the last
+        request, or lets the server choose if there is none.
+        """
         print(f"[DEBUG] random_move called for {self.username}")
         print(f"[DEBUG] available_moves: {getattr(battle, 'available_moves', None)}")
         print(f"[DEBUG] available_switches: {getattr(battle, 'available_switches', None)}")
-        print(f"[DEBUG] active_pokemon: {getattr(battle, 'active_pokemon', None)}")
-        if getattr(battle, 'active_pokemon', None):
-            print(f"[DEBUG] active_pokemon.moves: {battle.active_pokemon.moves}")
-        state = battle.dic_state
-        commands = []
-        switch_probs = []
-        moves_probs = []
-
-        for pokemon in battle._player_team.values():
-            if pokemon.current_hp is not None and pokemon.current_hp > 0 and not pokemon.active:
-                commands.append(f"/switch {pokemon.ident.split(':')[1]}")
-                switch_probs.append(1.0)
-            else:
-                switch_probs.append(0.0)
-
-        active_pokemon = battle.active_pokemon
-        if active_pokemon:
-            for move_name, move in active_pokemon.moves.items():
-                if move.pp > 0:
-                    commands.append(f"/choose move {move_name}")
-                    moves_probs.append(1.0)
-                else:
-                    moves_probs.append(0.0)
-
-        probs = []
-        for p in switch_probs:
-            probs.append(p)
-        for p in moves_probs:
-            probs.append(p)
-
-        if len(commands) < len(probs):
-            commands += [""] * (len(probs) - len(commands))
-        elif len(commands) > len(probs):
-            commands = commands[:len(probs)]
-
-        probs = np.array(probs)
-        if sum(probs) > 0:
-            probs /= sum(probs)
-            choice = choices([i for i, val in enumerate(probs)], probs)[0]
-            try:
-                if 0 <= choice < len(commands) and commands[choice]:
-                    print(f"[DEBUG] Sending command: {commands[choice]}")
-                    await self.send_room_message(
-                        message=commands[choice],
-                        room=battle.battle_tag,
-                    )
-                    print(f"[DEBUG] Command sent successfully for {self.username}")
-                    return commands[choice]
-            except (ValueError, IndexError) as e:
-                import traceback
-                print(f"[ERROR] {type(e).__name__} in random_move: {e}")
-                print(f"[DEBUG] choice: {choice}, len(commands): {len(commands)}, len(probs): {len(probs)}")
-                print(f"[DEBUG] commands: {commands}")
-                print(f"[DEBUG] probs: {probs}")
-                print(f"[DEBUG] switch_probs: {switch_probs}")
-                print(f"[DEBUG] moves_probs: {moves_probs}")
-                print(f"[DEBUG] Traceback: {traceback.format_exc()}")
-
-        if active_pokemon:
-            for move_name, move in active_pokemon.moves.items():
-                if move.pp > 0:
-                    print(f"[DEBUG] Sending default move: {move_name}")
-                    await self.send_room_message(
-                        message=f"/choose move {move_name}",
-                        room=battle.battle_tag,
-                    )
-                    print(f"[DEBUG] Default move sent for {self.username}")
-                    return f"/choose move {move_name}"
-
-        print(f"[DEBUG] No valid moves found, sending pass for {self.username}")
+        commands = battle.legal_actions.commands(switches=not trapped)
+        if commands:
+            command = choice(commands)
+        else:
+            print(f"[DEBUG] No legal action found, letting the server choose for {self.username}")
+            command = "/choose default"
+        print(f"[DEBUG] Sending command: {command}")
         await self.send_room_message(
-            message="pass",
+            message=command,
             room=battle.battle_tag,
         )
-        print(f"[DEBUG] Pass command sent for {self.username}")
-        print(f"[DEBUG] random_move returning: pass")
-        return "pass"
+        print(f"[DEBUG] random_move returning: {command}")
+        return command
 
     async def run(self) -> None:
         print(f"[DEBUG] Starting run() for {self.username} in {self.mode} mode")
         if self.mode == "one_challenge":
-            while not self.logged_in:
-                await asyncio.sleep(0.1)
-            await self.challenge(self.to_target, self.format)
+            await self.wait_logged_in()
+            await self.challenge(self._targets[0], self.format)
         elif self.mode == "challenge":
+            print(f"[DEBUG] {self.username} waiting for login...")
+            await self.wait_logged_in()
             while self.total_battles < self.target_battles:
-                print(f"[DEBUG] {self.username} run loop: logged_in={self.logged_in}, total_battles={self.total_battles}, target_battles={self.target_battles}, current_battles={self.current_battles}")
-                if not self.logged_in:
-                    print(f"[DEBUG] {self.username} waiting for login...")
-                    await asyncio.sleep(0.1)
+                print(f"[DEBUG] {self.username} run loop: total_battles={self.total_battles}, target_battles={self.target_battles}, current_battles={self.current_battles}, pending_challenges={len(self._pending_challenges)}")
+                try:
+                    await self._expire_challenges()
+                except websockets.exceptions.ConnectionClosed:
+                    print(f"[WARNING] Connection lost while cancelling challenges for {self.username}")
+                # Wait for a free slot, for the oldest pending challenge to
+                # expire or for an opponent who refused to be challengeable again
+                now = time.time()
+                wakeups = [sent + self.CHALLENGE_TIMEOUT for _, sent in self._pending_challenges]
+                wakeups += [
+                    refused + self.CHALLENGE_RETRY_DELAY
+                    for refused in self._refused_challenges.values()
+                    if refused + self.CHALLENGE_RETRY_DELAY > now
+                ]
+                timeout = max(0, min(wakeups) - now) if wakeups else None
+                try:
+                    async with self._slot_free:
+                        await asyncio.wait_for(
+                            self._slot_free.wait_for(
+                                lambda: self.total_battles >= self.target_battles
+                                or self._can_challenge
+                            ),
+                            timeout,
+                        )
+                except asyncio.TimeoutError:
                     continue
-                if self.can_accept_challenge:
-                    print(f"[INFO] Sending challenge to {self.to_target}")
-                    self._waiting_start = True
-                    await self.challenge(self.to_target, self.format)
-                    self._waiting_start = False  # チャレンジ送信後にフラグをリセット
-                elif not self.can_accept_challenge:
-                    print(f"[DEBUG] {self.username} cannot accept challenge now")
-                await asyncio.sleep(1)  # チャレンジの間隔を1秒に設定
+                if self.total_battles >= self.target_battles:
+                    break
+                await self.wait_logged_in()
+                try:
+                    await self._send_challenge()
+                except websockets.exceptions.ConnectionClosed:
+                    print(f"[WARNING] Connection lost while challenging for {self.username}")
         elif self.mode == "battle_online":
             # TODO: implement
             pass
         elif self.mode == "wait":
             print(f"[DEBUG] {self.username} in wait mode, waiting for login...")
-            while not self.logged_in:
-                await asyncio.sleep(0.1)
+            await self.wait_logged_in()
             print(f"[DEBUG] {self.username} logged in, waiting for challenges...")
         else:
             raise ValueError(
@@ -449,6 +703,12 @@ class Player(PlayerNetwork, ABC):
     def actions(self):
         return self._actions
 
+    @property
+    def active_rooms(self) -> List[str]:
+        return [
+            battle.battle_tag for battle in self.battles.values() if not battle.finished
+        ]
+
     @property
     def can_accept_challenge(self) -> bool:
         can_accept = (not self._waiting_start) and (
@@ -1,10 +1,15 @@
+import asyncio
 import json
+import random
 import requests
 import websockets
 
 from abc import ABC, abstractmethod
-from asyncio import Lock
+from asyncio import Event, Lock
+from typing import List
 from environment.battle import Battle
+from environment.utils import CONFIG
+from players.base_classes.rate_limiter import COMMAND_PRIORITIES, SHOWDOWN_BURST, TokenBucket
 
 
 class PlayerNetwork(ABC):
@@ -14,6 +19,18 @@ class PlayerNetwork(ABC):
     In charge of communicating with the pokemon showdown server.
     """
 
+    RECONNECT_DELAY = 1
+    """float: seconds before the first reconnection attempt, doubled after each failure"""
+
+    RECONNECT_MAX_DELAY = 60
+    """float: maximum number of seconds between two reconnection attempts"""
+
+    MAX_RECONNECT_ATTEMPTS = 10
+    """int: consecutive failed reconnection attempts after which listen gives up"""
+
+    UNLOGGED_MESSAGES = ("|request|", "|error|", "|callback|", "|noinit|", "|deinit|")
+    """tuple: battle messages sent to the player only, which are not part of the room's log"""
+
     def __init__(
         self,
         username: str,
@@ -25,9 +42,15 @@ class PlayerNetwork(ABC):
         server_address: str,
         to_challenge: str = None,
         format: str = "gen9randombattle",
+        messages_per_second: float = None,
+        message_burst: int = SHOWDOWN_BURST,
     ) -> None:
         """
         Initialises interface.
+
+        Outgoing messages are rate limited when messages_per_second is given, or
+        set in the config file. Use rate_limiter.SHOWDOWN_MESSAGES_PER_SECOND
+        against servers with the default chat throttling.
         """
 
         if authentification_address is None:
@@ -48,6 +71,24 @@ class PlayerNetwork(ABC):
 
         self._lock = Lock()
 
+        if messages_per_second is None:
+            messages_per_second = CONFIG.get("messages_per_second")
+        if messages_per_second:
+            self._rate_limiter = TokenBucket(messages_per_second, message_burst)
+        else:
+            self._rate_limiter = None
+
+        # Set once the server confirmed our username
+        self._logged_in_event = Event()
+        # Last challenges received, by challenger, as sent by updatechallenges
+        self._challenges_from = {}
+        # Set when the connection was lost, until we are logged in again
+        self._reconnecting = False
+        self._rejoin_games = False
+        self.reconnections = 0
+        # Number of log messages managed, by battle room
+        self._room_log_lengths = {}
+
     async def _log_in(self, conf_1: str, conf_2: str) -> None:
         """
         Log in player to specified username.
@@ -66,8 +107,23 @@ class PlayerNetwork(ABC):
     async def accept_challenge(self, user: str) -> None:
         if self.can_accept_challenge:
             self._waiting_start = True
+            # Accepted once, until updatechallenges lists it again
+            self._challenges_from.pop(user, None)
             await self.send_message(f"/accept {user}")
 
+    async def _accept_pending_challenges(self) -> None:
+        for user, format in list(self._challenges_from.items()):
+            if format == self.format:
+                print(f"[INFO] Accepting challenge from {user}")
+                await self.accept_challenge(user)
+
+    async def _challenge_refused(self, message: str) -> None:
+        """
+        Called when the server answers a challenge with a popup.
+        Players tracking their sent challenges should rewrite this method.
+        """
+        pass
+
     async def leave_battle(self, battle: Battle):
         await self.send_message("/leave", room=battle.battle_tag)
 
@@ -89,34 +145,97 @@ class PlayerNetwork(ABC):
     async def change_avatar(self, avatar_id: str) -> None:
         await self.send_message(f"/avatar {avatar_id}")
 
+    async def wait_logged_in(self) -> None:
+        """
+        Waits until the server confirmed our login.
+        """
+        await self._logged_in_event.wait()
+
+    async def _connection_lost(self) -> None:
+        """
+        Called when the connection to the server is lost, before reconnecting.
+        Players keeping track of challenges should rewrite this method.
+        """
+        pass
+
+    async def _rejoin_rooms(self) -> None:
+        """
+        Rejoins the rooms of unfinished battles after a reconnection. The server
+        then sends the battle log again, followed by the pending request.
+        """
+        for room in self.active_rooms:
+            print(f"[INFO] Rejoining {room} for {self.username}")
+            await self.send_message(f"/join {room}")
+
     async def listen(self) -> None:
-        async with websockets.connect(self.websocket_address) as websocket:
-            self._websocket = websocket
-            while not self.should_die:
-                print(f"[DEBUG] should_die={self.should_die} for {self.username}")
-                try:
-                    message = await websocket.recv()
-                    print(f"[DEBUG] Received message: {message}")
-                    if self._log_messages_in_console:
-                        print(f"\n{self.username} << {message}")
-                    await self.manage_message(message)
-                except websockets.exceptions.ConnectionClosedOK:
-                    print(f"[INFO] Connection closed normally for {self.username}")
-                    print(f"[DEBUG] Listen loop break: ConnectionClosedOK for {self.username}")
-                    break
-                except websockets.exceptions.ConnectionClosedError as e:
-                    print(f"[ERROR] Connection closed unexpectedly for {self.username}: {e}")
-                    print(f"[DEBUG] Listen loop break: ConnectionClosedError for {self.username}")
-                    break
-                except Exception as e:
-                    print(f"[ERROR] Unexpected error in listen loop for {self.username}: {e}")
-                    import traceback
-                    print(traceback.format_exc())
-                    print(f"[DEBUG] Listen loop break: Exception for {self.username}")
-                    break
-                finally:
-                    print(f"[INFO] Listen loop ended for {self.username}")
-            print(f"[DEBUG] Exited listen loop for {self.username}, should_die={self.should_die}")
+        """
+        Listens to the server until should_die. The connection is reopened with
+        exponential backoff when it is lost, and battles are resumed.
+        """
+        failed_attempts = 0
+        while not self.should_die:
+            try:
+                async with websockets.connect(self.websocket_address) as websocket:
+                    self._websocket = websocket
+                    failed_attempts = 0
+                    if not await self._listen(websocket):
+                        return
+            except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+                print(f"[ERROR] Connection to {self.websocket_address} failed for {self.username}: {e}")
+                failed_attempts += 1
+            if self.should_die:
+                break
+            if failed_attempts > self.MAX_RECONNECT_ATTEMPTS:
+                print(f"[ERROR] Giving up reconnecting {self.username} after {failed_attempts - 1} attempts")
+                break
+
+            self._logged_in = False
+            self._logged_in_event.clear()
+            self._waiting_start = False
+            self._challenges_from = {}
+            self._reconnecting = True
+            await self._connection_lost()
+
+            delay = min(self.RECONNECT_DELAY * 2 ** failed_attempts, self.RECONNECT_MAX_DELAY)
+            delay *= random.uniform(0.5, 1)
+            print(f"[INFO] Reconnecting {self.username} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        print(f"[DEBUG] Exited listen loop for {self.username}, should_die={self.should_die}")
+
+    async def _listen(self, websocket) -> bool:
+        """
+        Manages messages received on websocket until should_die or until the
+        connection is closed.
+
+        Returns:
+            bool: False if listening stopped on an unexpected error, in which case
+            there is no point in reconnecting
+        """
+        while not self.should_die:
+            print(f"[DEBUG] should_die={self.should_die} for {self.username}")
+            try:
+                message = await websocket.recv()
+                print(f"[DEBUG] Received message: {message}")
+                if self._log_messages_in_console:
+                    print(f"\n{self.username} << {message}")
+                await self.manage_message(message)
+            except websockets.exceptions.ConnectionClosedOK:
+                print(f"[INFO] Connection closed normally for {self.username}")
+                print(f"[DEBUG] Listen loop break: ConnectionClosedOK for {self.username}")
+                break
+            except websockets.exceptions.ConnectionClosedError as e:
+                print(f"[ERROR] Connection closed unexpectedly for {self.username}: {e}")
+                print(f"[DEBUG] Listen loop break: ConnectionClosedError for {self.username}")
+                break
+            except Exception as e:
+                print(f"[ERROR] Unexpected error in listen loop for {self.username}: {e}")
+                import traceback
+                print(traceback.format_exc())
+                print(f"[DEBUG] Listen loop break: Exception for {self.username}")
+                return False
+            finally:
+                print(f"[INFO] Listen loop ended for {self.username}")
+        return True
 
     async def manage_message(self, message: str) -> None:
         """
@@ -126,6 +245,24 @@ class PlayerNetwork(ABC):
             print(f"[WARNING] Invalid message received: {message}")
             return
 
+        # Room messages hold one protocol message per line, after the room id
+        if message.startswith(">battle") and "\n" in message:
+            room, *lines = message.split("\n")
+            room_id = room[1:]
+            lines = [line for line in lines if line.startswith("|")]
+            # Joining a battle room sends its whole log: when rejoining it, skip
+            # the messages managed before the connection was lost
+            if lines and lines[0].startswith("|init|"):
+                lines = [line for line in lines if not line.startswith(("|init|", "|title|"))]
+                lines = lines[self._room_log_lengths.get(room_id, 0):]
+            for line in lines:
+                if not line.startswith(self.UNLOGGED_MESSAGES + ("|init|", "|title|")):
+                    self._room_log_lengths[room_id] = self._room_log_lengths.get(room_id, 0) + 1
+                await self.manage_message(room + line)
+                if line.startswith("|win|") or line == "|tie":
+                    self._room_log_lengths.pop(room_id, None)
+            return
+
         split_message = message.split("|")
         if not split_message:
             print("[WARNING] Empty message after split")
@@ -167,7 +304,13 @@ class PlayerNetwork(ABC):
             # print(f"[DEBUG] Received updateuser: {split_message[2]}")
             if split_message[2].strip() == self.username:
                 self._logged_in = True
+                self._logged_in_event.set()
                 print(f"[INFO] Logged in as {self.username}")
+                if self._reconnecting:
+                    self._reconnecting = False
+                    self._rejoin_games = True
+                    self.reconnections += 1
+                    await self._rejoin_rooms()
 
         elif "updatechallenges" in split_message[1]:
             if len(split_message) < 3:
@@ -176,15 +319,16 @@ class PlayerNetwork(ABC):
             try:
                 response = json.loads(split_message[2])
                 # print(f"[DEBUG] Received challenges: {response}")
-                for user, format in response.get("challengesFrom", {}).items():
-                    if format == self.format:
-                        print(f"[INFO] Accepting challenge from {user}")
-                        await self.accept_challenge(user)
+                self._challenges_from = response.get("challengesFrom", {})
+                await self._accept_pending_challenges()
             except json.JSONDecodeError:
                 print(f"[ERROR] Failed to parse challenges: {split_message[2]}")
 
         elif split_message[0].startswith('>battle'):
-            self._waiting_start = False  # バトルが開始されたらチャレンジ待ち状態を解除
+            if self._waiting_start:
+                self._waiting_start = False  # バトルが開始されたらチャレンジ待ち状態を解除
+                # Challenges left pending while we were waiting can now be accepted
+                await self._accept_pending_challenges()
             await self.battle(message)
         elif split_message[1] == "popup":
             if len(split_message) < 3:
@@ -193,6 +337,7 @@ class PlayerNetwork(ABC):
             # print(f"[DEBUG] Received popup: {split_message[2]}")
             if "already challenging" in split_message[2]:
                 self._waiting_start = False  # チャレンジが失敗したらチャレンジ待ち状態を解除
+            await self._challenge_refused(split_message[2])
         elif split_message[1] == "pm":
             if len(split_message) < 4:
                 print("[ERROR] Invalid pm message format")
@@ -212,11 +357,33 @@ class PlayerNetwork(ABC):
                 self._waiting_start = False
                 # チャレンジを受け入れる
                 await self.accept_challenge(split_message[2])
-        elif split_message[1] in ["updatesearch"]:
-            pass
+        elif split_message[1] == "updatesearch":
+            # After a reconnection, battles started while we were away are only
+            # known through the games listed here
+            if self._rejoin_games and len(split_message) > 2:
+                self._rejoin_games = False
+                try:
+                    games = json.loads(split_message[2]).get("games") or {}
+                except json.JSONDecodeError:
+                    print(f"[ERROR] Failed to parse search: {split_message[2]}")
+                    games = {}
+                for room in games:
+                    if room not in self.active_rooms:
+                        print(f"[INFO] Joining {room} for {self.username}")
+                        await self.send_message(f"/join {room}")
         else:
             print(f"UNMANAGED MESSAGE : {message}")
 
+    async def _throttle(self, message: str, messages: int = 1) -> None:
+        """
+        Waits until messages can be sent without exceeding the rate limit.
+        """
+        if self._rate_limiter is not None:
+            command = message.split(" ")[0]
+            await self._rate_limiter.acquire(
+                messages, priority=COMMAND_PRIORITIES.get(command, 1), label=command
+            )
+
     async def send_message(
         self, message: str, room: str = "", message_2: str = None
     ) -> None:
@@ -230,6 +397,7 @@ class PlayerNetwork(ABC):
         if self._log_messages_in_console:
             print(f"\n{self.username} >> {to_send}")
         print(f"[DEBUG] Sending message: {to_send}")
+        await self._throttle(message)
         async with self._lock:
             await self._websocket.send(to_send + "\n")
 
@@ -239,6 +407,7 @@ class PlayerNetwork(ABC):
         # バトルルーム内コマンド専用：2行送信方式
         if room and not room.startswith('>'):
             room = '>' + room
+        await self._throttle(message, messages=2)
         async with self._lock:
             # 1行目: room名だけ
             await self._websocket.send(room + "\n")
@@ -260,6 +429,13 @@ class PlayerNetwork(ABC):
     def can_accept_challenge(self) -> bool:
         pass
 
+    @property
+    def active_rooms(self) -> List[str]:
+        """
+        list of str: rooms of the battles being played, rejoined on reconnection
+        """
+        return []
+
     @property
     def logged_in(self) -> bool:
         return self._logged_in
@@ -280,3 +456,12 @@ class PlayerNetwork(ABC):
     @property
     def format(self) -> str:
         return self._format
+
+    @property
+    def rate_limiter_stats(self) -> dict:
+        """
+        dict: outgoing messages sent and delayed by the rate limiter, if any
+        """
+        if self._rate_limiter is None:
+            return None
+        return self._rate_limiter.stats
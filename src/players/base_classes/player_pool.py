@@ -0,0 +1,183 @@
+"""
+Pool of player pairs sharing a battle count.
+
+Showdown limits every user separately, and a single pair of players only ever
+has two connections to the server. A pool runs one challenger and one receiver
+per pair of accounts listed in config.json, spreads the battles between them
+and merges what they gathered, so that battles per minute grow with the number
+of accounts.
+"""
+
+import asyncio
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+from environment.utils import CONFIG
+from players.base_classes.player import Player
+
+
+def account_pairs(number_of_pairs: int = None) -> List[Tuple[dict, dict]]:
+    """
+    Pairs the users of config.json: the first with the second, the third with the
+    fourth, and so on.
+
+    Args:
+        number_of_pairs (int, defaults to None): maximum number of pairs to return.
+        If None, every complete pair is returned.
+
+    Returns:
+        pairs (list of (dict, dict)): challenger and receiver accounts
+    """
+    users = CONFIG["users"]
+    pairs = list(zip(users[0::2], users[1::2]))
+    if not pairs:
+        raise ValueError("At least two users are needed in config.json.")
+    if number_of_pairs is not None:
+        pairs = pairs[:number_of_pairs]
+    return pairs
+
+
+def split_battles(number_of_battles: int, shards: int) -> List[int]:
+    """
+    Spreads number_of_battles as evenly as possible between shards.
+    """
+    quotient, remainder = divmod(number_of_battles, shards)
+    return [quotient + (i < remainder) for i in range(shards)]
+
+
+class PlayerPool:
+    """
+    Challengers and receivers playing against each other pair by pair.
+
+    Players are built by factories called with the username, password, mode,
+    target_battles and to_target keyword arguments of the player to create.
+
+    Example:
+        >>> pool = PlayerPool.from_config(
+        ...     number_of_battles=100,
+        ...     challenger_factory=lambda **kwargs: model_manager.get_player(**common, **kwargs),
+        ...     receiver_factory=lambda **kwargs: RandomRandomBattlePlayer(**common, **kwargs),
+        ... )
+        >>> await pool.run()
+        >>> pool.winning_rate
+    """
+
+    def __init__(self, challengers: List[Player], receivers: List[Player] = None) -> None:
+        """
+        Args:
+            challengers (list of Player): players in challenge mode, whose wins are
+            counted in winning_rate
+
+            receivers (list of Player, defaults to None): players accepting the
+            challenges. None when the opponents are not run by this process
+        """
+        self.challengers = challengers
+        self.receivers = receivers or []
+
+    @classmethod
+    def from_config(
+        cls,
+        number_of_battles: int,
+        challenger_factory: Callable[..., Player],
+        receiver_factory: Optional[Callable[..., Player]] = None,
+        number_of_pairs: int = None,
+    ) -> "PlayerPool":
+        """
+        Creates a pool from the accounts of config.json.
+
+        Args:
+            number_of_battles (int): battles to play over the whole pool
+
+            challenger_factory (callable): creates the player of the first account
+            of each pair
+
+            receiver_factory (callable, defaults to None): creates the player of the
+            second account of each pair. If None, these accounts are challenged
+            without being run by the pool
+
+            number_of_pairs (int, defaults to None): number of account pairs to use.
+            If None, every pair of config.json is used
+
+        Returns:
+            pool (PlayerPool)
+        """
+        pairs = account_pairs(number_of_pairs)
+        challengers, receivers = [], []
+        for (challenger, receiver), target_battles in zip(
+            pairs, split_battles(number_of_battles, len(pairs))
+        ):
+            if not target_battles:
+                continue
+            challengers.append(
+                challenger_factory(
+                    username=challenger["username"],
+                    password=challenger["password"],
+                    mode="challenge",
+                    target_battles=target_battles,
+                    to_target=receiver["username"],
+                )
+            )
+            if receiver_factory is not None:
+                receivers.append(
+                    receiver_factory(
+                        username=receiver["username"],
+                        password=receiver["password"],
+                        mode="wait",
+                        target_battles=target_battles,
+                        to_target=None,
+                    )
+                )
+        return cls(challengers, receivers)
+
+    async def run(self) -> None:
+        """
+        Runs every player until each of them reached its battle count.
+        """
+        to_await = []
+        for player in self.players:
+            to_await.append(asyncio.ensure_future(player.listen()))
+            to_await.append(asyncio.ensure_future(player.run()))
+        await asyncio.gather(*to_await)
+
+    def _merge(self, attribute: str, players: List[Player] = None) -> Dict[Tuple[str, int], object]:
+        """
+        Merges per battle dictionaries of players, keyed by (username, battle_num)
+        since battle numbers are only unique for a given player.
+        """
+        merged = {}
+        for player in self.players if players is None else players:
+            for battle_num, value in getattr(player, attribute).items():
+                merged[(player.username, battle_num)] = value
+        return merged
+
+    @property
+    def players(self) -> List[Player]:
+        return self.challengers + self.receivers
+
+    @property
+    def actions(self):
+        return self._merge("actions")
+
+    @property
+    def observations(self):
+        return self._merge("observations")
+
+    @property
+    def wins(self):
+        return self._merge("wins")
+
+    @property
+    def winning_moves_data(self):
+        data = {"observation": [], "action": []}
+        for player in self.players:
+            player_data = player.winning_moves_data
+            data["observation"] += player_data["observation"]
+            data["action"] += player_data["action"]
+        return data
+
+    @property
+    def winning_rate(self):
+        wins = self._merge("wins", self.challengers)
+        if not wins:
+            return None
+        return sum(wins.values()) / len(wins)
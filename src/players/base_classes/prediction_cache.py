@@ -0,0 +1,139 @@
+"""
+LRU cache of model predictions, keyed by the formatted model input.
+
+The same state is often predicted more than once: a decision refused with an
+[Invalid choice] is taken again from the unchanged state, and the first turns
+of many battles look alike. PredictionCache keeps the latest predictions of a
+model manager, keyed by a digest of the input given to the model, so that these
+do not cost a session run.
+
+Predictions are only valid for the weights they were computed with: the load
+and train methods of model managers are wrapped by invalidates_predictions,
+which empties the cache once they are done.
+"""
+
+import hashlib
+import numpy as np
+
+from collections import OrderedDict
+from functools import wraps
+
+
+class PredictionCache:
+    """
+    Bounded mapping from model inputs to model outputs, evicting the least
+    recently used entry first.
+
+    Example:
+        >>> cache = PredictionCache(max_size=4096)
+        >>> key = cache.key(x)
+        >>> y = cache.get(key)
+        >>> if y is None:
+        ...     y = model.predict(x[np.newaxis])[0]
+        ...     cache.put(key, y)
+    """
+
+    def __init__(self, max_size: int = 4096) -> None:
+        """
+        Args:
+            max_size (int, defaults to 4096): predictions kept. 0 disables the cache
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(x: np.ndarray) -> bytes:
+        """
+        Returns the key of a model input: a digest of its values, dtype and shape.
+
+        Args:
+            x (np.ndarray): model input
+
+        Returns:
+            key (bytes): 16 bytes digest
+        """
+        x = np.ascontiguousarray(x)
+        if x.dtype.hasobject:
+            # Python objects would be hashed by address
+            x = x.astype(np.float64)
+        digest = hashlib.blake2b(x.data, digest_size=16)
+        digest.update(f"{x.dtype.str}{x.shape}".encode())
+        return digest.digest()
+
+    def get(self, key: bytes) -> np.ndarray:
+        """
+        Returns the prediction cached under key, read-only, None if there is none.
+
+        Args:
+            key (bytes): key of the model input
+
+        Returns:
+            y (np.ndarray): model output
+        """
+        y = self._entries.get(key)
+        if y is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return y
+
+    def put(self, key: bytes, y: np.ndarray) -> None:
+        """
+        Caches a prediction, evicting the least recently used one if the cache is
+        full.
+
+        Args:
+            key (bytes): key of the model input
+
+            y (np.ndarray): model output
+        """
+        if self.max_size <= 0:
+            return
+        y = np.array(y, copy=True)
+        # Shared by every lookup of the state
+        y.setflags(write=False)
+        self._entries[key] = y
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Forgets every prediction, keeping the counters.
+        """
+        self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        float: share of lookups answered by the cache, 0 if there was none
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def invalidates_predictions(method):
+    """
+    Decorates a method changing the weights of a model manager, so that its
+    prediction cache is emptied afterwards, even if the method failed midway.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            cache = getattr(self, "_prediction_cache", None)
+            if cache is not None:
+                cache.clear()
+
+    wrapper._invalidates_predictions = True
+    return wrapper
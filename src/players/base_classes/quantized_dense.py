@@ -0,0 +1,141 @@
+"""
+Dense layers of exported models, stored in reduced precision for CPU inference.
+
+Actors only predict, and the first layer of FullyConnectedRandomModel alone is
+5390 x 512 float32 weights, about 11MB per process. QuantizedDense keeps the
+kernel of a layer either:
+
+- float32: as exported
+- float16: halved, with a relative error of about 1e-3
+- int8: quartered, quantized per output channel, i.e. each column of the kernel
+  is scaled so that its largest weight is 127
+
+NumPy has no fast float16 nor int8 matrix product, so reduced kernels are
+dequantized to float32 block of rows by block of rows, each block being
+multiplied and accumulated before the next one is converted. Blocks stay in the
+CPU cache, and the whole float32 kernel is never rebuilt.
+
+Converting int8 is about as fast as reading float32, so int8 layers are as fast
+as float32 ones for a single input and faster for batches. Converting float16
+is not vectorized by NumPy on most CPUs: float16 saves memory at the cost of
+about 10 times slower predictions.
+
+Flattened battle states are mostly zeros, about 300 values out of 5390: the
+gather method of a layer only reads the kernel rows of its non-zero inputs.
+"""
+
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8")
+"""Tuple of str: precisions QuantizedDense can store kernels in"""
+
+
+class QuantizedDense:
+    """
+    Affine layer x @ kernel + bias, activation left to the caller.
+
+    Example:
+        >>> layer = QuantizedDense(kernel, bias, precision="int8")
+        >>> y = layer(x)  # float32, x has shape (batch, kernel.shape[0])
+    """
+
+    BLOCK_ROWS = 256
+    """int: kernel rows dequantized at once by reduced precision layers"""
+
+    def __init__(self, kernel: np.ndarray, bias: np.ndarray = None, precision: str = "float32") -> None:
+        """
+        Args:
+            kernel (np.ndarray): weights of shape (inputs, outputs)
+
+            bias (np.ndarray, defaults to None): bias of shape (outputs,). If None,
+            the layer has none
+
+            precision (str, defaults to "float32"): one of PRECISIONS
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision}, expected one of {PRECISIONS}")
+        self.precision = precision
+        kernel = np.asarray(kernel, dtype=np.float32)
+        self.bias = None if bias is None else np.asarray(bias, dtype=np.float32)
+        self.scale = None
+
+        if precision == "float32":
+            self.kernel = np.ascontiguousarray(kernel)
+        elif precision == "float16":
+            self.kernel = kernel.astype(np.float16)
+        else:
+            scale = np.abs(kernel).max(axis=0) / 127
+            # Columns of zeros stay zeros whatever their scale
+            scale[scale == 0] = 1
+            self.kernel = np.round(kernel / scale).astype(np.int8)
+            self.scale = scale.astype(np.float32)
+
+    @property
+    def shape(self):
+        """
+        Tuple of int: shape of the kernel
+        """
+        return self.kernel.shape
+
+    @property
+    def nbytes(self) -> int:
+        """
+        int: memory taken by the weights of the layer
+        """
+        return sum(a.nbytes for a in (self.kernel, self.bias, self.scale) if a is not None)
+
+    def dequantized_kernel(self) -> np.ndarray:
+        """
+        Returns the kernel in float32, as the layer computes with it.
+        """
+        kernel = self.kernel.astype(np.float32)
+        return kernel if self.scale is None else kernel * self.scale
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            x (np.ndarray): inputs of shape (batch, inputs), or (inputs,)
+
+        Returns:
+            y (np.ndarray): float32 outputs of shape (batch, outputs), or (outputs,)
+        """
+        x = np.asarray(x, dtype=np.float32)
+        if self.precision == "float32":
+            y = x @ self.kernel
+        else:
+            y = np.zeros(x.shape[:-1] + self.kernel.shape[1:], dtype=np.float32)
+            block = np.empty((self.BLOCK_ROWS, self.kernel.shape[1]), dtype=np.float32)
+            for start in range(0, self.kernel.shape[0], self.BLOCK_ROWS):
+                rows = self.kernel[start:start + self.BLOCK_ROWS]
+                np.copyto(block[:len(rows)], rows, casting="unsafe")
+                y += x[..., start:start + len(rows)] @ block[:len(rows)]
+            if self.scale is not None:
+                # The scale of a column factors out of its dot products
+                y *= self.scale
+        if self.bias is not None:
+            y += self.bias
+        return y
+
+    def gather(self, x: np.ndarray) -> np.ndarray:
+        """
+        Same as calling the layer, for sparse inputs: only the kernel rows of the
+        inputs that are not zero in some row of x are read and dequantized, so that
+        the cost scales with the non-zero inputs rather than with all of them.
+
+        Args:
+            x (np.ndarray): inputs of shape (batch, inputs), or (inputs,)
+
+        Returns:
+            y (np.ndarray): float32 outputs of shape (batch, outputs), or (outputs,)
+        """
+        x = np.asarray(x, dtype=np.float32)
+        active = np.flatnonzero(x.any(axis=0) if x.ndim > 1 else x)
+        rows = self.kernel[active]
+        if self.precision != "float32":
+            rows = rows.astype(np.float32)
+        y = x[..., active] @ rows
+        if self.scale is not None:
+            y *= self.scale
+        if self.bias is not None:
+            y += self.bias
+        return y
@@ -0,0 +1,136 @@
+"""
+Outbound message shaping for showdown connections.
+
+Stock showdown servers process at most one message every 600ms per user and
+drop messages once 6 of them are queued, which stalls battles whose /choose
+was dropped. The token bucket below keeps a connection under such a limit,
+serving in-battle decisions before challenges and room management.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+
+from collections import Counter
+
+
+SHOWDOWN_MESSAGES_PER_SECOND = 1 / 0.6
+"""float: sustained message rate accepted by a stock showdown server"""
+
+SHOWDOWN_BURST = 5
+"""int: messages that can be sent at once without filling the server's buffer"""
+
+COMMAND_PRIORITIES = {
+    "/choose": 0,
+    "/move": 0,
+    "/switch": 0,
+    "/team": 0,
+    "/undo": 0,
+    "pass": 0,
+    "/trn": 1,
+    "/accept": 1,
+    "/avatar": 1,
+    "/challenge": 2,
+    "/cancelchallenge": 2,
+    "/forfeit": 2,
+    "/leave": 2,
+}
+"""dict: priority of commands, lower values being sent first. Others get 1"""
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. Waiting messages are served by priority, then in
+    order of arrival.
+    """
+
+    def __init__(self, rate: float, burst: int = SHOWDOWN_BURST) -> None:
+        """
+        Args:
+            rate (float): tokens refilled per second
+
+            burst (int, defaults to SHOWDOWN_BURST): maximum number of tokens
+        """
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._waiters = []
+        self._counter = itertools.count()
+        self._timer = None
+
+        self.sent = Counter()
+        self.delayed = Counter()
+        self.delay = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _release(self) -> None:
+        self._refill()
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+            elif self._tokens >= tokens:
+                heapq.heappop(self._waiters)
+                self._tokens -= tokens
+                future.set_result(None)
+            else:
+                break
+
+    def _schedule(self) -> None:
+        if self._timer is None and self._waiters:
+            missing = self._waiters[0][2] - self._tokens
+            self._timer = asyncio.get_event_loop().call_later(
+                max(0, missing / self.rate), self._on_timer
+            )
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._release()
+        self._schedule()
+
+    async def acquire(self, tokens: int = 1, priority: int = 1, label: str = "") -> None:
+        """
+        Waits until tokens can be consumed.
+
+        Args:
+            tokens (int, defaults to 1): number of tokens to consume
+
+            priority (int, defaults to 1): lower values are served first
+
+            label (str, defaults to ""): name under which the message is counted
+        """
+        tokens = min(tokens, self.burst)
+        self.sent[label] += 1
+        self._refill()
+        if not self._waiters and self._tokens >= tokens:
+            self._tokens -= tokens
+            return
+
+        self.delayed[label] += 1
+        start = time.monotonic()
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), tokens, future))
+        self._release()
+        self._schedule()
+        try:
+            await future
+        finally:
+            self.delay += time.monotonic() - start
+
+    @property
+    def stats(self) -> dict:
+        """
+        dict: messages sent and delayed by label, and total delay in seconds
+        """
+        return {
+            "sent": dict(self.sent),
+            "delayed": dict(self.delayed),
+            "delay": self.delay,
+        }
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Distillation of a model into a compact PolicyNetwork.
+
+FullyConnectedRandomModel reads the 5390 values of the flattened dic_state, and
+both flattening the state and its 5390 x 512 first layer are expensive for an
+actor taking hundreds of decisions per second. The student reads the 75
+features of PolicyNetwork instead, and is trained to choose like the teacher:
+its softmax, restricted to the legal actions of each state, is fit to the
+teacher's one by cross-entropy, optionally softened by a temperature.
+
+The student is trained with NumPy on states recorded by RecordingPlayer, and
+written like the exports of PolicyNetwork.export_npz, with the standardization
+of its inputs folded into its first layer. NumpyPolicyNetwork loads it as is:
+
+Example:
+    >>> weights = distill(teacher.predict(teacher_x), student_x, masks)
+    >>> np.savez("student.npz", **weights)
+    >>> student = NumpyPolicyNetwork("student.npz")
+"""
+
+from environment.battle import Battle
+from environment.utils import batch_flattener
+from players.numpy_policy_network import PolicyNetworkFeatures
+from players.random_random_battle import RandomRandomBattlePlayer
+
+from typing import Dict, List
+
+import copy
+import numpy as np
+
+
+class RecordingPlayer(RandomRandomBattlePlayer):
+    """
+    Random player recording, before each decision, the state of the battle with
+    the legal actions of the request. The battle keeps updating some dicts of its
+    state in place, like the status of the pokemons and the fields: the state is
+    copied as it is when the decision is taken.
+
+    Example:
+        >>> player = RecordingPlayer(...)
+        >>> player.records = records  # list shared by the players of a pool
+    """
+
+    records = None
+
+    async def select_move(self, battle: Battle, *, trapped: bool = False):
+        self.records.append((copy.deepcopy(battle.dic_state), battle.action_mask(trapped=trapped)))
+        return await super().select_move(battle, trapped=trapped)
+
+
+def features(records: List[tuple]) -> Dict[str, np.ndarray]:
+    """
+    Encodes recorded states for the teacher and the student.
+
+    Args:
+        records (list of tuple): (dic_state, action mask) pairs of RecordingPlayer
+
+    Returns:
+        features (dict): "teacher" flattened states, "student" features of
+        PolicyNetwork and "mask" legal actions, stacked
+    """
+    states = [state for state, _ in records]
+    return {
+        "teacher": batch_flattener(states),
+        "student": PolicyNetworkFeatures().format_batch(states),
+        "mask": np.array([mask for _, mask in records], dtype=bool),
+    }
+
+
+def masked_softmax(logits: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    Softmax over the legal actions, zero for the others, as players sample.
+    """
+    logits = np.where(mask, logits, -np.inf)
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def soft_targets(teacher_probs: np.ndarray, mask: np.ndarray, temperature: float = 1.0) -> np.ndarray:
+    """
+    Returns the teacher's distribution over the legal actions, softened by
+    temperature.
+    """
+    logits = np.log(np.maximum(teacher_probs, 1e-12)) / temperature
+    return masked_softmax(logits, mask)
+
+
+def distill(
+    teacher_probs: np.ndarray,
+    x: np.ndarray,
+    mask: np.ndarray,
+    *,
+    hidden: int = 50,
+    epochs: int = 50,
+    batch_size: int = 64,
+    learning_rate: float = 0.003,
+    temperature: float = 1.0,
+    seed: int = 0,
+) -> Dict[str, np.ndarray]:
+    """
+    Trains a student PolicyNetwork to choose like the teacher, with Adam.
+
+    Args:
+        teacher_probs (np.ndarray): predictions of the teacher, (states, 20)
+
+        x (np.ndarray): features of PolicyNetwork of the same states, (states, 75)
+
+        mask (np.ndarray): legal actions of the states, (states, 20)
+
+        hidden (int, defaults to 50): hidden units of the student
+
+        epochs (int, defaults to 50): passes over the states
+
+        batch_size (int, defaults to 64): states per step
+
+        learning_rate (float, defaults to 0.003): step size of Adam
+
+        temperature (float, defaults to 1.0): temperature softening the targets
+
+        seed (int, defaults to 0): seed of the initialization and of the batches
+
+    Returns:
+        weights (dict): arrays named like those of PolicyNetwork.export_npz
+    """
+    rng = np.random.RandomState(seed)
+    # States without any legal action teach nothing
+    keep = mask.any(axis=1)
+    x, mask = x[keep].astype(np.float32), mask[keep]
+    targets = soft_targets(teacher_probs[keep], mask, temperature)
+
+    # Raw stats and HP go up to hundreds: the student learns on standardized
+    # features, folded into its first layer once trained
+    mean, std = x.mean(axis=0), x.std(axis=0)
+    std[std == 0] = 1
+    x = (x - mean) / std
+
+    # Initialized like PolicyNetwork
+    params = {
+        "fc1_kernel": rng.normal(0, 0.3, (x.shape[1], hidden)).astype(np.float32),
+        "fc1_bias": np.full(hidden, 0.1, dtype=np.float32),
+        "fc2_kernel": rng.normal(0, 0.3, (hidden, mask.shape[1])).astype(np.float32),
+        "fc2_bias": np.full(mask.shape[1], 0.1, dtype=np.float32),
+    }
+    moments = {name: (np.zeros_like(p), np.zeros_like(p)) for name, p in params.items()}
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    step = 0
+
+    for _ in range(epochs):
+        order = rng.permutation(len(x))
+        for start in range(0, len(x), batch_size):
+            batch = order[start:start + batch_size]
+            h = np.tanh(x[batch] @ params["fc1_kernel"] + params["fc1_bias"])
+            probs = masked_softmax(h @ params["fc2_kernel"] + params["fc2_bias"], mask[batch])
+
+            # Gradient of the cross-entropy to the targets, averaged over the batch
+            d_logits = (probs - targets[batch]) / len(batch)
+            d_h = (d_logits @ params["fc2_kernel"].T) * (1 - h ** 2)
+            grads = {
+                "fc1_kernel": x[batch].T @ d_h,
+                "fc1_bias": d_h.sum(axis=0),
+                "fc2_kernel": h.T @ d_logits,
+                "fc2_bias": d_logits.sum(axis=0),
+            }
+
+            step += 1
+            for name, grad in grads.items():
+                m, v = moments[name]
+                m *= beta1
+                m += (1 - beta1) * grad
+                v *= beta2
+                v += (1 - beta2) * grad ** 2
+                m_hat, v_hat = m / (1 - beta1 ** step), v / (1 - beta2 ** step)
+                params[name] -= (learning_rate * m_hat / (np.sqrt(v_hat) + epsilon)).astype(np.float32)
+
+    # tanh(((x - mean) / std) @ W + b) == tanh(x @ (W / std) + (b - (mean / std) @ W))
+    kernel = params["fc1_kernel"] / std[:, np.newaxis]
+    return {
+        "fc1_kernel": kernel.astype(np.float32),
+        "fc1_bias": (params["fc1_bias"] - mean @ kernel).astype(np.float32),
+        "fc2_kernel": params["fc2_kernel"],
+        "fc2_bias": params["fc2_bias"],
+        # The student has no value head
+        "value_layer_kernel": np.zeros((hidden, 1), dtype=np.float32),
+    }
+
+
+def agreement(probs: np.ndarray, reference_probs: np.ndarray, mask: np.ndarray) -> float:
+    """
+    Returns how often the most probable legal action of probs is the one of
+    reference_probs, over the states with a legal action.
+    """
+    keep = mask.any(axis=1)
+    choices = np.where(mask, probs, -1)[keep].argmax(axis=1)
+    reference_choices = np.where(mask, reference_probs, -1)[keep].argmax(axis=1)
+    return float(np.mean(choices == reference_choices))
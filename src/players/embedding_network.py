@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+PolicyNetwork reading the species, items, abilities and moves of the pokemons
+through embedding tables.
+
+The features are those of EmbeddingFeatures: 84 integer identifiers, each
+replaced by a row of the table of its kind, and a small block of numbers. The
+embeddings are concatenated with the numbers before the hidden layer of
+PolicyNetwork, and trained with it.
+"""
+from players.numpy_embedding_network import EmbeddingFeatures, NumpyEmbeddingNetwork
+from players.policy_network import PolicyNetwork
+
+import tensorflow as tf
+
+
+class EmbeddingNetwork(EmbeddingFeatures, PolicyNetwork):
+
+    MODEL_NAME = "EmbeddingNetwork"
+
+    NUMPY_MODEL = NumpyEmbeddingNetwork
+
+    def _layer_inputs(self, observations):
+        """
+        Returns the embeddings of the identifiers of the observations, table by
+        table in the order of TOKENS, followed by their numeric features.
+        """
+        ids = tf.cast(observations[:, :self.n_ids], tf.int32)
+        blocks = []
+        for name, positions in self.TOKENS.items():
+            rows, width = self.EMBEDDINGS[name]
+            with tf.variable_scope(name):
+                table = tf.get_variable(
+                    "embedding",
+                    [rows, width],
+                    initializer=tf.random_normal_initializer(mean=0, stddev=0.3),
+                )
+            embedded = tf.nn.embedding_lookup(table, tf.gather(ids, positions, axis=1))
+            blocks.append(tf.reshape(embedded, [-1, len(positions) * width]))
+        blocks.append(observations[:, self.n_ids:])
+        return tf.concat(blocks, axis=1)
@@ -6,17 +6,26 @@ This file is part of the pokemon showdown reinforcement learning bot project,
 created by Randy Kotti, Ombeline Lagé and Haris Sahovic as part of their
 advanced topics in artifical intelligence course at Ecole Polytechnique.
 """
-from environment.utils import data_flattener
+from environment.utils import FlattenPlan, batch_flattener
 from players.base_classes.model_manager import ModelManager
 
+from players.numpy_fully_connected_model import NumpyFullyConnectedModel, WEIGHTS
+
 from keras.models import Sequential
 from keras.layers import Dense
 
+import numpy as np
+import os
+import time
+
 
 class FullyConnectedRandomModel(ModelManager):
 
     MODEL_NAME = "FullyConnected"
 
+    # dic_states share their structure, whatever the instance
+    _flatten_plan = FlattenPlan()
+
     def __init__(self) -> None:
         """
         This defines a fully connected NN going from raw flattened dic_states to a 
@@ -35,6 +44,37 @@ class FullyConnectedRandomModel(ModelManager):
 
     def format_x(self, state:dict):
         """
-        Here, formatted data is just the flattened dic_state.
+        Here, formatted data is just the flattened dic_state, as float32.
+        """
+        return self._flatten_plan(state)
+
+    def format_batch(self, states: list) -> np.ndarray:
+        return batch_flattener(states)
+
+    def export_npz(self, name=None) -> str:
         """
-        return data_flattener(state)
+        Exports the weights of the model to an npz file, to be loaded by
+        NumpyFullyConnectedModel, and checks that it predicts like keras.
+
+        Args:
+            name (str, defaults to None): name of the export in the models
+            directory. If None, the current timestamp is used.
+
+        Returns:
+            path (str): path of the npz file
+        """
+        if name is None:
+            name = str(int(time.time()))
+        directory = os.path.join("models", self.MODEL_NAME)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        path = os.path.join(directory, name + ".npz")
+
+        # get_weights gives the kernel and bias of each Dense layer, in order
+        np.savez(path, **dict(zip(WEIGHTS, self.model.get_weights())))
+
+        # Flattened states are mostly booleans
+        x = np.random.RandomState(0).randint(0, 2, (64, 5390)).astype(np.float32)
+        exported = NumpyFullyConnectedModel(path)
+        np.testing.assert_allclose(exported.predict(x), self.model.predict(x), rtol=1e-4, atol=1e-6)
+        return path
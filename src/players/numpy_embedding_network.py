@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+EmbeddingNetwork running on NumPy, from weights exported by
+EmbeddingNetwork.export_npz.
+
+PolicyNetwork keeps a handful of numbers per pokemon and the first type of each
+move, while FullyConnectedRandomModel one-hot encodes everything into 5390
+values. EmbeddingNetwork reads the species, item, ability and moves of the 12
+pokemons of a battle as integer identifiers, looked up in embedding tables,
+next to a small block of numbers: HP, level, stats, status, weather and fields.
+
+Its input is a single float32 vector of 290 values, the 84 identifiers first,
+so that the prediction cache and the batcher of model managers handle it like
+any other. Identifier 0 stands for an empty slot or an unknown name.
+"""
+
+from environment.battle import Battle
+from environment.utils import MOVES, POKEDEX, to_id
+from players.base_classes.numpy_model_manager import NumpyModelManager
+from players.base_classes.quantized_dense import QuantizedDense
+
+from typing import Dict, Iterable
+
+import numpy as np
+import zlib
+
+
+def _vocabulary(names: Iterable[str]) -> Dict[str, int]:
+    return {name: i + 1 for i, name in enumerate(sorted(set(names)))}
+
+
+SPECIES_IDS = _vocabulary(POKEDEX)
+"""Dict of str to int: identifiers of the species of the pokedex"""
+
+MOVE_IDS = _vocabulary(MOVES)
+"""Dict of str to int: identifiers of the moves of moves.json"""
+
+ABILITY_IDS = _vocabulary(
+    to_id(ability) for species in POKEDEX.values() for ability in species.get("abilities", {}).values()
+)
+"""Dict of str to int: identifiers of the abilities of the pokedex"""
+
+ITEM_BUCKETS = 512
+"""int: items have no data file, their names are hashed into as many identifiers"""
+
+STATUSES = ["tox", "psn", "slp", "par", "brn", "frz", "fnt"]
+"""List of str: status flags of the numeric features, in order"""
+
+WEIGHTS = [
+    "species_embedding",
+    "item_embedding",
+    "ability_embedding",
+    "move_embedding",
+    "fc1_kernel",
+    "fc1_bias",
+    "fc2_kernel",
+    "fc2_bias",
+    "value_layer_kernel",
+]
+"""List of str: arrays of an exported EmbeddingNetwork"""
+
+
+class EmbeddingFeatures:
+    """
+    Features of EmbeddingNetwork, shared by its TensorFlow and NumPy versions.
+    """
+
+    EMBEDDINGS = {
+        "species": (len(SPECIES_IDS) + 1, 16),
+        "item": (ITEM_BUCKETS + 1, 4),
+        "ability": (len(ABILITY_IDS) + 1, 4),
+        "move": (len(MOVE_IDS) + 1, 8),
+    }
+    """Dict of str to (int, int): rows and width of each embedding table"""
+
+    SLOTS = 12
+    """int: pokemons of a state, active then back, ours then the opponent's"""
+
+    n_ids = SLOTS * 7  # Species, item, ability and 4 moves per pokemon
+    n_numbers = SLOTS * 15 + len(Battle.WEATHERS) + 2 * len(Battle.FIELDS)
+    n_features = n_ids + n_numbers
+
+    TOKENS = {
+        "species": [7 * slot for slot in range(SLOTS)],
+        "item": [7 * slot + 1 for slot in range(SLOTS)],
+        "ability": [7 * slot + 2 for slot in range(SLOTS)],
+        "move": [7 * slot + 3 + move for slot in range(SLOTS) for move in range(4)],
+    }
+    """Dict of str to list of int: positions of the identifiers each table embeds"""
+
+    def format_x(self, state: dict):
+        """
+        Formats a dic_state into the identifiers of its pokemons, followed by
+        their numeric features and those of the battle.
+        """
+        return np.array(self._features(state), dtype=np.float32)
+
+    def format_batch(self, states: list) -> np.ndarray:
+        """
+        Formats battle states into an array of shape (len(states), n_features),
+        converted to float32 at once.
+        """
+        return np.array([self._features(state) for state in states], dtype=np.float32).reshape(
+            len(states), self.n_features
+        )
+
+    def _features(self, state: dict) -> list:
+        pokemons = [state["active"], *state["back"], state["opponent_active"], *state["opponent_back"]]
+        ids, numbers = [], []
+        for pokemon in pokemons:
+            ids.extend(self.pokemon_ids(pokemon))
+            numbers.extend(self.pokemon_numbers(pokemon))
+        numbers.extend(state["weather"].values())
+        numbers.extend(state["field"].values())
+        numbers.extend(state["opponent_field"].values())
+        return ids + numbers
+
+    def pokemon_ids(self, pokemon: dict) -> list:
+        ability = pokemon.get("ability")
+        item = pokemon.get("item")
+        moves = [MOVE_IDS.get(move.get("id"), 0) for move in pokemon.get("moves", ())[:4]]
+        return [
+            SPECIES_IDS.get(pokemon.get("species"), 0),
+            zlib.crc32(item.encode()) % ITEM_BUCKETS + 1 if item else 0,
+            ABILITY_IDS.get(ability, 0) if ability else 0,
+            *moves,
+            *[0] * (4 - len(moves)),
+        ]
+
+    def pokemon_numbers(self, pokemon: dict) -> list:
+        current_hp, max_hp = pokemon.get("current_hp") or 0, pokemon.get("max_hp") or 0
+        stats = pokemon.get("stats") or {}
+        status = pokemon.get("status") or {}
+        return [
+            bool(pokemon.get("exists")),
+            current_hp / max_hp if max_hp else 0,
+            (pokemon.get("level") or 0) / 100,
+            # Stats of level 100 pokemons are in the hundreds
+            *[stats.get(stat, 0) / 500 for stat in ("atk", "def", "spa", "spd", "spe")],
+            *[bool(status.get(s)) for s in STATUSES],
+        ]
+
+    def random_observations(self, rng: np.random.RandomState, n: int) -> np.ndarray:
+        """
+        Returns n random inputs, for checking exports.
+        """
+        x = np.zeros((n, self.n_features), dtype=np.float32)
+        for name, positions in self.TOKENS.items():
+            x[:, positions] = rng.randint(0, self.EMBEDDINGS[name][0], (n, len(positions)))
+        x[:, self.n_ids:] = rng.uniform(0, 1, (n, self.n_numbers))
+        return x
+
+
+class NumpyEmbeddingNetwork(EmbeddingFeatures, NumpyModelManager):
+
+    MODEL_NAME = "EmbeddingNetwork"
+
+    WEIGHTS = WEIGHTS
+
+    def build(self, weights: dict) -> None:
+        # Embedding tables are read a row at a time, they are kept in float32
+        self.embeddings = {name: weights[f"{name}_embedding"] for name in self.EMBEDDINGS}
+        self.fc1 = QuantizedDense(weights["fc1_kernel"], weights["fc1_bias"], self.precision)
+        self.fc2 = QuantizedDense(weights["fc2_kernel"], weights["fc2_bias"], self.precision)
+        self.value_layer = QuantizedDense(weights["value_layer_kernel"], precision=self.precision)
+
+    @property
+    def nbytes(self) -> int:
+        return super().nbytes + sum(table.nbytes for table in self.embeddings.values())
+
+    def embed(self, observation: np.ndarray) -> np.ndarray:
+        """
+        Returns the embeddings of the identifiers of observation, table by table
+        in the order of TOKENS, followed by its numeric features.
+        """
+        observation = np.asarray(observation, dtype=np.float32)
+        ids = observation[..., :self.n_ids].astype(np.intp)
+        blocks = [
+            self.embeddings[name][ids[..., positions]].reshape(observation.shape[:-1] + (-1,))
+            for name, positions in self.TOKENS.items()
+        ]
+        blocks.append(observation[..., self.n_ids:])
+        return np.concatenate(blocks, axis=-1)
+
+    def predict(self, observation):
+        logits = self.fc2(np.tanh(self.fc1(self.embed(observation))))
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def predict_value(self, observation):
+        return np.squeeze(self.value_layer(np.tanh(self.fc1(self.embed(observation)))))
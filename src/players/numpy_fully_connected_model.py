@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+FullyConnectedRandomModel running on NumPy, from weights exported by
+FullyConnectedRandomModel.export_npz.
+
+The model goes from the 5390 values of the flattened dic_state to a hidden layer
+of 512 elu units, then to 20 softmax outputs. Its first layer is the bulk of its
+weights, about 11MB in float32, which reduced precisions cut per process.
+
+Only about 300 of the 5390 values are not zero: the first layer only reads the
+kernel rows of the values that are not zero.
+"""
+
+from environment.utils import FlattenPlan, batch_flattener
+from players.base_classes.numpy_model_manager import NumpyModelManager
+from players.base_classes.quantized_dense import QuantizedDense
+
+import numpy as np
+
+WEIGHTS = ["hidden_kernel", "hidden_bias", "output_kernel", "output_bias"]
+"""List of str: arrays of an exported FullyConnectedRandomModel, in keras order"""
+
+
+class NumpyFullyConnectedModel(NumpyModelManager):
+
+    MODEL_NAME = "FullyConnected"
+
+    WEIGHTS = WEIGHTS
+
+    # dic_states share their structure, whatever the instance
+    _flatten_plan = FlattenPlan()
+
+    def build(self, weights: dict) -> None:
+        self.hidden = QuantizedDense(weights["hidden_kernel"], weights["hidden_bias"], self.precision)
+        self.output = QuantizedDense(weights["output_kernel"], weights["output_bias"], self.precision)
+
+    def format_x(self, state: dict):
+        """
+        Here, formatted data is just the flattened dic_state, as float32.
+        """
+        return self._flatten_plan(state)
+
+    def format_batch(self, states: list) -> np.ndarray:
+        return batch_flattener(states)
+
+    def predict(self, observation):
+        hidden = self.hidden.gather(observation)
+        # elu
+        hidden = np.where(hidden > 0, hidden, np.expm1(np.minimum(hidden, 0)))
+        logits = self.output(hidden)
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return exp / exp.sum(axis=-1, keepdims=True)
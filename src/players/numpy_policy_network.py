@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+PolicyNetwork running on NumPy, from weights exported by PolicyNetwork.export_npz.
+
+PolicyNetwork is a 75 -> 50 (tanh) -> 20 softmax perceptron, for which a
+TensorFlow session and its feed_dict cost far more than the computation itself.
+NumpyPolicyNetwork loads the exported weights and computes the same forward
+pass with NumPy, so that players can be run without importing TensorFlow.
+"""
+
+from environment.utils import TYPES
+from players.base_classes.numpy_model_manager import NumpyModelManager
+from players.base_classes.quantized_dense import QuantizedDense
+
+import numpy as np
+
+WEIGHTS = ["fc1_kernel", "fc1_bias", "fc2_kernel", "fc2_bias", "value_layer_kernel"]
+"""List of str: arrays of an exported PolicyNetwork"""
+
+TYPE_INDICES = {type_: i + 1 for i, type_ in enumerate(TYPES)}
+"""Dict of str to int: type feature of each type, 0 being none"""
+
+
+class PolicyNetworkFeatures:
+    """
+    Features of PolicyNetwork, shared by its TensorFlow and NumPy versions.
+    """
+
+    n_features = 4*3 + 9 + 5*9 + 9  # Moves + current pokemon
+                                    # + Other pokemons in hand
+                                    # + 1 Opponent pokemon
+
+    MOVE_WIDTH = 3
+    """int: features of a move: base power, accuracy and type"""
+
+    POKEMON_WIDTH = 9
+    """int: features of a pokemon: stats, HP, level and type"""
+
+    OFFSETS = {"moves": 0, "active": 12, "back": 21, "opponent_active": 66}
+    """Dict of str to int: position of the features of each part of the state"""
+
+    def format_x(self, state: dict, out: np.ndarray = None):
+        """
+        Formats the moves of the active pokemon, then the active pokemon, the
+        pokemons in the back and the opponent's active pokemon, each written at a
+        fixed offset. Missing moves and pokemons are left to zero, extra ones
+        ignored.
+
+        Args:
+            state (dict): battle state
+
+            out (np.ndarray, defaults to None): float32 array of n_features values
+            to write the features to, e.g. a row of a batch. If None, a new one is
+            returned
+
+        Returns:
+            x (np.ndarray): the features, out if given
+        """
+        if out is None:
+            out = np.zeros(self.n_features, dtype=np.float32)
+        else:
+            out.fill(0)
+        active = state["active"]
+        offset = self.OFFSETS["moves"]
+        for move in active.get("moves", ())[:4]:
+            out[offset:offset + self.MOVE_WIDTH] = self.move_to_feature(move)
+            offset += self.MOVE_WIDTH
+        pokemons = [(self.OFFSETS["active"], active), (self.OFFSETS["opponent_active"], state["opponent_active"])]
+        pokemons += [
+            (self.OFFSETS["back"] + i * self.POKEMON_WIDTH, pokemon) for i, pokemon in enumerate(state["back"][:5])
+        ]
+        for offset, pokemon in pokemons:
+            # The empty pokemons padding teams have no stats, and stay zero
+            if "stats" in pokemon:
+                out[offset:offset + self.POKEMON_WIDTH] = self.pokemon_to_feature(pokemon)
+        return out
+
+    def format_batch(self, states: list) -> np.ndarray:
+        """
+        Formats battle states into an array of shape (len(states), n_features),
+        each written in its row.
+        """
+        x = np.zeros((len(states), self.n_features), dtype=np.float32)
+        for row, state in zip(x, states):
+            self.format_x(state, out=row)
+        return x
+
+    @staticmethod
+    def type_index(state: dict) -> int:
+        """
+        Returns 1 + the index in TYPES of the first type of a move or pokemon
+        state, 0 if it has none. Their types are ordered like TYPES.
+        """
+        types = state.get("types")
+        return TYPE_INDICES.get(types[0], 0) if types else 0
+
+    def move_to_feature(self, move) -> tuple:
+        return move.get("base_power", 0), move.get("accuracy", 0), self.type_index(move)
+
+    def pokemon_to_feature(self, pokemon) -> tuple:
+        stats = pokemon["stats"]
+        return (
+            stats["atk"],
+            stats["def"],
+            stats["spa"],
+            stats["spd"],
+            stats["spe"],
+            # Unknown until revealed for the pokemons of the opponent
+            pokemon["current_hp"] or 0,
+            pokemon["max_hp"] or 0,
+            pokemon["level"] or 0,
+            self.type_index(pokemon),
+        )
+
+    def random_observations(self, rng: np.random.RandomState, n: int) -> np.ndarray:
+        """
+        Returns n random inputs, for checking exports.
+        """
+        # Features are raw stats and HP, in the hundreds
+        return rng.uniform(0, 300, (n, self.n_features)).astype(np.float32)
+
+
+class NumpyPolicyNetwork(PolicyNetworkFeatures, NumpyModelManager):
+
+    MODEL_NAME = "PolicyNetwork"
+
+    WEIGHTS = WEIGHTS
+
+    def build(self, weights: dict) -> None:
+        self.fc1 = QuantizedDense(weights["fc1_kernel"], weights["fc1_bias"], self.precision)
+        self.fc2 = QuantizedDense(weights["fc2_kernel"], weights["fc2_bias"], self.precision)
+        self.value_layer = QuantizedDense(weights["value_layer_kernel"], precision=self.precision)
+
+    def predict(self, observation):
+        logits = self.fc2(np.tanh(self.fc1(observation)))
+        # softmax, shifted for stability like tf.nn.softmax
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def predict_value(self, observation):
+        return np.squeeze(self.value_layer(np.tanh(self.fc1(observation))))
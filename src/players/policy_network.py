@@ -7,10 +7,14 @@ created by Randy Kotti, Ombeline Lagé and Haris Sahovic as part of their
 advanced topics in artifical intelligence course at Ecole Polytechnique.
 """
 from environment.utils import data_flattener
+from players.base_classes.frozen_model_manager import FrozenModelManager
 from players.base_classes.model_manager_tf import ModelManagerTF
+from players.numpy_policy_network import NumpyPolicyNetwork, PolicyNetworkFeatures
 
 import tensorflow as tf
 import numpy as np
+import os
+import time
 
 g = 0.99 # discount factor for rewards
 alpha = 0.005  # Initial learning rate
@@ -18,10 +22,17 @@ beta = 0.0001  # Target learning rate
 delta = 0.97  # Learning rate decay
 
 
-class PolicyNetwork(ModelManagerTF):
+class PolicyNetwork(PolicyNetworkFeatures, ModelManagerTF):
 
     MODEL_NAME = "PolicyNetwork"
 
+    INFERENCE_INPUT = "inputs/observations"
+
+    INFERENCE_OUTPUTS = ("actions", "value")
+
+    NUMPY_MODEL = NumpyPolicyNetwork
+    """type: NumpyModelManager loading the exports of export_npz"""
+
     def __init__(
         self,
         gamma=g,
@@ -33,10 +44,6 @@ class PolicyNetwork(ModelManagerTF):
         This defines a fully connected NN going from processed features to a 
         hidden layer of size ???, and then an ouput.
         """
-        self.n_features = 4*3 + 9 + 5*9 + 9 # Moves + current pokemon 
-                                            # + Other pokemons in hand
-                                            # + 1 Opponent pokemon 
-
         self.gamma = gamma
         self.learning_rate = learning_rate
         self.min_learning_rate = min_learning_rate
@@ -57,7 +64,7 @@ class PolicyNetwork(ModelManagerTF):
 
         # Hidden layer (l1)
         layer = tf.layers.dense(
-            inputs=self.tf_obs,
+            inputs=self._layer_inputs(self.tf_obs),
             units=50,
             activation=tf.nn.tanh,  # tanh activation
             kernel_initializer=tf.random_normal_initializer(
@@ -102,7 +109,7 @@ class PolicyNetwork(ModelManagerTF):
             use_bias=False,
             name='value_layer'
         )
-        self.predicted_value = tf.squeeze(self.value_layer)
+        self.predicted_value = tf.squeeze(self.value_layer, name="value")
 
         # Loss function
         self.tf_target = tf.placeholder(tf.float32, name="target")
@@ -115,64 +122,11 @@ class PolicyNetwork(ModelManagerTF):
         self.train_step_value = tf.train.AdamOptimizer(
             self.tf_learning_rate).minimize(self.loss_value)
 
-    def format_x(self, state: dict):
+    def _layer_inputs(self, observations):
         """
-        Here, formatted data is just the flattened dic_state.
+        Returns the inputs of the hidden layer, here the observations themselves.
         """
-
-        active_moves = state["active"]["moves"]
-        active_pokemon = state["active"]
-        back = state["back"]
-        opponent_active_pokemon = state["opponent_active"]
-
-        x = np.array([])
-        for move in active_moves:
-            x = np.concatenate((x, self.move_to_feature(move)))
-        x = np.concatenate((x, self.pokemon_to_feature(active_pokemon)))
-        for pokemon in back:
-            x = np.concatenate((x, self.pokemon_to_feature(pokemon)))
-        x = np.concatenate((x, self.pokemon_to_feature(opponent_active_pokemon)))
-
-        # 75次元にスライスまたはパディング
-        if x.shape[0] > 75:
-            x = x[:75]
-        elif x.shape[0] < 75:
-            x = np.pad(x, (0, 75 - x.shape[0]), 'constant')
-        return x
-
-
-    def move_to_feature(self, move):
-        type = 0
-        for i, t in enumerate(list(move["type"].values())):
-            if t:
-                type = i + 1
-                break
-        return np.array([
-            move["base_power"],
-            move["accuracy"],
-            type
-        ])
-
-
-    def pokemon_to_feature(self, pokemon):
-        type = 0
-        for i, t in enumerate(list(pokemon["type"].values())):
-            if t:
-                type = i + 1
-                break
-
-        return np.array([
-            pokemon["stats"]["atk"], 
-            pokemon["stats"]["def"], 
-            pokemon["stats"]["spa"], 
-            pokemon["stats"]["spd"], 
-            pokemon["stats"]["spe"],
-            pokemon["current_hp"],
-            pokemon["max_hp"],
-            pokemon["level"],
-            type
-        ])
-
+        return observations
 
     def predict(self, observation):
         return self.sess.run(self.probs, feed_dict={self.tf_obs: observation})
@@ -180,6 +134,46 @@ class PolicyNetwork(ModelManagerTF):
     def predict_value(self, observation):
         return self.sess.run(self.predicted_value, feed_dict={self.tf_obs: observation[np.newaxis, :]})
 
+    def export_npz(self, name=None) -> str:
+        """
+        Exports the weights of the network to an npz file, to be loaded by
+        NUMPY_MODEL, and checks that it predicts like the session.
+
+        Args:
+            name (str, defaults to None): name of the export in the models
+            directory. If None, the current timestamp is used.
+
+        Returns:
+            path (str): path of the npz file
+        """
+        if name is None:
+            name = str(int(time.time()))
+        directory = os.path.join("models", self.MODEL_NAME)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        path = os.path.join(directory, name + ".npz")
+
+        graph = self.sess.graph
+        # fc1_kernel is the variable fc1/kernel, and so on
+        weights = self.sess.run(
+            {
+                name: graph.get_tensor_by_name("{}/{}:0".format(*name.rsplit("_", 1)))
+                for name in self.NUMPY_MODEL.WEIGHTS
+            }
+        )
+        np.savez(path, **weights)
+
+        x = self.random_observations(np.random.RandomState(0), 64)
+        exported = self.NUMPY_MODEL(path)
+        np.testing.assert_allclose(exported.predict(x), self.predict(x), rtol=1e-4, atol=1e-6)
+        np.testing.assert_allclose(
+            exported.predict_value(x),
+            self.sess.run(self.predicted_value, feed_dict={self.tf_obs: x}),
+            rtol=1e-4,
+            atol=1e-4,
+        )
+        return path
+
     def discounted_return(self, rewards, t_start=0):
         R = 0
         acc_gamma = 1
@@ -211,10 +205,10 @@ class PolicyNetwork(ModelManagerTF):
     
     def train(self, observations, actions, wins):
         for battle_id in observations.keys():
-            obs = [self.format_x(el) for el in observations[battle_id]]
+            obs = self.format_batch(observations[battle_id])
             act = actions[battle_id]
             none_idx = np.where(np.array(act) != None)[0]
-            obs = [obs[i] for i in none_idx]
+            obs = obs[none_idx]
             act = [act[i] for i in none_idx]
             if wins[battle_id]:
                 # rwd = [1] * len(obs)
@@ -265,4 +259,20 @@ class PolicyNetwork(ModelManagerTF):
             self.update(obs, actions[t], advantage)
         # Learning rate decay
         self.learning_rate = max(
-            self.decay * self.learning_rate, self.min_learning_rate)
\ No newline at end of file
+            self.decay * self.learning_rate, self.min_learning_rate)
+
+class FrozenPolicyNetwork(PolicyNetworkFeatures, FrozenModelManager):
+    """
+    PolicyNetwork loaded from the inference graph written by export_frozen, for
+    players that do not train.
+
+    Example:
+        >>> PolicyNetwork().export_frozen("actor", value=True)
+        >>> model = FrozenPolicyNetwork("actor")
+    """
+
+    MODEL_NAME = PolicyNetwork.MODEL_NAME
+
+    INFERENCE_INPUT = PolicyNetwork.INFERENCE_INPUT
+
+    INFERENCE_OUTPUTS = PolicyNetwork.INFERENCE_OUTPUTS
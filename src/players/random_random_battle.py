@@ -16,6 +16,8 @@ class RandomRandomBattlePlayer(Player):
         server_address: str,
         target_battles: int = 5,
         to_target: str = None,
+        max_pending_challenges: int = None,
+        messages_per_second: float = None,
     ) -> None:
         super(RandomRandomBattlePlayer, self).__init__(
             authentification_address=authentification_address,
@@ -29,6 +31,8 @@ class RandomRandomBattlePlayer(Player):
             target_battles=target_battles,
             to_target=to_target,
             username=username,
+            max_pending_challenges=max_pending_challenges,
+            messages_per_second=messages_per_second,
         )
 
     async def select_move(self, battle: Battle, *, trapped: bool = False) -> str:
@@ -0,0 +1,2 @@
+from .server import MockShowdownServer, REPLAY_USERNAME
+from .transcripts import load_transcripts, save_transcripts
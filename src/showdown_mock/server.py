@@ -0,0 +1,1025 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the pokemon showdown server.
+
+It speaks the subset of the showdown websocket protocol used by the players of
+this project (login, challenges, battle rooms and requests) so that they can be
+run and benchmarked without a node pokemon-showdown server.
+
+Battles are simplified: two teams of six pokemons fight for a bounded number of
+turns, and moves deal random damage. Knocked out pokemons have to be replaced
+through a forced switch, and the side with the most remaining HP wins when the
+turn limit is reached. Requests also randomly trap the active pokemon or disable
+one of its moves, and mega evolution is offered in generations 6 and 7, so that
+choices breaking these rules are answered with an [Invalid choice] error like on
+showdown. With a turn time, a timer like the one of showdown runs: each request
+has to be answered within the time left this turn, taken from a bank refilled a
+little every turn, and players running out of time lose.
+
+Battles can also be replayed from transcripts, i.e. the messages one player
+received during a battle, as recorded by this server or from a real one. Users
+challenging REPLAY_USERNAME get one of them played back, each of their choices
+releasing the messages up to their next decision. Their choices do not matter,
+which makes the speed of a player measurable on realistic battles.
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+
+import websockets
+
+from websockets.protocol import State
+
+from environment.utils import MOVES, POKEDEX, to_id
+
+
+ROSTER = {
+    "pikachu": ["thunderbolt", "quickattack", "irontail", "voltswitch"],
+    "charizard": ["flamethrower", "airslash", "dragonpulse", "roost"],
+    "blastoise": ["hydropump", "icebeam", "rapidspin", "earthquake"],
+    "venusaur": ["gigadrain", "sludgebomb", "sleeppowder", "synthesis"],
+    "snorlax": ["bodyslam", "rest", "crunch", "curse"],
+    "gengar": ["shadowball", "focusblast", "nastyplot", "destinybond"],
+    "garchomp": ["earthquake", "stoneedge", "firefang", "swordsdance"],
+    "dragonite": ["outrage", "extremespeed", "dragondance", "earthquake"],
+    "lucario": ["closecombat", "extremespeed", "swordsdance", "crunch"],
+    "gyarados": ["waterfall", "dragondance", "earthquake", "stoneedge"],
+    "alakazam": ["psychic", "focusblast", "shadowball", "recover"],
+    "tyranitar": ["stoneedge", "crunch", "earthquake", "stealthrock"],
+}
+"""dict: species usable in mock battles, with their moves"""
+
+MEGA_SPECIES = {
+    "alakazam", "blastoise", "charizard", "garchomp", "gengar", "gyarados",
+    "lucario", "tyranitar", "venusaur",
+}
+"""set: species of the roster that can mega evolve"""
+
+TRAP_CHANCE = 0.1
+"""float: probability for the active pokemon to be trapped during a turn"""
+
+DISABLE_CHANCE = 0.1
+"""float: probability for one of the active pokemon's moves to be disabled during a turn"""
+
+SECONDS_BETWEEN_TURNS = 0.0
+"""float: default delay before a turn is resolved"""
+
+TIMER_BANK_TURNS = 5
+"""int: turn times in the starting time bank of the timer"""
+
+TIMER_ADD_PER_TURN = 1 / 6
+"""float: part of the turn time added to the time bank every turn"""
+
+REPLAY_USERNAME = "Transcript Replay"
+"""str: user accepting any challenge with a replayed battle, when transcripts are given"""
+
+THROTTLE_NOTICE = (
+    "|raw|<strong class=\"message-throttle-notice\">Your message was not sent "
+    "because you've been typing too quickly.</strong>"
+)
+"""str: message sent by showdown when a message is dropped by its throttle"""
+
+
+class _Connection:
+    """
+    A client connection, and the user logged in through it.
+    """
+
+    def __init__(self, websocket, latency: float = 0.0) -> None:
+        self.websocket = websocket
+        self.username = None
+        self.pending_room = None
+        self.queue = None
+
+        # Messages are delivered latency seconds after being sent, in order
+        self.latency = latency
+        self._outbox = asyncio.Queue() if latency else None
+        self._writer = asyncio.ensure_future(self._write()) if latency else None
+
+    @property
+    def userid(self) -> str:
+        return to_id(self.username) if self.username else None
+
+    async def send(self, message: str) -> None:
+        if self._outbox is not None:
+            self._outbox.put_nowait((asyncio.get_event_loop().time() + self.latency, message))
+        else:
+            await self._send(message)
+
+    async def _send(self, message: str) -> None:
+        # Sending on a closing connection would wait for it to be closed
+        if self.websocket.state is not State.OPEN:
+            return
+        try:
+            await self.websocket.send(message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def _write(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            deadline, message = await self._outbox.get()
+            await asyncio.sleep(max(0, deadline - loop.time()))
+            await self._send(message)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.cancel()
+
+
+class _MockPokemon:
+    def __init__(self, species: str, rng: random.Random) -> None:
+        data = POKEDEX[species]
+        self.name = data["name"] if "name" in data else species.capitalize()
+        self.level = rng.randint(75, 90)
+        self.gender = rng.choice(["M", "F"])
+        base = data["baseStats"]
+        self.max_hp = int((2 * base["hp"] + 52) * self.level / 100) + self.level + 10
+        self.hp = self.max_hp
+        self.stats = {
+            stat: int((2 * base[stat] + 52) * self.level / 100) + 5
+            for stat in ["atk", "def", "spa", "spd", "spe"]
+        }
+        self.species = species
+        self.moves = list(ROSTER[species])
+        self.pp = {move: MOVES[move]["pp"] for move in self.moves}
+        self.ability = to_id(data["abilities"]["0"])
+
+    @property
+    def fainted(self) -> bool:
+        return self.hp <= 0
+
+    @property
+    def condition(self) -> str:
+        return f"{self.hp}/{self.max_hp}" if self.hp > 0 else "0 fnt"
+
+    @property
+    def details(self) -> str:
+        return f"{self.name}, L{self.level}, {self.gender}"
+
+
+class _MockSide:
+    def __init__(self, connection: _Connection, role: str, rng: random.Random) -> None:
+        self.connection = connection
+        self.name = connection.username
+        self.role = role
+        self.team = [_MockPokemon(s, rng) for s in rng.sample(sorted(ROSTER), 6)]
+        self.active = 0
+        self.choice = None
+        self.last_request = None
+        self.transcript = []
+        # Whether the connection of the side is in the battle room
+        self.in_room = True
+
+        # Timer: seconds left in total, when the current request was sent and the
+        # call making the side lose if it is not answered
+        self.time_bank = None
+        self.request_sent_at = None
+        self.timeout = None
+
+        # Decision expected from the side: "move", "switch" or "wait"
+        self.request_state = "move"
+        self.trapped = False
+        self.disabled = None
+        self.can_mega_evolve = False
+
+    @property
+    def active_pokemon(self) -> _MockPokemon:
+        return self.team[self.active]
+
+    def ident(self, pokemon: _MockPokemon, position: bool = True) -> str:
+        return f"{self.role}{'a' if position else ''}: {pokemon.name}"
+
+    def request(self, rqid: int) -> dict:
+        side = {
+            "name": self.name,
+            "id": self.role,
+            "pokemon": [
+                {
+                    "ident": self.ident(pokemon, position=False),
+                    "details": pokemon.details,
+                    "condition": pokemon.condition,
+                    "active": i == self.active,
+                    "stats": pokemon.stats,
+                    "moves": pokemon.moves,
+                    "baseAbility": pokemon.ability,
+                    "item": "leftovers",
+                    "pokeball": "pokeball",
+                    "ability": pokemon.ability,
+                }
+                for i, pokemon in enumerate(self.team)
+            ],
+        }
+        if self.request_state == "wait":
+            return {"wait": True, "side": side, "rqid": rqid}
+        if self.request_state == "switch":
+            return {"forceSwitch": [True], "side": side, "rqid": rqid}
+
+        pokemon = self.active_pokemon
+        active = {
+            "moves": [
+                {
+                    "move": MOVES[move]["name"],
+                    "id": move,
+                    "pp": pokemon.pp[move],
+                    "maxpp": MOVES[move]["pp"],
+                    "target": MOVES[move]["target"],
+                    "disabled": self.move_disabled(move),
+                }
+                for move in pokemon.moves
+            ]
+        }
+        if self.trapped:
+            active["trapped"] = True
+        if self.can_mega_evolve and pokemon.species in MEGA_SPECIES:
+            active["canMegaEvo"] = True
+        return {"active": [active], "side": side, "rqid": rqid}
+
+    def move_disabled(self, move: str) -> bool:
+        return move == self.disabled or self.active_pokemon.pp[move] <= 0
+
+    def default_choice(self):
+        """
+        Returns the action chosen by /choose default: the first usable move, or
+        the first pokemon that can be switched in.
+        """
+        if self.request_state == "move":
+            for i, move in enumerate(self.active_pokemon.moves):
+                if not self.move_disabled(move):
+                    return ("move", i, False)
+        for i, pokemon in enumerate(self.team):
+            if i != self.active and not pokemon.fainted:
+                return ("switch", i, False)
+        return None
+
+    def parse_choice(self, choice: str):
+        """
+        Returns the (kind, index, mega) action corresponding to a choice, or an
+        error message if the choice is not valid.
+        """
+        words = choice.split()
+        if words and words[0] == "/choose":
+            words = words[1:]
+        elif words:
+            words[0] = words[0].lstrip("/")
+        if words == ["default"] and self.default_choice() is not None:
+            return self.default_choice(), None
+        if len(words) < 2:
+            return None, "[Invalid choice] Unrecognized choice: " + choice
+
+        kind, target = words[0], " ".join(words[1:]).strip()
+        if kind == "switch":
+            if self.request_state == "move" and self.trapped:
+                return None, "[Invalid choice] Can't switch: The active Pokémon is trapped"
+            for i, pokemon in enumerate(self.team):
+                if target == str(i + 1) or to_id(target) == to_id(pokemon.name):
+                    if i == self.active:
+                        return None, f"[Invalid choice] Can't switch: You can't switch to an active Pokémon"
+                    if pokemon.fainted:
+                        return None, "[Invalid choice] Can't switch: You can't switch to a fainted Pokémon"
+                    return ("switch", i, False), None
+            return None, f"[Invalid choice] Can't switch: You do not have a Pokémon named \"{target}\" to switch to"
+        elif kind == "move":
+            if self.request_state == "switch":
+                return None, "[Invalid choice] Can't move: You need a switch response"
+            pokemon = self.active_pokemon
+            move, options = words[1], words[2:]
+            for i, move_id in enumerate(pokemon.moves):
+                if move == str(i + 1) or to_id(move) == move_id:
+                    name = MOVES[move_id]["name"]
+                    if self.move_disabled(move_id):
+                        return None, f"[Invalid choice] Can't move: {pokemon.name}'s {name} is disabled"
+                    if "zmove" in options:
+                        return None, f"[Invalid choice] Can't move: {pokemon.name} can't use {name} as a Z-move"
+                    mega = "mega" in options
+                    if mega and not (self.can_mega_evolve and pokemon.species in MEGA_SPECIES):
+                        return None, f"[Invalid choice] Can't move: {pokemon.name} can't mega evolve"
+                    return ("move", i, mega), None
+            return None, f"[Invalid choice] Can't move: {pokemon.name} doesn't have a move matching {move}"
+        return None, "[Invalid choice] Unrecognized choice: " + choice
+
+
+class _MockBattle:
+    def __init__(
+        self,
+        room_id: str,
+        format: str,
+        p1: _Connection,
+        p2: _Connection,
+        *,
+        max_turns: int,
+        rng: random.Random,
+        transcripts: list = None,
+        turn_time: float = None,
+        timed_out: list = None,
+        latencies: list = None,
+    ) -> None:
+        """
+        Transcripts of finished battles are appended to transcripts, unless it
+        is None. Without turn_time, the timer is off. Users losing on time are
+        appended to timed_out, and the seconds between each request and its
+        answer to latencies, unless they are None.
+        """
+        self.room_id = room_id
+        self.format = format
+        self.sides = [_MockSide(p1, "p1", rng), _MockSide(p2, "p2", rng)]
+        for side in self.sides:
+            side.can_mega_evolve = format[3:4] in ("6", "7")
+        self.max_turns = max_turns
+        self.rng = rng
+        self.rqid = 0
+        self.turn = 0
+        self.ended = False
+        self.lock = asyncio.Lock()
+        self.log = []
+        self.left = set()
+        self.transcripts = transcripts
+        self.turn_time = turn_time
+        self.timed_out = timed_out
+        self.latencies = latencies
+        if turn_time:
+            for side in self.sides:
+                side.time_bank = turn_time * TIMER_BANK_TURNS
+
+    def frame(self, lines) -> str:
+        return "\n".join([f">{self.room_id}"] + list(lines))
+
+    async def send(self, side: _MockSide, lines, record: bool = True) -> None:
+        message = self.frame(lines)
+        if record and self.transcripts is not None:
+            side.transcript.append(message)
+        await side.connection.send(message)
+
+    async def broadcast(self, lines) -> None:
+        self.log.extend(lines)
+        for side in self.sides:
+            await self.send(side, lines)
+
+    async def send_requests(self) -> None:
+        self.rqid += 1
+        for side in self.sides:
+            request = side.request(self.rqid)
+            side.last_request = request
+            side.request_sent_at = time.time()
+            await self.send(side, [f"|request|{json.dumps(request)}"])
+            if self.turn_time and side.request_state != "wait":
+                await self.start_timer(side)
+
+    async def start_timer(self, side: _MockSide) -> None:
+        time_left = min(self.turn_time, side.time_bank)
+        rqid = self.rqid
+        side.timeout = asyncio.get_event_loop().call_later(
+            time_left, lambda: asyncio.ensure_future(self.time_out(side, rqid))
+        )
+        await self.send(
+            side,
+            [f"|inactive|Time left: {int(time_left)} sec this turn | {int(side.time_bank)} sec total"],
+        )
+
+    def stop_timer(self, side: _MockSide) -> None:
+        if side.timeout is None:
+            return
+        side.timeout.cancel()
+        side.timeout = None
+        side.time_bank -= time.time() - side.request_sent_at
+        side.time_bank = min(
+            side.time_bank + self.turn_time * TIMER_ADD_PER_TURN,
+            self.turn_time * TIMER_BANK_TURNS,
+        )
+
+    async def time_out(self, side: _MockSide, rqid: int) -> None:
+        async with self.lock:
+            if self.ended or rqid != self.rqid or side.choice is not None:
+                return
+            if self.timed_out is not None:
+                self.timed_out.append(side.name)
+            await self.win(self.opponent_of(side), ["|", f"|-message|{side.name} lost due to inactivity."])
+
+    async def start(self) -> None:
+        p1, p2 = self.sides
+        await self.broadcast(
+            [
+                "|init|battle",
+                f"|title|{p1.name} vs. {p2.name}",
+                f"|j|☆{p1.name}",
+                f"|j|☆{p2.name}",
+            ]
+        )
+        self.turn = 1
+        await self.send_requests()
+        lines = [
+            "|",
+            f"|t:|{int(time.time())}",
+            "|gametype|singles",
+            f"|player|p1|{p1.name}|1|",
+            f"|player|p2|{p2.name}|1|",
+            "|teamsize|p1|6",
+            "|teamsize|p2|6",
+            f"|gen|{self.format[3] if self.format[3:4].isdigit() else 9}",
+            f"|tier|{self.format}",
+            "|",
+            "|start",
+        ]
+        for side in self.sides:
+            pokemon = side.active_pokemon
+            lines.append(f"|switch|{side.ident(pokemon)}|{pokemon.details}|{pokemon.condition}")
+        lines.append(f"|turn|{self.turn}")
+        await self.broadcast(lines)
+
+    def side_of(self, connection: _Connection) -> _MockSide:
+        for side in self.sides:
+            if side.connection is connection:
+                return side
+        return None
+
+    async def rejoin(self, connection: _Connection) -> None:
+        """
+        Sends the battle log to a player joining the room again, then their
+        request if they still have to choose.
+        """
+        side = self.side_of(connection)
+        if side is None:
+            return
+        await connection.send(self.frame(self.log))
+        if not self.ended and side.choice is None and side.last_request is not None:
+            await connection.send(self.frame([f"|request|{json.dumps(side.last_request)}"]))
+
+    def opponent_of(self, side: _MockSide) -> _MockSide:
+        return self.sides[1] if side is self.sides[0] else self.sides[0]
+
+    async def choose(self, connection: _Connection, choice: str) -> None:
+        side = self.side_of(connection)
+        if side is None:
+            return
+        async with self.lock:
+            if self.ended:
+                return await self.error(side, "[Invalid choice] Can't do anything: The game is over")
+            if side.request_state == "wait":
+                return await self.error(side, "[Invalid choice] There's nothing to choose")
+            action, error = side.parse_choice(choice)
+            if error:
+                return await self.error(side, error)
+            if side.choice is None and self.latencies is not None:
+                self.latencies.append(time.time() - side.request_sent_at)
+            # As on showdown, choosing again before the turn ends replaces the choice
+            side.choice = action
+            self.stop_timer(side)
+            if all(s.choice is not None for s in self.sides if s.request_state != "wait"):
+                await asyncio.sleep(SECONDS_BETWEEN_TURNS)
+                await self.resolve()
+
+    async def error(self, side: _MockSide, message: str) -> None:
+        # Errors answer choices of the player, which a replay does not follow
+        await self.send(side, [f"|error|{message}"], record=False)
+
+    async def forfeit(self, connection: _Connection) -> None:
+        side = self.side_of(connection)
+        if side is None or self.ended:
+            return
+        async with self.lock:
+            await self.win(self.opponent_of(side), ["|", f"|-message|{side.name} forfeited."])
+
+    async def win(self, side: _MockSide, lines) -> None:
+        self.ended = True
+        for player in self.sides:
+            if player.timeout is not None:
+                player.timeout.cancel()
+        await self.broadcast(list(lines) + ["|", f"|win|{side.name}"])
+        if self.transcripts is not None:
+            for player in self.sides:
+                self.transcripts.append(
+                    {
+                        "format": self.format,
+                        "room": self.room_id,
+                        "player": player.name,
+                        "opponent": self.opponent_of(player).name,
+                        "frames": player.transcript,
+                    }
+                )
+
+    async def resolve(self) -> None:
+        lines = ["|", f"|t:|{int(time.time())}"]
+
+        if any(side.request_state == "switch" for side in self.sides):
+            # Knocked out pokemons are replaced before the next turn starts
+            for side in self.sides:
+                if side.request_state == "switch":
+                    self.switch(side, side.choice[1], lines)
+                side.choice = None
+            return await self.next_turn(lines)
+
+        # Switches are resolved first, then moves by decreasing speed
+        ordered = sorted(
+            self.sides,
+            key=lambda s: (s.choice[0] != "switch", -s.active_pokemon.stats["spe"]),
+        )
+        for side in ordered:
+            kind, index, mega = side.choice
+            side.choice = None
+            if kind == "switch":
+                self.switch(side, index, lines)
+            elif not side.active_pokemon.fainted:
+                if mega:
+                    side.can_mega_evolve = False
+                foe = self.opponent_of(side)
+                move_id = side.active_pokemon.moves[index]
+                move = MOVES[move_id]
+                side.active_pokemon.pp[move_id] -= 1
+                lines.append(
+                    f"|move|{side.ident(side.active_pokemon)}|{move['name']}|{foe.ident(foe.active_pokemon)}"
+                )
+                target = foe.active_pokemon
+                if move.get("basePower", 0) and not target.fainted:
+                    damage = int(target.max_hp * self.rng.uniform(0.15, 0.45))
+                    target.hp = max(0, target.hp - damage)
+                    lines.append(f"|-damage|{foe.ident(target)}|{target.condition}")
+                    if target.fainted:
+                        lines.append(f"|faint|{foe.ident(target)}")
+
+        for side in self.sides:
+            if all(pokemon.fainted for pokemon in side.team):
+                return await self.win(self.opponent_of(side), lines)
+
+        if self.turn >= self.max_turns:
+            remaining = [
+                sum(p.hp / p.max_hp for p in side.team) for side in self.sides
+            ]
+            return await self.win(self.sides[int(remaining[1] > remaining[0])], lines)
+
+        fainted = [side for side in self.sides if side.active_pokemon.fainted]
+        if fainted:
+            lines.append("|upkeep")
+            for side in self.sides:
+                side.request_state = "switch" if side in fainted else "wait"
+            await self.send_requests()
+            return await self.broadcast(lines)
+
+        lines.append("|upkeep")
+        await self.next_turn(lines)
+
+    def switch(self, side: _MockSide, index: int, lines) -> None:
+        side.active = index
+        pokemon = side.active_pokemon
+        lines.append(f"|switch|{side.ident(pokemon)}|{pokemon.details}|{pokemon.condition}")
+
+    async def next_turn(self, lines) -> None:
+        """
+        Starts a new turn, with its random trapping and disabling effects.
+        """
+        for side in self.sides:
+            side.request_state = "move"
+            side.trapped = self.rng.random() < TRAP_CHANCE
+            side.disabled = None
+            if self.rng.random() < DISABLE_CHANCE:
+                side.disabled = self.rng.choice(side.active_pokemon.moves)
+        self.turn += 1
+        lines.append(f"|turn|{self.turn}")
+        await self.send_requests()
+        await self.broadcast(lines)
+
+
+class _ReplaySide:
+    def __init__(self, connection: _Connection) -> None:
+        self.connection = connection
+        self.name = connection.username
+        self.role = "p1"
+        self.in_room = True
+
+
+class _ReplayBattle:
+    """
+    Battle played back from a transcript. The player's choices are not checked:
+    each of them releases the messages up to the player's next decision.
+    """
+
+    def __init__(self, room_id: str, transcript: dict, connection: _Connection) -> None:
+        self.room_id = room_id
+        self.format = transcript["format"]
+        self.sides = [_ReplaySide(connection)]
+        self.ended = False
+        self.left = set()
+
+        # Recorded names are replaced by the ones of this battle
+        replacements = {
+            f">{transcript['room']}": f">{room_id}",
+            transcript["player"]: connection.username,
+            transcript["opponent"]: REPLAY_USERNAME,
+        }
+        pattern = re.compile("|".join(map(re.escape, sorted(replacements, key=len, reverse=True))))
+        frames = [
+            pattern.sub(lambda match: replacements[match.group(0)], frame)
+            for frame in transcript["frames"]
+            if "\n|error|" not in frame
+        ]
+
+        # Messages are sent in steps, each ending right before the request
+        # following a decision
+        self.steps = [[]]
+        decision = False
+        for frame in frames:
+            if "|request|" in frame:
+                if decision:
+                    self.steps.append([])
+                request = frame.split("|request|", 1)[1]
+                decision = bool(request) and not json.loads(request).get("wait")
+            self.steps[-1].append(frame)
+        self.next_step = 0
+        self.sent = []
+
+    @property
+    def waiting_choice(self) -> bool:
+        return not self.ended and 0 < self.next_step < len(self.steps)
+
+    async def send_step(self) -> None:
+        step = self.steps[self.next_step]
+        self.next_step += 1
+        for frame in step:
+            self.sent.append(frame)
+            await self.sides[0].connection.send(frame)
+            if "\n|win|" in frame or frame.endswith("\n|tie"):
+                self.ended = True
+        if self.next_step == len(self.steps):
+            self.ended = True
+
+    async def start(self) -> None:
+        await self.send_step()
+
+    def side_of(self, connection: _Connection) -> _ReplaySide:
+        side = self.sides[0]
+        return side if side.connection is connection else None
+
+    async def choose(self, connection: _Connection, choice: str) -> None:
+        if self.side_of(connection) is None:
+            return
+        if not self.waiting_choice:
+            return await connection.send(
+                f">{self.room_id}\n|error|[Invalid choice] There's nothing to choose"
+            )
+        await self.send_step()
+
+    async def rejoin(self, connection: _Connection) -> None:
+        if self.side_of(connection) is None:
+            return
+        log, request = [], None
+        for frame in self.sent:
+            for line in frame.split("\n")[1:]:
+                if line.startswith("|request|"):
+                    request = line
+                else:
+                    log.append(line)
+        await connection.send("\n".join([f">{self.room_id}"] + log))
+        if self.waiting_choice and request is not None:
+            await connection.send(f">{self.room_id}\n{request}")
+
+    async def forfeit(self, connection: _Connection) -> None:
+        side = self.side_of(connection)
+        if side is None or self.ended:
+            return
+        self.ended = True
+        await connection.send(
+            f">{self.room_id}\n|-message|{side.name} forfeited.\n|\n|win|{REPLAY_USERNAME}"
+        )
+
+
+class MockShowdownServer:
+    """
+    Pure python stand-in for a local pokemon showdown server.
+
+    Example:
+        >>> async with MockShowdownServer(port=0) as server:
+        ...     player = RandomRandomBattlePlayer(..., server_address=server.address)
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        *,
+        max_turns: int = 5,
+        seed: int = None,
+        throttle_delay: float = 0.0,
+        throttle_buffer: int = 6,
+        latency: float = 0.0,
+        transcripts: list = None,
+        record_transcripts: bool = False,
+        turn_time: float = None,
+    ) -> None:
+        """
+        Args:
+            host (str, defaults to 127.0.0.1): interface to listen on
+
+            port (int, defaults to 8000): port to listen on. 0 picks a free port.
+
+            max_turns (int, defaults to 5): number of turns after which a battle is
+            decided on remaining HP
+
+            seed (int, defaults to None): seed of the battles' random generator
+
+            throttle_delay (float, defaults to 0.0): seconds spent on each message
+            of a user, as showdown's chat throttle does. 0 disables throttling.
+
+            throttle_buffer (int, defaults to 6): messages a throttled user can
+            have queued before the next ones are dropped
+
+            latency (float, defaults to 0.0): seconds after which messages sent by
+            the server are delivered
+
+            transcripts (list, defaults to None): transcripts played back to users
+            challenging REPLAY_USERNAME, in turn. See transcripts.load_transcripts.
+
+            record_transcripts (bool, defaults to False): whether to keep the
+            transcripts of both players of simulated battles, in
+            recorded_transcripts
+
+            turn_time (float, defaults to None): most seconds to answer a request
+            of a simulated battle, before the player loses. None turns the timer off.
+        """
+        self._host = host
+        self._port = port
+        self._max_turns = max_turns
+        self._rng = random.Random(seed)
+        self._throttle_delay = throttle_delay
+        self._throttle_buffer = throttle_buffer
+        self._throttled = 0
+        self._latency = latency
+        self._transcripts = list(transcripts or [])
+        self._recorded_transcripts = [] if record_transcripts else None
+        self._turn_time = turn_time
+        self._timed_out = []
+        self._latencies = []
+
+        self._server = None
+        self._users = {}
+        self._challenges = []
+        self._battles = {}
+        self._battle_count = 0
+
+    async def __aenter__(self) -> "MockShowdownServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.stop()
+
+    async def start(self) -> None:
+        self._server = await websockets.serve(self._handler, self._host, self._port)
+        self._port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handler(self, websocket, path=None) -> None:
+        connection = _Connection(websocket, self._latency)
+        await connection.send(f"|challstr|4|{self._rng.getrandbits(128):032x}")
+        worker = None
+        if self._throttle_delay:
+            connection.queue = asyncio.Queue()
+            worker = asyncio.ensure_future(self._throttled_worker(connection))
+        try:
+            async for message in websocket:
+                if connection.queue is None:
+                    await self._manage_message(connection, message)
+                elif connection.queue.qsize() >= self._throttle_buffer:
+                    self._throttled += 1
+                    await connection.send(THROTTLE_NOTICE)
+                else:
+                    connection.queue.put_nowait(message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            connection.close()
+            if worker is not None:
+                worker.cancel()
+            if connection.userid and self._users.get(connection.userid) is connection:
+                del self._users[connection.userid]
+
+    async def _throttled_worker(self, connection: _Connection) -> None:
+        while True:
+            message = await connection.queue.get()
+            await self._manage_message(connection, message)
+            await asyncio.sleep(self._throttle_delay)
+
+    async def _manage_message(self, connection: _Connection, message: str) -> None:
+        message = message.rstrip("\n")
+        if "|" not in message:
+            # Players send battle commands on two lines: the room first, then the
+            # command itself.
+            if message.startswith(">"):
+                connection.pending_room = message[1:]
+                return
+            room, body = connection.pending_room or "", message
+        else:
+            room, body = message.split("|", 1)
+            room = room.lstrip(">")
+        connection.pending_room = None
+
+        for line in body.split("\n"):
+            if line:
+                await self._command(connection, room, line)
+
+    async def _command(self, connection: _Connection, room: str, line: str) -> None:
+        command, _, argument = line.partition(" ")
+        battle = self._battles.get(room)
+
+        if command == "/trn":
+            connection.username = argument.split(",")[0].strip()
+            self._users[connection.userid] = connection
+            await connection.send(f"|updateuser| {connection.username}|1|1|{{}}")
+            # A reconnecting user takes their battles over
+            for battle in self._battles.values():
+                for side in battle.sides:
+                    if side.connection.userid == connection.userid:
+                        side.connection = connection
+                        side.in_room = False
+            await self._update_search(connection)
+        elif command == "/challenge":
+            target, _, format = argument.partition(",")
+            await self._challenge(connection, to_id(target), format.strip())
+        elif command == "/accept":
+            await self._accept(connection, to_id(argument))
+        elif command == "/cancelchallenge":
+            await self._cancel_challenge(connection, to_id(argument))
+        elif command in ["/choose", "/switch", "/move"] and battle is not None:
+            await battle.choose(connection, line)
+        elif command == "/join":
+            if argument in self._battles:
+                joined = self._battles[argument]
+                side = joined.side_of(connection)
+                # As on showdown, joining a room already joined does nothing
+                if side is not None and side.in_room:
+                    return
+                if side is not None:
+                    side.in_room = True
+                await joined.rejoin(connection)
+            else:
+                await connection.send(
+                    f">{argument}\n|noinit|nonexistent|The room \"{argument}\" does not exist."
+                )
+        elif command == "/forfeit" and battle is not None:
+            await battle.forfeit(connection)
+        elif command == "/leave" and battle is not None:
+            # Rooms are kept until both players left, so that they can rejoin
+            side = battle.side_of(connection)
+            if side is not None and side.in_room:
+                side.in_room = False
+                await connection.send(f">{room}\n|deinit")
+            if battle.ended and side is not None:
+                battle.left.add(side.role)
+                if len(battle.left) == len(battle.sides):
+                    self._battles.pop(room, None)
+
+    async def _challenge(self, connection: _Connection, target: str, format: str) -> None:
+        if target == to_id(REPLAY_USERNAME) and self._transcripts:
+            return await self._start_replay(connection)
+        if target not in self._users:
+            return await connection.send(f"|popup|The user '{target}' was not found.")
+        if target == connection.userid:
+            return await connection.send("|popup|You can't battle yourself.")
+        # Like on showdown, two users have at most one challenge between them
+        for sender, receiver, challenge_format in self._challenges:
+            if {sender, receiver} == {connection.userid, target}:
+                return await connection.send(
+                    f"|popup|There is already a challenge ({challenge_format}) between {sender} and {receiver}!"
+                )
+        self._challenges.append((connection.userid, target, format))
+        await self._update_challenges(connection.userid)
+        await self._update_challenges(target)
+        await self._users[target].send(
+            f"|pm| {connection.username}| {self._users[target].username}|/challenge {format}"
+        )
+
+    async def _start_replay(self, connection: _Connection) -> None:
+        transcript = self._transcripts[self._battle_count % len(self._transcripts)]
+        self._battle_count += 1
+        room_id = f"battle-{transcript['format']}-{self._battle_count}"
+        battle = _ReplayBattle(room_id, transcript, connection)
+        self._battles[room_id] = battle
+        await self._update_search(connection)
+        await battle.start()
+
+    async def _cancel_challenge(self, connection: _Connection, target: str) -> None:
+        for i, (sender, receiver, _) in enumerate(self._challenges):
+            if (sender, receiver) == (connection.userid, target):
+                del self._challenges[i]
+                await self._update_challenges(connection.userid)
+                await self._update_challenges(target)
+                return
+
+    async def _accept(self, connection: _Connection, challenger: str) -> None:
+        format = None
+        for i, (sender, receiver, challenge_format) in enumerate(self._challenges):
+            if (sender, receiver) == (challenger, connection.userid):
+                format = challenge_format
+                del self._challenges[i]
+                break
+        if format is None or challenger not in self._users:
+            return await connection.send(
+                f"|popup|{challenger} is not challenging you. Maybe they cancelled before you accepted?"
+            )
+        await self._update_challenges(challenger)
+        await self._update_challenges(connection.userid)
+
+        self._battle_count += 1
+        room_id = f"battle-{format}-{self._battle_count}"
+        battle = _MockBattle(
+            room_id,
+            format,
+            self._users[challenger],
+            connection,
+            max_turns=self._max_turns,
+            rng=self._rng,
+            transcripts=self._recorded_transcripts,
+            turn_time=self._turn_time,
+            timed_out=self._timed_out,
+            latencies=self._latencies,
+        )
+        self._battles[room_id] = battle
+        for side in battle.sides:
+            await self._update_search(side.connection)
+        await battle.start()
+
+    async def _update_search(self, connection: _Connection) -> None:
+        """
+        Sends the battles the user of connection is playing.
+        """
+        games = {
+            battle.room_id: f"[Gen {battle.format[3:4]}] {battle.format}"
+            for battle in self._battles.values()
+            if not battle.ended
+            and any(side.connection.userid == connection.userid for side in battle.sides)
+        }
+        await connection.send(
+            "|updatesearch|"
+            + json.dumps({"searching": [], "games": games or None}, separators=(",", ":"))
+        )
+
+    async def _update_challenges(self, userid: str) -> None:
+        connection = self._users.get(userid)
+        if connection is None:
+            return
+        challenges_from = {
+            sender: format
+            for sender, receiver, format in self._challenges
+            if receiver == userid
+        }
+        challenge_to = None
+        for sender, receiver, format in self._challenges:
+            if sender == userid:
+                challenge_to = {"to": receiver, "format": format}
+        await connection.send(
+            "|updatechallenges|"
+            + json.dumps({"challengesFrom": challenges_from, "challengeTo": challenge_to})
+        )
+
+    async def disconnect(self, username: str) -> None:
+        """
+        Drops the connection of a user without closing handshake, as a network
+        failure would.
+        """
+        connection = self._users.get(to_id(username))
+        if connection is not None:
+            connection.websocket.transport.abort()
+
+    @property
+    def address(self) -> str:
+        """
+        str: server address, in the format expected by players
+        """
+        return f"{self._host}:{self._port}"
+
+    @property
+    def battles_started(self) -> int:
+        return self._battle_count
+
+    @property
+    def recorded_transcripts(self) -> list:
+        """
+        list: transcripts of the simulated battles that ended, if recorded
+        """
+        return self._recorded_transcripts
+
+    @property
+    def decision_latencies(self) -> list:
+        """
+        list: seconds between each request of the simulated battles and its first
+        valid answer
+        """
+        return self._latencies
+
+    @property
+    def timed_out(self) -> list:
+        """
+        list: users who lost a battle by running out of time, once per battle
+        """
+        return self._timed_out
+
+    @property
+    def messages_throttled(self) -> int:
+        """
+        int: messages dropped because their user was typing too quickly
+        """
+        return self._throttled
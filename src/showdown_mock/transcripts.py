@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Battle transcripts, i.e. the messages received by one player during a battle.
+
+Transcripts are stored as json lines, one battle per line:
+
+    {"format": "gen7randombattle", "room": "battle-gen7randombattle-1",
+     "player": "bot_1", "opponent": "bot_2", "frames": [">battle-gen7randombattle-1\\n|init|battle", ...]}
+
+where frames are the websocket messages of the battle room, in order.
+"""
+
+import json
+
+from typing import List
+
+
+def load_transcripts(path: str) -> List[dict]:
+    """
+    Loads the transcripts saved in path.
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_transcripts(path: str, transcripts: List[dict]) -> None:
+    """
+    Saves transcripts in path, one per line.
+    """
+    with open(path, "w") as f:
+        for transcript in transcripts:
+            f.write(json.dumps(transcript) + "\n")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules of the bot import each other from src, like when run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,126 @@
+"""
+Challenges of players in challenge mode, at most one pending per opponent like
+showdown allows, and the mock server refusing the others.
+"""
+import asyncio
+import time
+
+import websockets
+
+from benchmark_battles_per_minute import make_player, run_battles
+from players.random_random_battle import RandomRandomBattlePlayer
+from showdown_mock import MockShowdownServer
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        # Battle watchers sleep until their next timeout
+        for task in asyncio.all_tasks(loop):
+            task.cancel()
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
+
+
+def make_challenger(to_target="receiver", **kwargs):
+    player = RandomRandomBattlePlayer(
+        "challenger",
+        "",
+        "challenge",
+        authentification_address="http://localhost",
+        max_concurrent_battles=3,
+        server_address="localhost",
+        target_battles=10,
+        to_target=to_target,
+        **kwargs,
+    )
+    player.sent = []
+
+    async def send_message(message, room="", message_2=None):
+        player.sent.append(message)
+
+    player.send_message = send_message
+    player._logged_in = True
+    return player
+
+
+def test_server_refuses_a_second_challenge_between_the_same_users():
+    async def scenario():
+        async with MockShowdownServer(port=0) as server:
+            address = f"ws://{server.address}/showdown/websocket"
+            async with websockets.connect(address) as challenger, websockets.connect(address) as receiver:
+                for websocket, name in [(challenger, "challenger"), (receiver, "receiver")]:
+                    await websocket.recv()
+                    await websocket.send(f"|/trn {name},0,")
+                    while not (await websocket.recv()).startswith("|updateuser|"):
+                        pass
+                for _ in range(2):
+                    await challenger.send("|/challenge receiver, gen7randombattle")
+                while True:
+                    message = await asyncio.wait_for(challenger.recv(), 1)
+                    if message.startswith("|popup|"):
+                        return message
+
+    assert run(scenario()) == (
+        "|popup|There is already a challenge (gen7randombattle) between challenger and receiver!"
+    )
+
+
+def test_one_challenge_is_pending_per_target():
+    player = make_challenger()
+    assert player.max_pending_challenges == 1
+    run(player._send_challenge())
+    assert player.sent == ["/challenge receiver, gen7randombattle"]
+    assert not player._can_challenge
+
+    player = make_challenger(to_target=["receiver", "other"])
+    assert player.max_pending_challenges == 2
+    run(player._send_challenge())
+    run(player._send_challenge())
+    assert player.sent == [
+        "/challenge receiver, gen7randombattle",
+        "/challenge other, gen7randombattle",
+    ]
+    assert not player._can_challenge
+
+
+def test_refusing_target_is_not_challenged_again_right_away():
+    player = make_challenger()
+    run(player._send_challenge())
+    run(player._challenge_refused("There is already a challenge (gen7randombattle) between challenger and receiver!"))
+    assert player.challenge_stats["refused"] == 1
+    assert not player._pending_challenges
+    assert not player._can_challenge
+
+    player._refused_challenges["receiver"] = time.time() - player.CHALLENGE_RETRY_DELAY
+    assert player._can_challenge
+
+
+def test_expired_challenges_are_cancelled():
+    player = make_challenger()
+    run(player._send_challenge())
+    player._pending_challenges = [("receiver", time.time() - player.CHALLENGE_TIMEOUT - 1)]
+    run(player._expire_challenges())
+    assert player.sent[-1] == "/cancelchallenge receiver"
+    assert player.challenge_stats["expired"] == 1
+    assert player._can_challenge
+
+
+def test_concurrent_battles_against_one_target_are_never_refused():
+    players = []
+
+    def player_factory(**kwargs):
+        players.append(make_player(0.0, None, **kwargs))
+        return players[-1]
+
+    async def scenario():
+        async with MockShowdownServer(port=0, max_turns=2, seed=0) as server:
+            await run_battles(server, 6, 3, player_factory=player_factory)
+
+    run(scenario())
+    challenger = players[0]
+    assert challenger.total_battles == 6
+    assert challenger.challenge_stats["refused"] == 0
+    assert challenger.challenge_stats["accepted"] == 6
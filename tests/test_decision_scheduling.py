@@ -0,0 +1,97 @@
+"""
+Decisions of concurrent battles taken by earliest deadline first, at most
+max_decisions_in_flight at a time.
+"""
+import asyncio
+import time
+
+from players.random_random_battle import RandomRandomBattlePlayer
+
+
+class Battle:
+    TURN_TIME = 150
+
+    def __init__(self, battle_tag, deadline):
+        self.battle_tag = battle_tag
+        self.decision_deadline = time.time() + deadline
+        self.finished = False
+        self.is_ready = True
+        self.slack = deadline
+
+
+class Player(RandomRandomBattlePlayer):
+    """
+    Player whose decisions last until they are released, one by one.
+    """
+
+    def __init__(self):
+        super().__init__("player", "", authentification_address="http://localhost", server_address="localhost")
+        self.max_decisions_in_flight = 2
+        self.started = []
+        self.most_in_flight = 0
+        self.released = {}
+
+    async def select_save_move(self, battle, *, trapped=False):
+        self.started.append(battle.battle_tag)
+        self.most_in_flight = max(self.most_in_flight, self.decisions_in_flight)
+        self.released[battle.battle_tag] = asyncio.Event()
+        await self.released[battle.battle_tag].wait()
+
+
+def run(scenario):
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+
+
+async def release(player, tag):
+    player.released[tag].set()
+    # The decision ends, and the next one starts
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_decisions_start_by_earliest_deadline():
+    player = Player()
+
+    async def scenario():
+        for tag, deadline in [("a", 50), ("b", 10), ("c", 40), ("d", 20), ("e", 30)]:
+            player.schedule_decision(Battle(tag, deadline))
+        await asyncio.sleep(0)
+        # The first two run at once, the others wait
+        assert player.started == ["a", "b"]
+        await release(player, "a")
+        assert player.started == ["a", "b", "d"]
+        for tag in ["b", "d", "e", "c"]:
+            await release(player, tag)
+
+    run(scenario)
+    assert player.started == ["a", "b", "d", "e", "c"]
+    assert player.most_in_flight == 2
+    assert player.decisions_in_flight == 0
+
+
+def test_rescheduled_and_finished_battles_are_skipped():
+    player = Player()
+
+    async def scenario():
+        for tag, deadline in [("a", 1), ("b", 1)]:
+            player.schedule_decision(Battle(tag, deadline))
+        late, finished = Battle("late", 10), Battle("finished", 20)
+        player.schedule_decision(late)
+        player.schedule_decision(finished)
+        player.schedule_decision(Battle("other", 30))
+        # The timer moved the deadline of late after that of other
+        late.decision_deadline = time.time() + 40
+        player.schedule_decision(late)
+        finished.finished = True
+        await asyncio.sleep(0)
+        for tag in ["a", "b", "other", "late"]:
+            await release(player, tag)
+
+    run(scenario)
+    assert player.started == ["a", "b", "other", "late"]
+    assert not player._decision_queue
+    assert not player._scheduled_decisions
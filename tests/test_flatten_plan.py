@@ -0,0 +1,63 @@
+"""
+FlattenPlan following data_flattener, and rejecting states whose structure
+drifts from the first one.
+"""
+import numpy as np
+import pytest
+
+from environment.pokemon import EmptyPokemon
+from environment.utils import FlattenPlan, data_flattener
+
+
+def make_pokemon(abilities):
+    return {"abilities": abilities, "hp": 0.5, "level": 80, "stats": {"atk": 120, "spe": 90}}
+
+
+def make_state(abilities=None, back=5):
+    return {
+        "opponent_active": make_pokemon(abilities or {"0": "Static", "H": "Lightning Rod"}),
+        "opponent_back": [make_pokemon({"0": "Torrent"}) for _ in range(back)],
+        "weather": {"none": True, "RainDance": False},
+    }
+
+
+def test_names_with_varying_keys_are_skipped():
+    plan = FlattenPlan()
+    for abilities in [
+        {"0": "Static", "H": "Lightning Rod"},
+        {"0": "Aura Break", "1": "Power Construct"},
+        {"0": "Shield Dust", "1": "Compound Eyes", "H": "Friend Guard"},
+        {"0": "Swift Swim", "S": "Tinted Lens"},
+    ]:
+        state = make_state(abilities)
+        np.testing.assert_array_equal(plan(state), np.array(data_flattener(state), dtype=np.float32))
+
+
+@pytest.mark.parametrize("drift", [
+    lambda state: state["weather"].pop("RainDance"),
+    lambda state: state["weather"].update(Hail=False),
+    lambda state: state["opponent_active"]["stats"].update(spa=100),
+])
+def test_keys_changes_are_rejected(drift):
+    plan = FlattenPlan()
+    plan(make_state())
+    state = make_state()
+    drift(state)
+    with pytest.raises(ValueError, match="schema drifted"):
+        plan(state)
+
+
+def test_list_length_changes_are_rejected():
+    plan = FlattenPlan()
+    plan(make_state())
+    with pytest.raises(ValueError, match="schema drifted"):
+        plan(make_state(back=4))
+
+
+def test_empty_pokemons_fill_the_places_of_pokemons():
+    empty = EmptyPokemon().dic_state
+    plan = FlattenPlan()
+    pokemon = dict(empty)
+    pokemon["exists"] = True
+    for state in [{"back": [empty, empty]}, {"back": [pokemon, empty]}, {"back": [empty, pokemon]}]:
+        np.testing.assert_array_equal(plan(state), np.array(data_flattener(state), dtype=np.float32))
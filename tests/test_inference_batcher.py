@@ -0,0 +1,117 @@
+"""
+InferenceBatcher running the inputs of concurrent decisions as batches, without
+those given up on, and gathering inputs while its executor is busy.
+"""
+import asyncio
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from players.base_classes.inference_batcher import InferenceBatcher
+
+
+def run(scenario):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(asyncio.wait_for(scenario(), 5))
+    finally:
+        loop.close()
+
+
+class Model:
+    """
+    Doubles its inputs, recording the batches it is given.
+    """
+
+    def __init__(self, blocked=False):
+        self.batches = []
+        self.unblocked = threading.Event()
+        if not blocked:
+            self.unblocked.set()
+
+    def predict(self, batch):
+        self.batches.append(batch[:, 0].tolist())
+        self.unblocked.wait(5)
+        return batch * 2
+
+
+def test_inputs_of_a_window_run_as_one_batch():
+    model = Model()
+    batcher = InferenceBatcher(model.predict, window=0.01)
+
+    async def scenario():
+        return await asyncio.gather(*[batcher.predict(np.full(2, i, dtype=np.float32)) for i in range(3)])
+
+    results = run(scenario)
+    assert model.batches == [[0, 1, 2]]
+    assert [result.tolist() for result in results] == [[0, 0], [2, 2], [4, 4]]
+
+
+def test_full_batch_runs_without_waiting_for_the_window():
+    model = Model()
+    batcher = InferenceBatcher(model.predict, window=10, max_batch_size=2)
+
+    async def scenario():
+        return await asyncio.gather(*[batcher.predict(np.full(1, i, dtype=np.float32)) for i in range(2)])
+
+    run(scenario)
+    assert model.batches == [[0, 1]]
+
+
+def test_cancelled_inputs_are_not_predicted():
+    model = Model()
+    batcher = InferenceBatcher(model.predict, window=0.01)
+
+    async def scenario():
+        tasks = [asyncio.ensure_future(batcher.predict(np.full(1, i, dtype=np.float32))) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks[1].cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert isinstance(results[1], asyncio.CancelledError)
+        return results[0], results[2]
+
+    first, last = run(scenario)
+    assert model.batches == [[0, 2]]
+    assert (first.tolist(), last.tolist()) == ([0], [4])
+    assert batcher.mean_batch_size == 2
+
+
+def test_inputs_gather_while_the_running_batches_are_full():
+    model = Model(blocked=True)
+    executor = ThreadPoolExecutor(1)
+    batcher = InferenceBatcher(model.predict, window=0, executor=executor, max_running_batches=1)
+
+    async def scenario():
+        first = asyncio.ensure_future(batcher.predict(np.full(1, 0, dtype=np.float32)))
+        while not model.batches:
+            await asyncio.sleep(0.001)
+        # The only thread is busy: these wait for it, then run together
+        others = [asyncio.ensure_future(batcher.predict(np.full(1, i, dtype=np.float32))) for i in (1, 2, 3)]
+        await asyncio.sleep(0.02)
+        others[0].cancel()
+        model.unblocked.set()
+        return await first, await others[1], await others[2]
+
+    try:
+        results = run(scenario)
+    finally:
+        executor.shutdown()
+    assert model.batches == [[0], [2, 3]]
+    assert [result.tolist() for result in results] == [[0], [4], [6]]
+
+
+def test_errors_reach_every_input_of_the_batch():
+    def predict(batch):
+        raise RuntimeError("session closed")
+
+    batcher = InferenceBatcher(predict, window=0.01)
+
+    async def scenario():
+        return await asyncio.gather(
+            *[batcher.predict(np.zeros(1, dtype=np.float32)) for _ in range(2)], return_exceptions=True
+        )
+
+    errors = run(scenario)
+    assert [str(error) for error in errors] == ["session closed"] * 2
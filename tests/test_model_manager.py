@@ -0,0 +1,119 @@
+"""
+Decisions left to random_move by the players of model managers, and training on
+the histories they are recorded in.
+"""
+import asyncio
+
+import numpy as np
+import pytest
+
+from environment.pokemon import Pokemon
+
+
+def make_state():
+    """
+    Returns a dic_state with a team of 6 pokemons on each side.
+    """
+    def pokemon(name, active=False):
+        pokemon = Pokemon(ident=f"p1a: {name}")
+        pokemon.active = active
+        pokemon.current_hp = pokemon.max_hp = 100
+        pokemon.level = 80
+        pokemon.update_from_move("thunderbolt")
+        return pokemon.dic_state
+
+    names = ["Pikachu", "Charizard", "Blastoise", "Venusaur", "Gengar", "Snorlax"]
+    return {
+        "active": pokemon(names[0], active=True),
+        "back": [pokemon(name) for name in names[1:]],
+        "opponent_active": pokemon(names[0], active=True),
+        "opponent_back": [pokemon(name) for name in names[1:]],
+        "weather": {"none": True},
+        "field": {"Spikes": False},
+        "opponent_field": {"Spikes": False},
+    }
+
+
+class LegalActions:
+    def commands(self, switches=True):
+        return ["/choose move 1|1"]
+
+
+class Battle:
+    """
+    Battle with a single legal action, the first move.
+    """
+
+    battle_tag = "battle-gen7randombattle-1"
+    battle_num = 1
+    legal_actions = LegalActions()
+
+    def __init__(self):
+        self.dic_state = make_state()
+
+    def action_mask(self, trapped=False):
+        mask = np.zeros(20, dtype=bool)
+        mask[5] = True
+        return mask
+
+    def action_command(self, action):
+        return "/choose move 1|1" if action == 5 else None
+
+    def decision_sent(self):
+        pass
+
+
+def decide(player, battle):
+    sent = []
+
+    async def send_room_message(message, room):
+        sent.append(message)
+
+    player.send_room_message = send_room_message
+    asyncio.get_event_loop().run_until_complete(player.select_save_move(battle))
+    return sent
+
+
+def test_fallback_decision_is_recorded_as_none():
+    from players.base_classes.model_manager_tf import ModelManagerTF
+
+    class NanModel(ModelManagerTF):
+        MODEL_NAME = "NanModel"
+        BATCH_WINDOW = 0.0
+        INFERENCE_THREADS = 0
+
+        def format_x(self, state):
+            return np.zeros(3, dtype=np.float32)
+
+        def predict(self, x):
+            return np.full((len(x), 20), np.nan, dtype=np.float32)
+
+        def train(self, observations, actions, wins):
+            pass
+
+    player = NanModel().get_player(
+        "user", "password", "challenge", authentification_address="http://localhost", server_address="localhost", epsilon=1
+    )
+    sent = decide(player, Battle())
+    assert sent == ["/choose move 1|1"]
+    assert player.actions[Battle.battle_num] == [None]
+
+
+def test_policy_network_trains_on_fallback_decision(tmp_path, monkeypatch):
+    pytest.importorskip("tensorflow")
+    from players.policy_network import PolicyNetwork
+
+    monkeypatch.chdir(tmp_path)
+    model = PolicyNetwork()
+    state = make_state()
+    model.train({1: [state, state, state]}, {1: [5, None, 5]}, {1: True})
+
+
+def test_model_manager_trains_on_fallback_decision(tmp_path, monkeypatch):
+    pytest.importorskip("keras")
+    from players.fully_connected_random_model import FullyConnectedRandomModel
+
+    monkeypatch.chdir(tmp_path)
+    model = FullyConnectedRandomModel()
+    state = make_state()
+    model.train([state, state, state], [5, None, 5])
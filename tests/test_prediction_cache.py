@@ -0,0 +1,45 @@
+"""
+Prediction caches of model managers, emptied once the weights are loaded or
+trained.
+"""
+import numpy as np
+
+from players.base_classes.model_manager_tf import ModelManagerTF
+
+
+class Model(ModelManagerTF):
+    MODEL_NAME = "Model"
+
+    def format_x(self, state):
+        return np.zeros(3, dtype=np.float32)
+
+    def predict(self, x):
+        return np.zeros((len(x), 20), dtype=np.float32)
+
+    def train(self, observations, actions, wins):
+        self.trained = True
+
+
+class SubModel(Model):
+    pass
+
+
+def test_load_and_train_are_wrapped_once():
+    for cls in (Model, SubModel):
+        assert cls.train._invalidates_predictions
+        assert cls.load._invalidates_predictions
+        # The wrapped method is the one defined, not a wrapper
+        assert not hasattr(cls.train.__wrapped__, "_invalidates_predictions")
+        assert not hasattr(cls.load.__wrapped__, "_invalidates_predictions")
+    assert SubModel.train is Model.train
+    assert SubModel.load is Model.load
+
+
+def test_training_empties_the_cache():
+    model = SubModel()
+    key = model.prediction_cache.key(np.zeros(3, dtype=np.float32))
+    model.prediction_cache.put(key, np.ones(20))
+    assert model.prediction_cache.get(key) is not None
+    model.train([], [], {})
+    assert model.trained
+    assert model.prediction_cache.get(key) is None
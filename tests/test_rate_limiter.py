@@ -0,0 +1,75 @@
+"""
+TokenBucket serving waiting messages by priority, then in order of arrival, as
+its tokens are refilled.
+"""
+import asyncio
+
+from players.base_classes import rate_limiter
+from players.base_classes.rate_limiter import TokenBucket
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_tokens_refill_up_to_the_burst(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(rate=2, burst=3)
+    bucket._tokens = 0
+    now[0] += 1
+    bucket._refill()
+    assert bucket._tokens == 2
+    now[0] += 10
+    bucket._refill()
+    assert bucket._tokens == 3
+
+
+def test_waiting_messages_are_served_by_priority_then_arrival():
+    bucket = TokenBucket(rate=200, burst=1)
+    served = []
+
+    async def send(label, priority):
+        await bucket.acquire(priority=priority, label=label)
+        served.append(label)
+
+    async def scenario():
+        # The burst is spent, the others wait for refills
+        await send("first", 1)
+        await asyncio.gather(
+            send("leave", 2),
+            send("choose", 0),
+            send("challenge", 2),
+            send("accept", 1),
+            send("move", 0),
+        )
+
+    run(scenario())
+    assert served == ["first", "choose", "move", "accept", "leave", "challenge"]
+    assert bucket.stats["sent"] == {label: 1 for label in served}
+    assert sum(bucket.stats["delayed"].values()) == 5
+
+
+def test_waiting_messages_are_delayed_by_the_rate():
+    bucket = TokenBucket(rate=20, burst=2)
+
+    async def scenario():
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        for _ in range(4):
+            await bucket.acquire()
+        return loop.time() - start
+
+    # The burst goes at once, the next two tokens take 1/20s each
+    assert 0.09 <= run(scenario()) < 0.5
+    assert bucket.stats["delayed"] == {"": 2}
+
+
+def test_messages_larger_than_the_burst_are_sent():
+    bucket = TokenBucket(rate=100, burst=2)
+    run(asyncio.wait_for(bucket.acquire(tokens=5), 1))
+    assert bucket._tokens < 1
@@ -0,0 +1,68 @@
+"""
+Requests parsed by Battle.parse_request without being decoded when only their
+rqid or wait flag matter.
+"""
+import json
+
+from environment.battle import Battle
+from environment.request import Request
+
+
+SIDE = {
+    "name": "bench",
+    "id": "p1",
+    "pokemon": [
+        {"ident": "p1: Pikachu", "details": "Pikachu, L80, M", "condition": "200/200", "active": True},
+        {"ident": "p1: Snorlax", "details": "Snorlax, L80, M", "condition": "300/300", "active": False},
+    ],
+}
+
+
+def move_request(rqid):
+    return json.dumps({
+        "active": [{"moves": [{"move": "Thunderbolt", "id": "thunderbolt", "pp": 15, "disabled": False}]}],
+        "side": SIDE,
+        "rqid": rqid,
+    })
+
+
+def make_battle():
+    battle = Battle("battle-gen7randombattle-1", "bench")
+    battle.player_is_p1()
+    return battle
+
+
+def test_request_is_decoded_once_and_ready():
+    battle = make_battle()
+    request = Request(move_request(1))
+    battle.parse_request(request)
+    assert request._data is not None
+    assert battle.is_ready
+    assert battle.legal_actions.commands() == ["/choose move 1", "/choose switch 2"]
+
+
+def test_wait_request_is_not_decoded():
+    battle = make_battle()
+    battle.parse_request(Request(move_request(1)))
+    request = Request(json.dumps({"wait": True, "side": SIDE, "rqid": 2}))
+    battle.parse_request(request)
+    assert request._data is None
+    assert battle.wait
+    assert not battle.legal_actions
+    assert battle.not_ready_reason == "waiting for opponent"
+
+
+def test_request_sent_again_is_not_decoded_and_answered_again():
+    battle = make_battle()
+    battle.parse_request(Request(move_request(1)))
+    battle.decision_sent()
+    assert not battle.is_ready
+
+    request = Request(move_request(1))
+    battle.parse_request(request)
+    assert request._data is None
+    assert battle.is_ready
+
+    request = Request(move_request(2))
+    battle.parse_request(request)
+    assert request._data is not None
@@ -0,0 +1,90 @@
+"""
+Battles stalling against the mock server: a lost choice is requested again by
+leaving and joining the room, battles waiting for the opponent are kept, and
+those where the player never decides are forfeited.
+"""
+import asyncio
+
+from benchmark_battles_per_minute import ThinkingPlayer, run_battles
+from showdown_mock import MockShowdownServer
+
+
+class QuickPlayer(ThinkingPlayer):
+    BATTLE_INACTIVITY_TIMEOUT = 0.3
+    BATTLE_FORFEIT_TIMEOUT = 0.3
+
+
+class ForgetfulPlayer(QuickPlayer):
+    """
+    Player whose first choice never reaches the server.
+    """
+
+    forgot = False
+
+    async def select_move(self, battle, *, trapped=False):
+        if not self.forgot:
+            self.forgot = True
+            return None
+        return await super().select_move(battle, trapped=trapped)
+
+
+class IdlePlayer(QuickPlayer):
+    """
+    Player never taking its decisions.
+    """
+
+    def schedule_decision(self, battle, *, trapped=False):
+        pass
+
+
+def play(challenger_class, receiver_class, think=0.0, battles=1):
+    challengers, receivers = [], []
+
+    def factory(players, player_class):
+        def make(**kwargs):
+            players.append(player_class(**kwargs))
+            players[-1].think = think
+            return players[-1]
+
+        return make
+
+    async def scenario():
+        async with MockShowdownServer(port=0, max_turns=3, seed=0) as server:
+            await run_battles(
+                server,
+                battles,
+                1,
+                player_factory=factory(challengers, challenger_class),
+                receiver_factory=factory(receivers, receiver_class),
+            )
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(asyncio.wait_for(scenario(), 10))
+    finally:
+        for task in asyncio.all_tasks(loop):
+            task.cancel()
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
+    return challengers[0], receivers[0]
+
+
+def test_lost_choice_is_requested_again():
+    challenger, receiver = play(ForgetfulPlayer, QuickPlayer)
+    assert challenger.forgot
+    assert challenger.total_battles == receiver.total_battles == 1
+    assert not challenger.reaped_battles
+    assert not receiver.reaped_battles
+
+
+def test_battle_waiting_for_a_slow_opponent_is_kept():
+    challenger, receiver = play(QuickPlayer, ThinkingPlayer, think=1.0)
+    assert challenger.total_battles == 1
+    assert not challenger.reaped_battles
+
+
+def test_battle_the_player_never_decides_in_is_forfeited():
+    challenger, receiver = play(IdlePlayer, QuickPlayer)
+    assert challenger.total_battles == 1
+    assert sum(challenger.reaped_battles.values()) == 1
+    assert not receiver.reaped_battles